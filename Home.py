@@ -1,5 +1,15 @@
+import time
+
 import streamlit as st
-import pandas as pd
+
+from ctar.append import RECORD_KEYS, append_uploaded_file
+from ctar.corrections import audit_summary, unparsed_dates
+from ctar.harmonized import NATIONAL_FILE, national_dataset
+from ctar.ingestion import Dataset, cached_dataset, detect_source, load_uploaded_file
+from ctar.preparation import DATE_COLUMNS
+from ctar.rendering import page_profile, profile_panel
+from ctar.store import STORE_LISTING, get_dataset_store
+from ctar.streaming import StreamedDataset, load_streamed_upload
 
 st.set_page_config(
     page_title="CTAR Analysis",
@@ -41,27 +51,125 @@ st.title("Bienvenue sur CTAR Indicateurs")
 st.markdown("<br>", unsafe_allow_html=True)
 st.markdown("###### Une application d'analyse des indicateurs de performance des CTAR de Madagascar, à l'initiative de l'Institut Pasteur de Madagascar.")
 
+# Mesure des temps de la page (lecture des fichiers...), option de la barre latérale
+profile = page_profile("Accueil")
+
+
+def stored_label(meta):
+    created = time.strftime('%d/%m/%Y %H:%M', time.localtime(meta['created']))
+    mode = ", mode flux" if meta['kind'] == 'aggregates' else ""
+    return f"{meta['name']} ({meta['rows']} lignes{mode}, {created})"
+
 
 def main():
     st.markdown("<h3 style='text-align: left; margin-top: 20px;'>1. Téléchargez vos fichiers :</h3>", unsafe_allow_html=True)
 
     uploaded_files = st.file_uploader("Sélectionnez les fichiers CSV", type=["csv"], accept_multiple_files=True)
 
-    if uploaded_files:
-        dataframes = {}
+    # Fichiers déjà préparés (session précédente ou avant un redémarrage) : rouverts sans nouveau téléchargement,
+    # seulement si la liste est explicitement activée (CTAR_STORE_LISTING=1, serveur à un seul utilisateur)
+    store = get_dataset_store() if STORE_LISTING else None
+    stored = {meta['fingerprint']: meta for meta in store.entries()} if store is not None else {}
+    reopened = []
+    if stored:
+        reopened = st.multiselect(
+            "Ou rouvrez des fichiers déjà analysés",
+            options=list(stored),
+            format_func=lambda fingerprint: stored_label(stored[fingerprint]))
+
+    # Les exports périphériques volumineux peuvent être lus par blocs : seuls les agrégats sont gardés
+    streamed = st.checkbox("Mode flux pour les fichiers périphériques (gros volumes, analyses agrégées uniquement)")
+
+    if uploaded_files or reopened:
+        datasets = {}
+
+        for fingerprint in reopened:
+            dataset = cached_dataset(fingerprint)
+            if dataset is None:
+                st.error(f"Le fichier {stored[fingerprint]['name']} n'est plus disponible, veuillez le télécharger à nouveau.")
+                continue
+            datasets[dataset.name] = dataset
 
-        for uploaded_file in uploaded_files:
+        for uploaded_file in uploaded_files or []:
             try:
-                df = pd.read_csv(uploaded_file, encoding='ISO-8859-1', sep=',')
-                dataframes[uploaded_file.name] = df
+                if streamed and detect_source(uploaded_file.name) == 'peripherique':
+                    datasets[uploaded_file.name] = load_streamed_upload(uploaded_file)
+                else:
+                    # Lecture mise en cache : un fichier déjà chargé n'est pas relu
+                    datasets[uploaded_file.name] = load_uploaded_file(uploaded_file)
             except UnicodeDecodeError as e:
                 st.error(f"Erreur de décodage pour le fichier {uploaded_file.name}: {e}")
                 continue
 
-        st.session_state['dataframes'] = dataframes
-
-        st.header(f"Contenu du fichier: {list(dataframes.keys())[0]}")
-        st.dataframe(df.head())
+        # Mode ajout : les nouveaux enregistrements complètent un fichier déjà chargé sans relire l'historique
+        appendable = [name for name, dataset in datasets.items()
+                      if not isinstance(dataset, StreamedDataset) and dataset.source in RECORD_KEYS]
+        if appendable:
+            with st.expander("Ajouter de nouveaux enregistrements"):
+                target = st.selectbox("Fichier à compléter", options=appendable)
+                delta_files = st.file_uploader("Sélectionnez les fichiers CSV des nouveaux enregistrements", type=["csv"],
+                                               accept_multiple_files=True, key='delta_files')
+                for delta_file in delta_files or []:
+                    try:
+                        datasets[target], added = append_uploaded_file(datasets[target], delta_file)
+                    except (UnicodeDecodeError, ValueError) as e:
+                        st.error(f"Erreur lors de l'ajout du fichier {delta_file.name}: {e}")
+                        continue
+                    st.success(f"{delta_file.name} : {added} nouvelle(s) ligne(s) ajoutée(s) à {target} "
+                               f"({len(datasets[target].frame)} lignes au total).")
+
+        # Dates renseignées dans un autre format que celui attendu pour l'export (ex. JJ/MM/AAAA au lieu de AAAA-MM-JJ)
+        for name, dataset in datasets.items():
+            if not isinstance(dataset, Dataset):
+                continue
+            unparsed = unparsed_dates(dataset.corrections)
+            if unparsed:
+                column, date_format = DATE_COLUMNS[dataset.source]
+                st.warning(f"{name} : {unparsed} valeur(s) de {column} illisible(s) au format {date_format} "
+                           f"({unparsed / len(dataset.frame):.1%} des lignes). Ces dates sont considérées comme manquantes "
+                           "(année, mois, saison) ; détail dans « Corrections appliquées aux fichiers ».")
+
+        # Données nationales : patients IPM et périphériques réunis dans le schéma harmonisé, analysés d'un seul tenant
+        exports = {dataset.source: dataset for dataset in datasets.values() if isinstance(dataset, Dataset)}
+        if 'ipm' in exports and 'peripherique' in exports:
+            datasets[NATIONAL_FILE] = national_dataset(exports['ipm'], exports['peripherique'])
+
+        # La session ne garde que des références vers les jeux de données partagés (jamais de copie des lignes)
+        st.session_state['datasets'] = datasets
+
+        if datasets:
+            first_name = list(datasets.keys())[0]
+            st.header(f"Contenu du fichier: {first_name}")
+            first = datasets[first_name]
+            if isinstance(first, StreamedDataset):
+                st.info(f"{first.nrows} lignes lues en mode flux ({len(first.ctars)} CTARs, années {first.years[0]} à {first.years[-1]}).")
+            else:
+                st.dataframe(first.frame.head())
+
+        # Mémoire gagnée par le typage explicite des colonnes
+        with st.expander("Optimisation mémoire des fichiers"):
+            st.caption("Mémoire par colonne et conversions de type proposées : page « Mémoire des fichiers ».")
+            for name, dataset in datasets.items():
+                if isinstance(dataset, StreamedDataset):
+                    continue
+                report = dataset.schema_report
+                if report.empty:
+                    continue
+                saved = report['Octets gagnés'].sum() / 1024 ** 2
+                st.markdown(f"**{name}** : {saved:.1f} Mo économisés ({dataset.nbytes / 1024 ** 2:.1f} Mo en mémoire)")
+                st.dataframe(report, hide_index=True)
+
+        # Valeurs corrigées à la lecture par les règles de ctar.corrections
+        with st.expander("Corrections appliquées aux fichiers"):
+            for name, dataset in datasets.items():
+                if isinstance(dataset, StreamedDataset):
+                    continue
+                audit = dataset.corrections
+                if audit.empty:
+                    continue
+                st.markdown(f"**{name}** : {len(audit)} valeurs corrigées")
+                st.dataframe(audit_summary(audit), hide_index=True)
+                st.dataframe(audit, hide_index=True)
 
 
     else:
@@ -78,3 +186,6 @@ st.write("IPM © 2024")
 
 with st.sidebar.container():
     st.image("Logo-CORAMAD.jpg", use_column_width=True, width=250, caption="FSPI Rage")
+
+# Temps des étapes de la page
+profile_panel(profile)
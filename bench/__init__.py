@@ -0,0 +1 @@
+# Mesures de performance des pages sur des données synthétiques (voir bench/run.py).
@@ -0,0 +1,262 @@
+import argparse
+import dataclasses
+import glob
+import json
+import logging
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# La lecture des CSV est mesurée sans le stockage sur disque, mesuré à part (mode 'disque')
+os.environ['CTAR_STORE_DIR'] = ''
+
+import numpy as np
+import pandas as pd
+from streamlit.testing.v1 import AppTest
+
+from bench.synthetic import IPM_FILE, PERIPHERIQUE_FILE, SEED, SIZES, synthetic_files
+from ctar import store as disk_store
+from ctar.filters import ENGINES
+from ctar.ingestion import Dataset, get_dataset_cache, load_bytes
+from ctar.rendering import get_figure_cache
+from ctar.sql_engine import duckdb_available
+from ctar.streaming import load_streamed_path
+
+
+# Les avertissements de Streamlit exécuté hors serveur ne concernent pas les mesures
+logging.disable(logging.WARNING)
+
+# Pages mesurées (toutes les pages patients par défaut)
+PAGES = sorted(glob.glob(os.path.join(ROOT, 'pages', 'PATIENT-*.py')))
+
+# Mode flux : jeu périphérique lu par blocs (ctar.streaming), mesuré comme un moteur de plus
+FLUX = 'flux'
+
+# Une exécution de page ne doit pas dépasser ce délai (en secondes)
+PAGE_TIMEOUT = 900
+
+
+def measure(function, trace_memory=False):
+    # (résultat, durée en secondes, pic de mémoire Python en Mo ou None)
+    if trace_memory:
+        tracemalloc.start()
+    start = time.perf_counter()
+    try:
+        result = function()
+        elapsed = time.perf_counter() - start
+        peak = None
+        if trace_memory:
+            peak = tracemalloc.get_traced_memory()[1] / 1024 ** 2
+    finally:
+        if trace_memory:
+            tracemalloc.stop()
+    return result, elapsed, peak
+
+
+def measure_load(load, trace_memory):
+    # Lecture à froid (cache partagé vidé) ; le pic mémoire est mesuré sur une seconde lecture
+    get_dataset_cache().clear()
+    dataset, elapsed, _ = measure(load)
+    peak = None
+    if trace_memory:
+        get_dataset_cache().clear()
+        _, _, peak = measure(load, trace_memory=True)
+    get_dataset_cache().clear()
+    return dataset, elapsed, peak
+
+
+def measure_reopen(dataset, store):
+    # Réouverture d'un jeu déjà préparé (ctar.store), comme après un redémarrage du serveur
+    store.save(dataset)
+    _, elapsed, _ = measure(lambda: store.load(dataset.fingerprint, Dataset))
+    return {'mode': 'disque', 'seconds': elapsed, 'peak_mb': None}
+
+
+def load_datasets(files, trace_memory, store=None):
+    # Lecture des exports comme dans Home.py (et en mode flux pour le fichier périphérique)
+    datasets, results = {}, []
+    for name, path in files.items():
+        with open(path, 'rb') as f:
+            data = f.read()
+        dataset, elapsed, peak = measure_load(lambda: load_bytes(name, data), trace_memory)
+        datasets[name] = dataset
+        result = {'file': name, 'mode': 'memoire', 'rows': len(dataset.frame), 'seconds': elapsed,
+                  'peak_mb': peak, 'dataset_mb': dataset.nbytes / 1024 ** 2}
+        results.append(result)
+        if store is not None:
+            results.append({**result, **measure_reopen(dataset, store)})
+
+        if name == PERIPHERIQUE_FILE:
+            streamed, elapsed, peak = measure_load(lambda: load_streamed_path(path), trace_memory)
+            datasets[FLUX] = streamed
+            result = {'file': name, 'mode': FLUX, 'rows': streamed.nrows, 'seconds': elapsed,
+                      'peak_mb': peak, 'dataset_mb': streamed.nbytes / 1024 ** 2}
+            results.append(result)
+            if store is not None:
+                results.append({**result, **measure_reopen(streamed, store), 'mode': 'disque flux'})
+    return datasets, results
+
+
+class PageRun:
+    # Une page pilotée sans navigateur (AppTest) jusqu'à l'affichage de ses graphiques
+
+    def __init__(self, page, file_name, engine, datasets):
+        self.page = page
+        self.file_name = file_name
+        self.engine = engine
+        self.datasets = datasets
+
+    def session_datasets(self):
+        # Copie sans structures dérivées (index, cube, moteur SQL) : chaque mesure part à froid
+        if self.engine == FLUX:
+            return {self.file_name: self.datasets[FLUX]}
+        return {name: dataclasses.replace(dataset) for name, dataset in self.datasets.items() if name != FLUX}
+
+    def set_datasets(self, at):
+        datasets = self.session_datasets()
+        at.session_state['datasets'] = datasets
+        return datasets
+
+    def prepare(self):
+        # Sélection du fichier, du moteur, de tous les CTARs et de toutes les années, puis jeux remis à froid ;
+        # renvoie None si la page ne propose pas ce moteur pour ce fichier
+        if self.engine == FLUX and self.file_name != PERIPHERIQUE_FILE:
+            return None
+        at = AppTest.from_file(self.page, default_timeout=PAGE_TIMEOUT)
+        datasets = self.set_datasets(at)
+        at.run()
+        at.selectbox[0].select(self.file_name).run()
+
+        if self.engine not in ('pandas', FLUX):
+            radios = [radio for radio in at.sidebar.radio if radio.label == "Moteur de calcul"]
+            if not radios or self.engine not in radios[0].options:
+                return None
+            radios[0].set_value(self.engine).run()
+
+        if self.file_name == PERIPHERIQUE_FILE and at.checkbox:
+            at.checkbox[0].check().run()
+        for multiselect in at.multiselect:
+            if 'année' in multiselect.label:
+                multiselect.set_value(self._years(datasets[self.file_name])).run()
+
+        self.set_datasets(at)
+        return at
+
+    @staticmethod
+    def _years(dataset):
+        if hasattr(dataset, 'years'):
+            return dataset.years
+        return sorted(int(year) for year in pd.unique(dataset.frame['Annee'].dropna()))
+
+
+def frame_signature(datasets):
+    # Lignes, colonnes et types des DataFrames partagés : une page ne doit jamais les modifier en place
+    return {name: (len(dataset.frame), list(dataset.frame.dtypes.astype(str).items()))
+            for name, dataset in datasets.items() if hasattr(dataset, 'frame')}
+
+
+def figure_stats(at):
+    charts = at.get('plotly_chart')
+    return len(charts), sum(len(chart.proto.spec) for chart in charts)
+
+
+def run_page(page, file_name, engine, datasets, trace_memory):
+    # Temps à froid (structures dérivées et graphiques construits), à chaud (même sélection, graphiques
+    # gardés par ctar.rendering) et pic mémoire
+    run = PageRun(page, file_name, engine, datasets)
+    at = run.prepare()
+    if at is None:
+        return None
+
+    result = {'page': os.path.basename(page)[:-3], 'file': file_name, 'engine': engine}
+    signature = frame_signature(datasets)
+    get_figure_cache().clear()
+    _, result['seconds_cold'], _ = measure(at.run)
+    _, result['seconds_warm'], _ = measure(at.run)
+    result['figures'], result['figure_bytes'] = figure_stats(at)
+    result['errors'] = [exception.value for exception in at.exception]
+    if frame_signature(datasets) != signature:
+        result['errors'].append("La page a modifié un jeu de données partagé")
+
+    result['peak_mb'] = None
+    if trace_memory:
+        run.set_datasets(at)
+        get_figure_cache().clear()
+        _, _, result['peak_mb'] = measure(at.run, trace_memory=True)
+    return result
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Mesure les pages sur des données synthétiques.")
+    parser.add_argument('--sizes', type=int, nargs='+', default=SIZES, help="nombres de patients")
+    parser.add_argument('--engines', nargs='+', default=ENGINES + [FLUX])
+    parser.add_argument('--pages', nargs='+', default=None, help="extraits du nom des pages à mesurer")
+    parser.add_argument('--seed', type=int, default=SEED)
+    parser.add_argument('--data-dir', default=os.path.join(ROOT, 'bench', 'data'))
+    parser.add_argument('--output', default=os.path.join(ROOT, 'bench', 'results.json'))
+    parser.add_argument('--no-memory', action='store_true', help="ne pas mesurer le pic mémoire (tracemalloc)")
+    args = parser.parse_args(argv)
+
+    engines = [engine for engine in args.engines if engine != 'duckdb' or duckdb_available()]
+    pages = [page for page in PAGES if not args.pages or any(part in page for part in args.pages)]
+    trace_memory = not args.no_memory
+
+    store = None
+    if disk_store.pyarrow is not None:
+        store = disk_store.DatasetStore(os.path.join(args.data_dir, 'store'), float('inf'), float('inf'))
+
+    output = {
+        'meta': {
+            'date': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'revision': git_revision(),
+            'python': platform.python_version(),
+            'pandas': pd.__version__,
+            'numpy': np.__version__,
+            'machine': platform.platform(),
+            'seed': args.seed,
+        },
+        'ingestion': [],
+        'pages': [],
+    }
+
+    for size in args.sizes:
+        files = synthetic_files(size, args.data_dir, args.seed)
+        datasets, results = load_datasets(files, trace_memory, store)
+        for result in results:
+            output['ingestion'].append({'size': size, **result})
+            print(f"{size:>9} {'Lecture':22s} {result['file'][5:9]:4s} {result['mode']:11s} {result['seconds']:8.3f}s", flush=True)
+
+        for page in pages:
+            for file_name in (IPM_FILE, PERIPHERIQUE_FILE):
+                for engine in engines:
+                    result = run_page(page, file_name, engine, datasets, trace_memory)
+                    if result is None:
+                        continue
+                    output['pages'].append({'size': size, **result})
+                    print(f"{size:>9} {result['page'][8:30]:22s} {file_name[5:9]:4s} {engine:7s} "
+                          f"{result['seconds_cold']:8.2f}s {result['seconds_warm']:8.2f}s"
+                          f"{' ERREUR' if result['errors'] else ''}", flush=True)
+
+    output['meta']['max_rss_mb'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    with open(args.output, 'w') as f:
+        json.dump(output, f, indent=1)
+    print(f"Résultats : {args.output}")
+
+
+if __name__ == '__main__':
+    main()
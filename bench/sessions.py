@@ -0,0 +1,73 @@
+import argparse
+import gc
+import logging
+import os
+import sys
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# Les jeux de données sont lus depuis les CSV, pas depuis le stockage sur disque
+os.environ['CTAR_STORE_DIR'] = ''
+
+from streamlit.testing.v1 import AppTest
+
+from bench.run import PAGE_TIMEOUT, PAGES
+from bench.synthetic import PERIPHERIQUE_FILE, SEED, synthetic_files
+from ctar.ingestion import load_bytes
+
+
+# Mémoire gardée par des sessions simultanées : chaque session ne doit tenir que des références
+# vers les jeux de données partagés (et l'état de ses filtres), jamais une copie des lignes.
+
+logging.disable(logging.WARNING)
+
+SESSIONS = [2, 10, 30]
+
+
+def open_session(page, datasets):
+    # Une session qui a chargé les fichiers et affiché la page pour tous les CTARs
+    at = AppTest.from_file(page, default_timeout=PAGE_TIMEOUT)
+    at.session_state['datasets'] = dict(datasets)
+    at.run()
+    at.selectbox[0].select(PERIPHERIQUE_FILE).run()
+    if at.checkbox:
+        at.checkbox[0].check().run()
+    return at
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Mesure la mémoire gardée par des sessions simultanées.")
+    parser.add_argument('--size', type=int, default=150_000, help="nombre de patients")
+    parser.add_argument('--sessions', type=int, nargs='+', default=SESSIONS)
+    parser.add_argument('--page', default='Lésion', help="extrait du nom de la page ouverte par chaque session")
+    parser.add_argument('--seed', type=int, default=SEED)
+    parser.add_argument('--data-dir', default=os.path.join(ROOT, 'bench', 'data'))
+    args = parser.parse_args(argv)
+
+    page = next(page for page in PAGES if args.page in page)
+    datasets = {}
+    for name, path in synthetic_files(args.size, args.data_dir, args.seed).items():
+        with open(path, 'rb') as f:
+            datasets[name] = load_bytes(name, f.read())
+    shared = sum(dataset.nbytes for dataset in datasets.values()) / 1024 ** 2
+    print(f"Jeux de données partagés : {shared:.1f} Mo")
+
+    # Structures dérivées (index, cube...) construites une fois, hors mesure
+    open_session(page, datasets)
+
+    tracemalloc.start()
+    sessions = []
+    for count in sorted(args.sessions):
+        while len(sessions) < count:
+            sessions.append(open_session(page, datasets))
+        gc.collect()
+        current, _ = tracemalloc.get_traced_memory()
+        print(f"{count:>4} sessions : {current / 1024 ** 2:8.1f} Mo gardés ({current / 1024 ** 2 / count:.2f} Mo par session)",
+              flush=True)
+    tracemalloc.stop()
+
+
+if __name__ == '__main__':
+    main()
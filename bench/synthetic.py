@@ -0,0 +1,127 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from ctar.geography import CTAR_LOCATIONS
+from ctar.schema import IPM_CONTACT_COLUMNS, IPM_LESION_COLUMNS, PERIPHERIQUE_BODY_PART_COLUMNS, PERIPHERIQUE_CONTACT_COLUMNS
+
+
+# Noms attendus par les pages pour chaque export
+IPM_FILE = "CTAR_ipmdata20022024_cleaned.csv"
+PERIPHERIQUE_FILE = "CTAR_peripheriquedata20022024_cleaned.csv"
+COMMANDES_FILE = "CTAR_commandes20022024.csv"
+
+# Tailles de référence (nombre de patients)
+SIZES = [15_000, 150_000, 1_500_000]
+
+SEED = 2024
+
+N_CTARS = 31
+
+# Villes des CTAR périphériques (Antananarivo : CTAR de l'IPM)
+CTAR_TOWNS = [town for town in CTAR_LOCATIONS if town != 'Antananarivo'][:N_CTARS]
+
+
+def _dates(rng, n, start, days):
+    return pd.Timestamp(start) + pd.to_timedelta(rng.integers(0, days, n), unit='D')
+
+
+def _choice(rng, values, n, p=None, missing=0.0):
+    # Tirage de valeurs catégorielles, avec une part de valeurs manquantes
+    values = np.asarray(values, dtype=object)
+    drawn = values[rng.choice(len(values), n, p=p)]
+    if missing:
+        drawn[rng.random(n) < missing] = None
+    return drawn
+
+
+def ipm_frame(n_patients, seed=SEED):
+    # Export IPM (MS Access) : un patient peut revenir plusieurs fois (même ref_mordu)
+    rng = np.random.default_rng(seed)
+    n = int(n_patients * 1.1)
+    dates = _dates(rng, n, '2002-01-01', 8000)
+
+    frame = pd.DataFrame({
+        'ref_mordu': rng.integers(0, n_patients, n),
+        'dat_consu': dates.strftime('%d/%m/%Y'),
+        'Annee': dates.year,
+        'mois': dates.month,
+        'age': np.where(rng.random(n) < 0.02, np.nan, rng.integers(0, 95, n)),
+        'sexe': _choice(rng, ['M', 'F'], n, missing=0.01),
+        'animal': _choice(rng, ['Chien', 'Chat', 'Rat', 'Singe', 'Lemurien'], n, p=[.7, .15, .08, .04, .03]),
+        'typanim': _choice(rng, list('ABCDEFG'), n, missing=0.05),
+        'savon': _choice(rng, ['OUI', 'NON'], n, missing=0.05),
+    })
+    for column in IPM_CONTACT_COLUMNS:
+        frame[column] = _choice(rng, ['LPS', 'MT', 'GS'], n, p=[.2, .6, .2], missing=0.5)
+    for column in IPM_LESION_COLUMNS:
+        frame[column] = np.where(rng.random(n) < 0.5, np.nan, rng.integers(0, 5, n))
+    return frame
+
+
+def peripherique_frame(n_patients, seed=SEED):
+    # Export RedCap des CTAR périphériques : un enregistrement par patient
+    rng = np.random.default_rng(seed + 1)
+    n = n_patients
+    dates = _dates(rng, n, '2015-01-01', 3650)
+
+    id_ctar = rng.integers(1, N_CTARS + 1, n).astype(float)
+    id_ctar[rng.random(n) < 0.01] = np.nan
+    hours = pd.Series(rng.integers(0, 24, n)).astype(str).str.zfill(2)
+    minutes = pd.Series(_choice(rng, ['00', '15', '30', '45'], n))
+
+    frame = pd.DataFrame({
+        'record_id': np.arange(n),
+        'id_ctar': id_ctar,
+        'ctar': pd.Series(id_ctar).map(lambda i: CTAR_TOWNS[int(i) - 1] if i == i else None),
+        'date_de_consultation': np.where(rng.random(n) < 0.01, None, dates.strftime('%Y-%m-%d')),
+        'age': rng.integers(0, 95, n),
+        'sexe': _choice(rng, ['M', 'F'], n),
+        'espece': _choice(rng, ['Chien', 'Chat', 'Autre'], n, p=[.75, .15, .1], missing=0.05),
+        'dev_carac': _choice(rng, ['Errant-Vivant', 'Domestique-Vivant', 'Domestique-Mort', 'Errant-Mort', 'nan-nan', 'Errant-nan'], n),
+        'heure_du_contact_cleaned': (hours + ':' + minutes).to_numpy(),
+        'lavage_savon': _choice(rng, ['OUI', 'NON', '0', 'Non rempli'], n),
+        'nb_lesion': _choice(rng, ['1', '2', '3', '01', '02', '4', '5', '10'], n, missing=0.1),
+    })
+    for column in PERIPHERIQUE_BODY_PART_COLUMNS:
+        frame[column] = rng.choice([0, 1], n, p=[.8, .2])
+    for column in PERIPHERIQUE_CONTACT_COLUMNS:
+        frame[column] = rng.choice([0, 1], n, p=[.7, .3])
+    return frame
+
+
+def commandes_frame(n_patients, seed=SEED):
+    # Commandes de vaccin des CTAR périphériques, sur la même période que leurs patients :
+    # environ une commande tous les deux mois par CTAR, de l'ordre de 3 doses par patient
+    rng = np.random.default_rng(seed + 2)
+    months = pd.date_range('2015-01-01', periods=120, freq='MS')
+    n = int(N_CTARS * len(months) * 0.5)
+    patients_per_month = n_patients / (N_CTARS * len(months))
+
+    dates = months[rng.integers(0, len(months), n)] + pd.to_timedelta(rng.integers(0, 28, n), unit='D')
+    return pd.DataFrame({
+        'record_id': np.arange(n),
+        'id_ctar': rng.integers(1, N_CTARS + 1, n),
+        'date_commande': dates.strftime('%Y-%m-%d'),
+        'nb_doses': rng.poisson(6 * patients_per_month + 1, n),
+    })
+
+
+def write_csv(frame, path):
+    frame.to_csv(path, index=False, encoding='ISO-8859-1')
+    return path
+
+
+def synthetic_files(n_patients, data_dir, seed=SEED):
+    # Fichiers CSV déterministes (taille, graine) ; réutilisés s'ils existent déjà
+    # (un dossier par taille et graine : les fichiers gardent le nom attendu par l'application)
+    directory = os.path.join(data_dir, f'{n_patients}-{seed}')
+    os.makedirs(directory, exist_ok=True)
+    files = {}
+    for name, build in [(IPM_FILE, ipm_frame), (PERIPHERIQUE_FILE, peripherique_frame), (COMMANDES_FILE, commandes_frame)]:
+        path = os.path.join(directory, name)
+        if not os.path.exists(path):
+            write_csv(build(n_patients, seed), path)
+        files[name] = path
+    return files
@@ -0,0 +1 @@
+# Bibliothèque partagée par l'application Streamlit (Home.py et pages/).
@@ -0,0 +1,282 @@
+import pandas as pd
+
+from ctar.cube import count_table
+from ctar.exposures import exposure_counts, exposures_of
+from ctar.preparation import AGE_LABELS, age_groups
+from ctar.views import AggregateView
+
+
+# Calculs des indicateurs des pages, sans Streamlit : chaque fonction reçoit les lignes sélectionnées
+# (DataFrame) ou une vue agrégée (ctar.views.AggregateView) et renvoie de petites tables,
+# que les fonctions de ctar.figures transforment en graphiques.
+
+# L'âge des patients ne peut pas être au dessus de 120ans
+MAX_AGE = 120
+
+# Correspondance typanim (BDD IPM) -> libellé de la légende
+IPM_ANIMAL_TYPES = {
+    'A': 'Sauvage',
+    'B': 'Errant disparu',
+    'C': 'Errant vivant',
+    'D': 'Domestique Propriétaire Connu',
+    'E': 'Domestique Disparu',
+    'F': 'Domestique Abbatu',
+    'G': 'Domestique Mort',
+}
+
+# Libellés de la page 'Animal mordant' (casse différente de IPM_ANIMAL_TYPES)
+IPM_LIFESTYLES = {
+    'A': 'Sauvage',
+    'B': 'Errant disparu',
+    'C': 'Errant vivant',
+    'D': 'Domestique propriétaire connu',
+    'E': 'Domestique disparu',
+    'F': 'Domestique abbatu',
+    'G': 'Domestique mort',
+}
+
+# Mode de vie périphérique ('dev_carac') incomplet
+UNKNOWN_LIFESTYLE_PATTERN = 'nan-nan|nan-|nan-|-nan'
+
+# Colonnes de nombre de lésions IPM -> libellé de la partie du corps
+IPM_LESION_PARTS = {
+    'nbtet': 'Tête',
+    'nb_sup': 'Bras et avant-bras',
+    'nb_extr_s': 'Main',
+    'nb_inf': 'Cuisse et Jambe',
+    'nb_extr_i': 'Pied',
+    'nb_abdo': 'Abdomen',
+    'nb_dos': 'Dos',
+    'nb_genit': 'Parties génitales',
+}
+
+
+# Colonnes des tables de morsures transdermiques (libellés des graphiques)
+MT_COLUMNS = {'sexe': 'Gender', 'count': 'MT Count'}
+
+# Tranches d'âge de 15 ans des graphiques allégés (tranche de 5 ans -> tranche large)
+BROAD_AGE_LABELS = ['0-14', '15-29', '30-44', '45-59', '60+']
+BROAD_AGE_GROUPS = {label: BROAD_AGE_LABELS[min(i // 3, len(BROAD_AGE_LABELS) - 1)] for i, label in enumerate(AGE_LABELS)}
+
+
+def unique_patients(ipm):
+    # 1 patient = 1 ID ref_mordu
+    return ipm.drop_duplicates(subset=['ref_mordu'])
+
+
+def selection_size(data):
+    # Nombre de lignes sélectionnées
+    if isinstance(data, AggregateView):
+        return data.size()
+    return len(data)
+
+
+def known_lifestyles(table, column):
+    return table[~table[column].astype(str).str.contains(UNKNOWN_LIFESTYLE_PATTERN, regex=True)]
+
+
+def age_sex_counts(data):
+    # (nombre de patients par âge et sexe, nombre de patients)
+    if isinstance(data, AggregateView):
+        counts = data.age_sex_counts()
+        counts = counts[counts['age'] <= MAX_AGE]
+        return counts, counts['count'].sum()
+
+    # Colonne 'age' est de type numerique (sans modifier la vue partagée)
+    data = data.assign(age=pd.to_numeric(data['age'], errors='coerce'))
+    data = data[data['age'] <= MAX_AGE]
+
+    # Compter les pairs (age, sexe) non nulles
+    not_null_pairs = data[['age', 'sexe']].notnull().all(axis=1).sum()
+    counts = data.groupby(['age', 'sexe'], observed=True).size().reset_index(name='count')
+    return counts, not_null_pairs
+
+
+def monthly_sex_counts(data):
+    # Nombre de patients par mois, année et sexe
+    if isinstance(data, AggregateView):
+        return data.monthly_sex_counts()
+    return data.groupby(['mois', 'Annee', 'sexe'], observed=True).size().reset_index(name='count')
+
+
+def hourly_counts(data, column):
+    # (nombre de patients par heure de morsure et valeur de column, nombre de patients dont l'heure est connue)
+    if isinstance(data, AggregateView):
+        return data.counts(['Hour', column]), data.size(notna=['Hour'])
+
+    # 'Hour' est calculée au chargement ; '00:00' (minuit) et les heures invalides sont manquantes
+    data = data.dropna(subset=['Hour'])
+    return data.groupby(['Hour', column], observed=True).size().reset_index(name='count'), len(data)
+
+
+def hour_weekday_counts(data):
+    # (nombre de patients par CTAR, jour de la semaine et heure de morsure, nombre de patients dont l'heure est connue)
+    by = ['id_ctar', 'Weekday', 'Hour']
+    if isinstance(data, AggregateView):
+        counts = data.counts(by)
+    else:
+        counts = count_table(data, by)
+    return counts, int(counts['count'].sum())
+
+
+def lesion_stats(data):
+    # (histogramme de 'nb_lesion', effectif, moyenne, médiane, variance) des patients des CTAR périphériques
+    if isinstance(data, AggregateView):
+        return data.lesion_stats()
+
+    # Valeurs déjà corrigées à la lecture (ctar.corrections) ; les valeurs manquantes sont ignorées
+    lesions = data['nb_lesion'].dropna()
+    value_counts = lesions.value_counts().sort_index()
+    return value_counts, int(value_counts.sum()), lesions.mean(), lesions.median(), lesions.var()
+
+
+def ipm_lesion_stats(ipm, stats=('mean', 'median', 'var')):
+    # (statistiques du nombre de lésions par groupe d'âge et partie du corps, nombre de patients) ;
+    # par défaut moyenne, médiane et variance
+    ipm = unique_patients(ipm)
+
+    # Nombres de lésions en flottants (valeurs manquantes ignorées), sans modifier les lignes partagées
+    lesion_columns = list(IPM_LESION_PARTS)
+    lesions = ipm[lesion_columns].astype('float64')
+
+    grouped = lesions.groupby(ipm['Age Group']).agg({col: list(stats) for col in lesion_columns}).reset_index()
+    grouped.columns = ['Age Group'] + [f'{IPM_LESION_PARTS[col]}_{stat}' for col, stat in grouped.columns[1:]]
+
+    # Colonne des categories en type string
+    for col in grouped.select_dtypes(include='category').columns:
+        grouped[col] = grouped[col].astype(str)
+    grouped = grouped.fillna(0)
+    return grouped, len(ipm)
+
+
+def lps_counts(data, dataset):
+    # Nombre d'expositions de catégorie 1 (LPS) par partie du corps et groupe d'âge
+    if isinstance(data, AggregateView):
+        counts = data.body_part_counts('LPS', ['Body Part', 'Age Group'])
+    else:
+        counts = exposure_counts(exposures_of(dataset, data), 'LPS', ['Body Part', 'Age Group'])
+    return counts.rename(columns={'count': 'LPS Count'})
+
+
+def mt_counts(data, dataset):
+    # Morsures transdermiques des CTAR périphériques par partie du corps, sexe et âge
+    if isinstance(data, AggregateView):
+        counts = data.body_part_counts('MT', ['Body Part', 'sexe', 'Age Group'])
+    else:
+        counts = exposure_counts(exposures_of(dataset, data), 'MT', ['Body Part', 'sexe', 'Age Group'])
+    return counts.rename(columns=MT_COLUMNS)
+
+
+def mt_animal_counts(data, dataset):
+    # Idem par type d'animal (mode de vie de l'animal mordeur)
+    if isinstance(data, AggregateView):
+        animal_counts = data.body_part_counts('MT', ['Body Part', 'sexe', 'dev_carac', 'Age Group'])
+        animal_counts = animal_counts.rename(columns={'dev_carac': 'Animal Type'})
+    else:
+        animal_counts = exposure_counts(exposures_of(dataset, data), 'MT', ['Body Part', 'sexe', 'Animal Type', 'Age Group'])
+
+    animal_counts = known_lifestyles(animal_counts, 'Animal Type')
+    return animal_counts.rename(columns=MT_COLUMNS)
+
+
+def ipm_mt_counts(ipm, dataset):
+    # Morsures transdermiques de la BDD IPM, même table que mt_counts
+    exposures = exposures_of(dataset, unique_patients(ipm))
+    return exposure_counts(exposures, 'MT', ['Body Part', 'sexe', 'Age Group']).rename(columns=MT_COLUMNS)
+
+
+def ipm_mt_animal_counts(ipm, dataset):
+    # Idem par type d'animal (IPM_ANIMAL_TYPES)
+    exposures = exposures_of(dataset, unique_patients(ipm))
+    animal_counts = exposure_counts(exposures, 'MT', ['Body Part', 'sexe', 'Animal Type', 'Age Group'])
+    animal_counts['Animal Type'] = animal_counts['Animal Type'].map(IPM_ANIMAL_TYPES)
+    animal_counts = animal_counts.dropna(subset=['Animal Type'])
+    return animal_counts.rename(columns=MT_COLUMNS)
+
+
+def ipm_savon_counts(ipm):
+    # (nombre de patients IPM par âge, sexe et lavage au savon, nombre de patients)
+    ipm = unique_patients(ipm)
+    ipm = ipm.assign(age=pd.to_numeric(ipm['age'], errors='coerce'))
+
+    ipm = ipm.dropna(subset=['age'])
+    ipm = ipm[ipm.age > 0]
+
+    not_null_pairs = ipm[['age', 'sexe', 'savon']].notnull().all(axis=1).sum()
+
+    counts = ipm.groupby(['age', 'sexe', 'savon'], observed=True).size().reset_index(name='count')
+    counts = counts.sort_values(by='age')
+
+    # Part de chaque âge parmi les patients de même sexe et même réponse
+    totals = counts.groupby(['sexe', 'savon'], observed=True)['count'].transform('sum')
+    counts['percentage'] = (counts['count'] / totals * 100).round(2).where(totals != 0, 0)
+    return counts, not_null_pairs
+
+
+def savon_counts(data):
+    # (nombre de patients des CTAR périphériques par âge, sexe et lavage au savon, nombre de patients)
+    if isinstance(data, AggregateView):
+        counts = data.counts(['age', 'sexe', 'lavage_savon'], dropna=False)
+    else:
+        counts = data.groupby(['age', 'sexe', 'lavage_savon'], observed=True, dropna=False).size().reset_index(name='count')
+
+    counts = counts[counts['lavage_savon'] != 'Non rempli']
+    counts = counts.assign(lavage_savon=counts['lavage_savon'].replace('0', 'NON'))
+    counts = counts.dropna(subset=['age'])
+
+    num_patients = counts['count'].sum()
+    counts = counts.groupby(['age', 'sexe', 'lavage_savon'], observed=True)['count'].sum().reset_index()
+    return counts, num_patients
+
+
+def label_counts(table, label_col, count_col):
+    # Effectif de chaque valeur de label_col ; les catégories absentes de la sélection sont ignorées
+    counts = table[label_col].value_counts()
+    counts = counts[counts > 0].reset_index()
+    counts.columns = [label_col, count_col]
+    return counts
+
+
+def ipm_lifestyle_counts(patients, animal):
+    # (répartition du mode de vie des animaux d'une espèce, nombre d'animaux) dans la BDD IPM
+    animals = patients[patients['animal'] == animal]
+    lifestyles = animals['typanim'].map(IPM_LIFESTYLES).to_frame()
+    return label_counts(lifestyles, 'typanim', 'count'), len(animals)
+
+
+def lifestyle_counts(data, animal):
+    # (répartition du mode de vie des animaux d'une espèce, nombre d'animaux) dans la BDD périphérique
+    animals = data[data['espece'] == animal]
+    return label_counts(animals, 'dev_carac', 'count'), len(animals)
+
+
+def species_counts(data, column, species):
+    # (répartition des espèces sélectionnées, nombre d'animaux)
+    animals = data[data[column].isin(species)]
+    return label_counts(animals, column, 'count'), len(animals)
+
+
+def species_options(data, column):
+    # Espèces présentes, de la plus fréquente à la moins fréquente
+    return data[column].value_counts().loc[lambda c: c > 0].index.tolist()
+
+
+def binned_ages(counts, by):
+    # Comptages par âge -> par tranche d'âge de 5 ans ('Age Group'), pour alléger les graphiques
+    counts = counts.assign(**{'Age Group': age_groups(pd.to_numeric(counts['age'], errors='coerce'))})
+    return counts.groupby(['Age Group'] + by, observed=True)['count'].sum().reset_index()
+
+
+def broad_age_groups(counts, count_col):
+    # Tranches de 5 ans -> tranches de 15 ans (BROAD_AGE_LABELS), les autres colonnes étant gardées
+    by = [column for column in counts.columns if column not in ('Age Group', count_col)]
+    broad = pd.Categorical(counts['Age Group'].astype(str).map(BROAD_AGE_GROUPS), categories=BROAD_AGE_LABELS, ordered=True)
+    # Les lignes sont déjà triées par tranche d'âge dans chaque groupe : l'ordre d'apparition est gardé
+    counts = counts.assign(**{'Age Group': broad})
+    return counts.groupby(by + ['Age Group'], observed=True, sort=False)[count_col].sum().reset_index()
+
+
+def recent_years(monthly_counts, n_years):
+    # Comptages mensuels des n_years dernières années seulement
+    years = sorted(monthly_counts['Annee'].dropna().unique())[-n_years:]
+    return monthly_counts[monthly_counts['Annee'].isin(years)]
@@ -0,0 +1,154 @@
+import hashlib
+
+import numpy as np
+import pandas as pd
+
+from ctar.exposures import exposure_table
+from ctar.ingestion import Dataset, cached_dataset, fingerprint_bytes, keep_dataset, read_export
+from ctar.profiling import stage
+
+
+# Mode ajout : un fichier 'delta' (nouveaux mois d'un export déjà chargé) complète le jeu de données
+# sans relire l'historique. Les lignes déjà présentes sont écartées grâce à l'identifiant de l'export,
+# puis les structures dérivées déjà construites (index des filtres, cube, table des expositions)
+# sont mises à jour avec les seules lignes ajoutées.
+
+# Identifiant des enregistrements de chaque export, et s'il ne désigne qu'une ligne
+RECORD_KEYS = {
+    # RedCap : une ligne par enregistrement
+    'peripherique': ('record_id', True),
+    # MS Access : un patient (ref_mordu) peut avoir plusieurs lignes, toutes dans le même export
+    'ipm': ('ref_mordu', False),
+}
+
+
+def key_values(series):
+    # Valeurs comparables d'un fichier à l'autre (un identifiant lu comme 12 ou 12.0 reste le même)
+    if pd.api.types.is_numeric_dtype(series.dtype):
+        return series.to_numpy(dtype='float64', na_value=np.nan)
+    return series.astype(str).to_numpy(dtype=object)
+
+
+def record_keys(frame, column):
+    # Identifiants connus, triés pour une recherche dichotomique
+    return np.sort(pd.unique(key_values(frame[column].dropna())))
+
+
+def get_record_keys(dataset):
+    return dataset.derived('record_keys', lambda d: record_keys(d.frame, RECORD_KEYS[d.source][0]))
+
+
+def is_known(keys, values):
+    positions = np.searchsorted(keys, values).clip(max=max(len(keys) - 1, 0))
+    return (keys[positions] == values) if len(keys) else np.zeros(len(values), dtype=bool)
+
+
+def new_records(dataset, delta):
+    # Lignes de delta absentes du jeu de données (les lignes sans identifiant sont gardées)
+    column, unique_rows = RECORD_KEYS[dataset.source]
+    if column not in delta.columns:
+        raise ValueError(f"Colonne '{column}' absente du fichier ajouté.")
+
+    present = delta[column].notna().to_numpy()
+    known = np.zeros(len(delta), dtype=bool)
+    known[present] = is_known(get_record_keys(dataset), key_values(delta[column][present]))
+    if unique_rows:
+        known |= delta.duplicated(subset=[column]).to_numpy() & present
+    return delta[~known]
+
+
+def union_dtype(old, new):
+    # Catégories des deux colonnes ; l'ordre existant est gardé s'il n'y a rien de nouveau
+    # ou si les catégories ne sont pas triées (tranches d'âge, parties du corps...)
+    values = new.cat.categories if isinstance(new.dtype, pd.CategoricalDtype) else pd.Index(new.dropna().unique())
+    added = values.difference(old.categories)
+    if len(added) == 0:
+        return old
+    if old.ordered or not old.categories.is_monotonic_increasing:
+        return pd.CategoricalDtype(old.categories.append(added), ordered=old.ordered)
+    return pd.CategoricalDtype(old.categories.append(added).sort_values())
+
+
+def concat_rows(frame, rows):
+    # frame suivi de rows ; les colonnes catégorielles restent catégorielles (catégories réunies)
+    rows = rows[frame.columns].copy()
+    frame = frame.copy(deep=False)
+    for column in frame.columns:
+        dtype = frame[column].dtype
+        if not isinstance(dtype, pd.CategoricalDtype):
+            if isinstance(rows[column].dtype, pd.CategoricalDtype):
+                rows[column] = rows[column].astype(rows[column].cat.categories.dtype)
+            continue
+        dtype = union_dtype(dtype, rows[column])
+        if dtype != frame[column].dtype:
+            frame[column] = frame[column].cat.set_categories(dtype.categories)
+        rows[column] = rows[column].astype(object).astype(dtype)
+    return pd.concat([frame, rows])
+
+
+def read_delta(data, dataset):
+    # (fichier delta lu et préparé comme l'export complet, restreint aux nouvelles lignes, audit de ses corrections)
+    delta, corrections, _ = read_export(data, dataset.source)
+
+    missing = [column for column in dataset.frame.columns if column not in delta.columns]
+    if missing:
+        raise ValueError(f"Colonnes absentes du fichier ajouté : {', '.join(missing)}.")
+
+    delta = new_records(dataset, delta)
+    # Étiquettes à la suite de celles du jeu de données (les tables dérivées y font référence)
+    start = int(dataset.frame.index.max()) + 1 if len(dataset.frame) else 0
+    labels = pd.Series(np.arange(start, start + len(delta)), index=delta.index)
+    corrections = corrections[corrections['Ligne'].isin(delta.index)]
+    corrections = corrections.assign(Ligne=labels[corrections['Ligne']].to_numpy())
+    return delta.set_axis(pd.RangeIndex(start, start + len(delta))), corrections
+
+
+def extend_record_keys(keys, dataset, rows):
+    added = record_keys(rows, RECORD_KEYS[dataset.source][0])
+    return np.insert(keys, np.searchsorted(keys, added), added)
+
+
+# Structures dérivées mises à jour avec les seules lignes ajoutées ;
+# les autres (moteur SQL...) sont reconstruites à la première demande
+EXTENDERS = {
+    'record_keys': extend_record_keys,
+    'filter_index': lambda index, dataset, rows: index.extended(dataset.frame, len(rows)),
+    'count_cube': lambda cube, dataset, rows: cube.extended(dataset.frame.iloc[len(dataset.frame) - len(rows):]),
+    'exposures': lambda exposures, dataset, rows: concat_rows(exposures, exposure_table(
+        dataset.frame.iloc[len(dataset.frame) - len(rows):], dataset.source)),
+}
+
+
+def append_bytes(dataset, data):
+    # Nouveau jeu de données = dataset + lignes nouvelles de data ; dataset lui-même n'est pas modifié
+    fingerprint = hashlib.sha256((dataset.fingerprint + fingerprint_bytes(data)).encode()).hexdigest()
+
+    appended = cached_dataset(fingerprint)
+    if appended is not None:
+        return appended
+
+    rows, corrections = read_delta(data, dataset)
+    with stage('concaténation', len(rows)):
+        frame = concat_rows(dataset.frame, rows)
+    appended = Dataset(
+        name=dataset.name,
+        fingerprint=fingerprint,
+        source=dataset.source,
+        frame=frame,
+        nbytes=int(frame.memory_usage(deep=True).sum()),
+        schema_report=dataset.schema_report,
+        corrections=concat_rows(dataset.corrections, corrections).reset_index(drop=True),
+        built_from=(dataset.fingerprint,),
+    )
+    appended = keep_dataset(appended)
+    for key, extend in EXTENDERS.items():
+        built = dataset.built(key)
+        if built is not None:
+            appended.derived(key, lambda d, built=built, extend=extend: extend(built, d, rows))
+    return appended
+
+
+def append_uploaded_file(dataset, uploaded_file):
+    # (jeu de données complété, nombre de lignes ajoutées)
+    appended = append_bytes(dataset, uploaded_file.getvalue())
+    return appended, len(appended.frame) - len(dataset.frame)
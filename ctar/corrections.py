@@ -0,0 +1,166 @@
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+
+# Corrections des exports, décrites par des règles et appliquées une seule fois à la lecture du fichier
+# (avant le schéma, sur les valeurs brutes). Chaque règle renvoie la colonne corrigée et les lignes
+# modifiées : celles-ci sont gardées avec le jeu de données (audit des corrections).
+# Les colonnes corrigées ont peu de valeurs distinctes : les règles sont évaluées sur les valeurs distinctes
+# (pd.factorize) puis reportées sur les lignes.
+
+AUDIT_COLUMNS = ['Règle', 'Colonne', 'Ligne', 'Avant', 'Après']
+
+# Règle de l'audit pour les dates renseignées mais illisibles dans le format de l'export (ctar.preparation.DATE_COLUMNS) :
+# elles deviennent manquantes et leurs lignes sont écartées des analyses
+UNPARSED_DATE = 'Date illisible'
+
+
+@dataclass(frozen=True)
+class Normalize:
+    # Valeurs texte réécrites par une expression régulière (ex. zéros non significatifs : '022' -> '22')
+    name: str
+    column: str
+    pattern: str
+    replacement: str
+
+    def correct(self, frame):
+        values = frame[self.column]
+        if not pd.api.types.is_string_dtype(values.dtype):
+            return values, np.zeros(len(values), dtype=bool)
+        codes, uniques = pd.factorize(values)
+        uniques = pd.Series(uniques, dtype=values.dtype)
+        rewritten = uniques.str.replace(self.pattern, self.replacement, regex=True)
+        changed = np.append((rewritten != uniques).to_numpy(dtype=bool), False)[codes]
+        if not changed.any():
+            return values, changed
+        corrected = pd.Series(rewritten.to_numpy()[codes], index=values.index, name=values.name, dtype=values.dtype)
+        return corrected.where(codes >= 0, values), changed
+
+
+@dataclass(frozen=True)
+class FillFromKey:
+    # Valeur manquante complétée par la valeur la plus fréquente des lignes de même clé
+    # (ex. nom du CTAR d'après 'id_ctar')
+    name: str
+    column: str
+    key: str
+
+    def correct(self, frame):
+        values = frame[self.column]
+        keys = frame[self.key]
+        missing = (values.isna() & keys.notna()).to_numpy()
+        if not missing.any():
+            return values, missing
+
+        known = pd.DataFrame({'key': keys, 'value': values}).dropna()
+        counts = known.groupby(['key', 'value'], observed=True).size().reset_index(name='count')
+        # Ex aequo : la première valeur dans l'ordre de tri
+        counts = counts.sort_values(['key', 'count', 'value'], ascending=[True, False, True], kind='stable')
+        modes = counts.drop_duplicates('key').set_index('key')['value']
+
+        filled = keys[missing].map(modes)
+        changed = missing.copy()
+        changed[missing] = filled.notna().to_numpy()
+        if not changed.any():
+            return values, changed
+        corrected = values.copy()
+        corrected[changed] = filled[filled.notna()]
+        return corrected, changed
+
+
+@dataclass(frozen=True)
+class Coerce:
+    # Conversion en nombre : les valeurs non numériques deviennent manquantes
+    name: str
+    column: str
+
+    def correct(self, frame):
+        values = frame[self.column]
+        if pd.api.types.is_numeric_dtype(values.dtype):
+            return values, np.zeros(len(values), dtype=bool)
+        codes, uniques = pd.factorize(values)
+        numbers = pd.to_numeric(pd.Series(uniques, dtype=object), errors='coerce').to_numpy(dtype='float64', na_value=np.nan)
+        numbers = np.append(numbers, np.nan)[codes]
+        changed = np.isnan(numbers) & (codes >= 0)
+        return pd.Series(numbers, index=values.index, name=values.name), changed
+
+
+# Règles de chaque export, appliquées dans l'ordre
+PERIPHERIQUE_CORRECTIONS = [
+    Normalize("Zéros non significatifs", 'nb_lesion', r'^\s*0+(?=\d)', ''),
+    Coerce("Nombre de lésions non numérique", 'nb_lesion'),
+    FillFromKey("Nom du CTAR d'après son identifiant", 'ctar', 'id_ctar'),
+]
+
+CORRECTIONS = {
+    'peripherique': PERIPHERIQUE_CORRECTIONS,
+}
+
+
+def corrections_for(source):
+    return CORRECTIONS.get(source, [])
+
+
+def audit_values(series):
+    # Valeurs de l'audit en texte ('' pour une valeur manquante)
+    codes, uniques = pd.factorize(series)
+    return np.append(np.asarray(uniques.astype(str), dtype=object), '')[codes]
+
+
+def empty_audit():
+    return pd.DataFrame({column: pd.Series(dtype='int64' if column == 'Ligne' else 'str') for column in AUDIT_COLUMNS})
+
+
+def apply_corrections(df, rules):
+    # Applique les règles (en place, sur un DataFrame fraîchement lu) et renvoie l'audit :
+    # une ligne par valeur modifiée, repérée par l'étiquette de sa ligne dans l'export
+    parts = []
+    for rule in rules:
+        columns = [rule.column] + ([rule.key] if isinstance(rule, FillFromKey) else [])
+        if any(column not in df.columns for column in columns):
+            continue
+        before = df[rule.column]
+        corrected, changed = rule.correct(df)
+        df[rule.column] = corrected
+        if changed.any():
+            parts.append(pd.DataFrame({
+                'Règle': rule.name,
+                'Colonne': rule.column,
+                'Ligne': df.index[changed].to_numpy(dtype='int64'),
+                'Avant': audit_values(before[changed]),
+                'Après': audit_values(corrected[changed]),
+            }))
+
+    audit = pd.concat(parts, ignore_index=True) if parts else empty_audit()
+    # Règles dans leur ordre d'application
+    rule_names = pd.CategoricalDtype(list(dict.fromkeys(rule.name for rule in rules)))
+    return df, audit.astype({'Règle': rule_names, 'Colonne': 'category', 'Avant': 'category', 'Après': 'category'})
+
+
+def with_unparsed_dates(audit, before, after):
+    # Ajoute à l'audit les dates renseignées (before) devenues manquantes à la lecture (after)
+    changed = (before.notna() & after.isna()).to_numpy(dtype=bool)
+    if not changed.any():
+        return audit
+    part = pd.DataFrame({
+        'Règle': UNPARSED_DATE,
+        'Colonne': before.name,
+        'Ligne': before.index[changed].to_numpy(dtype='int64'),
+        'Avant': audit_values(before[changed]),
+        'Après': '',
+    })
+    rule_names = pd.CategoricalDtype([*audit['Règle'].astype('category').cat.categories, UNPARSED_DATE])
+    audit = pd.concat([audit.astype({column: object for column in ['Règle', 'Colonne', 'Avant', 'Après']}), part], ignore_index=True)
+    return audit.astype({'Règle': rule_names, 'Colonne': 'category', 'Avant': 'category', 'Après': 'category'})
+
+
+def unparsed_dates(audit):
+    # Nombre de dates illisibles (with_unparsed_dates) d'un audit
+    return int((audit['Règle'] == UNPARSED_DATE).sum())
+
+
+def audit_summary(audit):
+    # Nombre de lignes modifiées par règle
+    return audit.groupby(['Règle', 'Colonne'], observed=True).size().reset_index(name='Lignes modifiées')
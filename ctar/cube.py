@@ -0,0 +1,258 @@
+import copy
+
+import numpy as np
+import pandas as pd
+
+from ctar.preparation import valid_rows
+from ctar.schema import PERIPHERIQUE_BODY_PARTS, PERIPHERIQUE_CONTACTS, is_checked
+from ctar.views import AggregateView, lesion_stats, order_body_part_counts
+
+
+# Axes de filtrage présents dans chaque sous-cube
+CUBE_KEYS = ['id_ctar', 'Annee']
+
+# Sous-cubes (dimensions en plus de CUBE_KEYS) : chaque comptage des pages est lu dans l'un d'eux
+CUBOIDS = [
+    ['age', 'sexe'],
+    ['mois', 'sexe'],
+    ['Hour', 'sexe'],
+    ['Hour', 'espece'],
+    ['Hour', 'Weekday'],
+    ['nb_lesion'],
+    ['age', 'sexe', 'lavage_savon'],
+]
+
+# Sous-cube des cases à cocher : parties du corps x types de contact utilisés par les pages
+BODY_PART_DIMS = ['Age Group', 'sexe', 'dev_carac']
+BODY_PART_CONTACTS = ['LPS', 'MT']
+
+
+def encode(series):
+    # Codes entiers 0..k-1 dans l'ordre du groupby pandas (catégories, sinon valeurs triées) ;
+    # les valeurs manquantes ont le code k, dernière case de l'axe.
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        levels = series.cat.categories
+        codes = series.cat.codes.to_numpy().astype(np.int64)
+    else:
+        codes, levels = pd.factorize(series, sort=True)
+        codes = codes.astype(np.int64)
+    codes[codes < 0] = len(levels)
+    return codes, pd.Index(levels)
+
+
+def merge_levels(levels, series):
+    # Niveaux d'un axe complétés par les valeurs nouvelles de series, dans l'ordre que donnerait encode
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        return pd.Index(series.cat.categories)
+    values = pd.Index(series.dropna().unique())
+    if len(values.difference(levels)) == 0:
+        return levels
+    return levels.append(values.difference(levels)).sort_values()
+
+
+def moved(counts, moves, shape):
+    # Comptages recopiés sur des axes agrandis : moves[i][j] est la nouvelle position de la case j de l'axe i
+    if counts.shape == tuple(shape) and all((move == np.arange(len(move))).all() for move in moves):
+        return counts
+    result = np.zeros(shape, dtype=counts.dtype)
+    result[np.ix_(*moves)] = counts
+    return result
+
+
+def decode(levels, dtype, codes):
+    # Valeurs d'un axe à partir des codes (la dernière case redevient une valeur manquante)
+    codes = np.where(codes == len(levels), -1, codes)
+    if isinstance(dtype, pd.CategoricalDtype):
+        return pd.Categorical.from_codes(codes, dtype=dtype)
+    values = levels.array if isinstance(levels.dtype, pd.api.extensions.ExtensionDtype) else levels.to_numpy()
+    return pd.api.extensions.take(values, codes, allow_fill=True)
+
+
+def count_table(frame, by):
+    # Équivalent de frame.groupby(by, observed=True).size().reset_index(name='count') en un seul np.bincount
+    # sur les codes des colonnes : le coût ne dépend pas du nombre de combinaisons
+    codes, levels = zip(*(encode(frame[column]) for column in by))
+    shape = tuple(len(column_levels) + 1 for column_levels in levels)
+    counts = np.bincount(np.ravel_multi_index(codes, shape), minlength=int(np.prod(shape))).reshape(shape)
+    counts = counts[tuple(slice(0, len(column_levels)) for column_levels in levels)]
+    positions = np.nonzero(counts)
+    table = pd.DataFrame({column: decode(column_levels, frame[column].dtype, column_codes)
+                          for column, column_levels, column_codes in zip(by, levels, positions)})
+    table['count'] = counts[positions].astype(np.int64)
+    return table
+
+
+class CountCube:
+    # Comptages de patients précalculés en une passe : un tableau numpy dense par sous-cube,
+    # d'axes (id_ctar, Annee, dimensions...). Filtrer et agréger ne coûte que la taille du cube.
+
+    def __init__(self, frame, cuboids=CUBOIDS):
+        rows = valid_rows(frame)
+        columns = CUBE_KEYS + sorted({column for dims in cuboids for column in dims} | set(BODY_PART_DIMS))
+        columns = [column for column in columns if column in frame.columns]
+
+        self.levels, self.dtypes, codes = {}, {}, {}
+        for column in columns:
+            codes[column], self.levels[column] = encode(frame[column].take(rows))
+            self.dtypes[column] = frame[column].dtype
+
+        self.cuboids = []
+        for dims in cuboids:
+            if all(column in codes for column in dims):
+                axes = CUBE_KEYS + dims
+                self.cuboids.append((axes, self._count([codes[column] for column in axes], axes)))
+
+        self.body_parts = None
+        if all(column in codes for column in BODY_PART_DIMS):
+            self.body_parts = self._count_body_parts(frame.take(rows), codes)
+
+        self.nbytes = sum(counts.nbytes for _, counts in self.cuboids)
+        if self.body_parts is not None:
+            self.nbytes += self.body_parts[1].nbytes
+
+    def _shape(self, axes):
+        return tuple(len(self.levels[column]) + 1 for column in axes)
+
+    def _count(self, axis_codes, axes, mask=None):
+        shape = self._shape(axes)
+        flat = np.ravel_multi_index(axis_codes, shape)
+        if mask is not None:
+            flat = flat[mask]
+        return np.bincount(flat, minlength=int(np.prod(shape))).reshape(shape).astype(np.int32)
+
+    def _count_body_parts(self, frame, codes):
+        # Une case cochée par partie du corps et par contact : axes supplémentaires (partie, contact)
+        axes = CUBE_KEYS + BODY_PART_DIMS
+        axis_codes = [codes[column] for column in axes]
+        parts = [(part, column) for part, column in PERIPHERIQUE_BODY_PARTS.items() if column in frame.columns]
+        contacts = [contact for contact in BODY_PART_CONTACTS if PERIPHERIQUE_CONTACTS[contact] in frame.columns]
+
+        counts = np.zeros((len(parts), len(contacts)) + self._shape(axes), dtype=np.int32)
+        for j, contact in enumerate(contacts):
+            contact_mask = is_checked(frame[PERIPHERIQUE_CONTACTS[contact]])
+            for i, (_, column) in enumerate(parts):
+                counts[i, j] = self._count(axis_codes, axes, contact_mask & is_checked(frame[column]))
+        return ([part for part, _ in parts], contacts, axes), counts
+
+    def extended(self, rows):
+        # Cube des lignes déjà comptées plus les lignes ajoutées : seules ces dernières sont lues.
+        # Les axes gagnent les nouvelles valeurs (nouvelle année, nouveau CTAR...) sans recompter l'existant.
+        rows = rows.take(valid_rows(rows))
+        cube = copy.copy(self)
+        cube.levels, cube.dtypes, codes, moves = {}, {}, {}, {}
+        for column, levels in self.levels.items():
+            cube.levels[column] = merge_levels(levels, rows[column])
+            cube.dtypes[column] = rows[column].dtype
+            # Position de chaque ancienne case (valeurs puis case des manquantes) sur le nouvel axe
+            moves[column] = np.append(cube.levels[column].get_indexer(levels), len(cube.levels[column]))
+            codes[column] = cube.levels[column].get_indexer(rows[column]).astype(np.int64)
+            codes[column][codes[column] < 0] = len(cube.levels[column])
+
+        cube.cuboids = []
+        for axes, counts in self.cuboids:
+            counts = moved(counts, [moves[column] for column in axes], cube._shape(axes))
+            cube.cuboids.append((axes, counts + cube._count([codes[column] for column in axes], axes)))
+
+        if self.body_parts is not None:
+            layout, counts = self.body_parts
+            parts, contacts, axes = layout
+            kept = [np.arange(len(parts)), np.arange(len(contacts))]
+            counts = moved(counts, kept + [moves[column] for column in axes], counts.shape[:2] + cube._shape(axes))
+            cube.body_parts = layout, counts + cube._count_body_parts(rows, codes)[1]
+
+        cube.nbytes = sum(counts.nbytes for _, counts in cube.cuboids)
+        if cube.body_parts is not None:
+            cube.nbytes += cube.body_parts[1].nbytes
+        return cube
+
+    @property
+    def ctars(self):
+        return self.levels['id_ctar'].tolist()
+
+    @property
+    def years(self):
+        return [int(year) for year in self.levels['Annee']]
+
+    def key_positions(self, column, values):
+        # Positions des valeurs sélectionnées sur un axe de filtrage (toutes si values est None)
+        if values is None:
+            return np.arange(len(self.levels[column]))
+        return np.flatnonzero(self.levels[column].isin(list(values)))
+
+    def select(self, ctars=None, years=None):
+        return CubeView(self, ctars, years)
+
+
+class CubeView(AggregateView):
+    # Tranche du cube pour une sélection de CTARs et d'années
+
+    def __init__(self, cube, ctars=None, years=None):
+        self.cube = cube
+        self.ctar_positions = cube.key_positions('id_ctar', ctars)
+        self.year_positions = cube.key_positions('Annee', years)
+
+    def _slice(self, counts, axes, keep):
+        # Restreint les axes de filtrage à la sélection puis somme les axes absents de keep
+        counts = counts.take(self.ctar_positions, axis=0).take(self.year_positions, axis=1)
+        summed = tuple(i for i, column in enumerate(axes) if column not in keep)
+        counts = counts.sum(axis=summed)
+        remaining = [column for column in axes if column in keep]
+        return counts.transpose([remaining.index(column) for column in keep])
+
+    def _codes(self, column, positions):
+        # Positions sur un axe de la tranche (_slice) -> codes de cet axe dans le cube entier
+        if column == 'id_ctar':
+            return self.ctar_positions[positions]
+        if column == 'Annee':
+            return self.year_positions[positions]
+        return positions
+
+    def _table(self, counts, by, dropna):
+        # Cellules non nulles -> DataFrame trié comme un groupby pandas
+        if dropna:
+            counts = counts[tuple(slice(0, len(self.cube.levels[column])) for column in by)]
+        positions = np.nonzero(counts)
+        table = pd.DataFrame({column: decode(self.cube.levels[column], self.cube.dtypes[column], self._codes(column, codes))
+                              for column, codes in zip(by, positions)})
+        table['count'] = counts[positions].astype(np.int64)
+        return table
+
+    def _cuboid(self, columns):
+        # Plus petit sous-cube contenant toutes les colonnes demandées
+        candidates = [(axes, counts) for axes, counts in self.cube.cuboids if set(columns) <= set(axes)]
+        if not candidates:
+            raise KeyError(f"Aucun sous-cube ne contient les colonnes {columns}")
+        return min(candidates, key=lambda cuboid: cuboid[1].size)
+
+    def counts(self, by, dropna=True):
+        axes, counts = self._cuboid(by)
+        return self._table(self._slice(counts, axes, by), by, dropna)
+
+    def size(self, notna=()):
+        axes, counts = self._cuboid(notna)
+        counts = self._slice(counts, axes, list(notna))
+        return int(counts[tuple(slice(0, len(self.cube.levels[column])) for column in notna)].sum())
+
+    def age_sex_counts(self):
+        return self.counts(['age', 'sexe'])
+
+    def monthly_sex_counts(self):
+        return self.counts(['mois', 'Annee', 'sexe'])
+
+    def body_part_counts(self, contact, by):
+        (parts, contacts, axes), counts = self.cube.body_parts
+        dims = [column for column in by if column != 'Body Part']
+        tables = []
+        for i, part in enumerate(parts):
+            table = self._table(self._slice(counts[i, contacts.index(contact)], axes, dims), dims, dropna=True)
+            table.insert(0, 'Body Part', part)
+            tables.append(table)
+        counts = pd.concat(tables, ignore_index=True)
+        return order_body_part_counts(counts[by + ['count']], by)
+
+    def lesion_stats(self):
+        return lesion_stats(self.counts(['nb_lesion']))
+
+
+def get_count_cube(dataset):
+    return dataset.derived('count_cube', lambda d: CountCube(d.frame))
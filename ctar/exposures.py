@@ -0,0 +1,79 @@
+import numpy as np
+import pandas as pd
+
+from ctar.schema import BODY_PARTS, IPM_BODY_PARTS, PERIPHERIQUE_BODY_PARTS, PERIPHERIQUE_CONTACTS, is_checked
+from ctar.views import order_body_part_counts
+
+
+# Colonnes du patient recopiées sur chaque ligne d'exposition (nom commun -> colonne de l'export)
+PATIENT_COLUMNS = {
+    'ipm': {'sexe': 'sexe', 'Age Group': 'Age Group', 'Animal Type': 'typanim'},
+    'peripherique': {'sexe': 'sexe', 'Age Group': 'Age Group', 'Animal Type': 'dev_carac'},
+}
+
+
+def _ipm_sites(frame):
+    # Une colonne par partie du corps, dont la valeur est le type de contact
+    rows, parts, contacts = [], [], []
+    for part, column in IPM_BODY_PARTS.items():
+        if column not in frame.columns:
+            continue
+        values = frame[column]
+        positions = np.flatnonzero(values.notna().to_numpy())
+        rows.append(positions)
+        parts.append(np.full(len(positions), BODY_PARTS.index(part)))
+        contacts.append(values.take(positions).astype(str).to_numpy(dtype=object))
+    return rows, parts, contacts
+
+
+def _peripherique_sites(frame):
+    # Cases à cocher indépendantes : chaque partie cochée est croisée avec chaque contact coché
+    contact_masks = {contact: is_checked(frame[column])
+                     for contact, column in PERIPHERIQUE_CONTACTS.items() if column in frame.columns}
+    rows, parts, contacts = [], [], []
+    for part, column in PERIPHERIQUE_BODY_PARTS.items():
+        if column not in frame.columns:
+            continue
+        part_mask = is_checked(frame[column])
+        for contact, contact_mask in contact_masks.items():
+            positions = np.flatnonzero(part_mask & contact_mask)
+            rows.append(positions)
+            parts.append(np.full(len(positions), BODY_PARTS.index(part)))
+            contacts.append(np.full(len(positions), contact, dtype=object))
+    return rows, parts, contacts
+
+
+def exposure_table(frame, source):
+    # Table longue : une ligne par (patient, partie du corps, type de contact).
+    # 'row' est l'étiquette de la ligne du patient dans frame.
+    rows, parts, contacts = _ipm_sites(frame) if source == 'ipm' else _peripherique_sites(frame)
+
+    rows = np.concatenate(rows) if rows else np.empty(0, dtype=np.int64)
+    parts = np.concatenate(parts) if parts else np.empty(0, dtype=np.int64)
+    contacts = np.concatenate(contacts) if contacts else np.empty(0, dtype=object)
+
+    table = pd.DataFrame({
+        'row': frame.index.take(rows),
+        'Body Part': pd.Categorical.from_codes(parts, categories=BODY_PARTS, ordered=True),
+        'Contact': pd.Categorical(contacts),
+    })
+    for name, column in PATIENT_COLUMNS.get(source, PATIENT_COLUMNS['peripherique']).items():
+        if column in frame.columns:
+            table[name] = frame[column].take(rows).array
+    return table
+
+
+def get_exposures(dataset):
+    return dataset.derived('exposures', lambda d: exposure_table(d.frame, d.source))
+
+
+def exposures_of(dataset, frame):
+    # Lignes d'exposition des patients présents dans frame (sélection ou dédoublonnage de dataset.frame)
+    exposures = get_exposures(dataset)
+    return exposures[exposures['row'].isin(frame.index)]
+
+
+def exposure_counts(exposures, contact, by):
+    # Nombre d'expositions d'un type de contact, groupées comme les graphiques des pages
+    counts = exposures[exposures['Contact'] == contact].groupby(by, observed=True).size().reset_index(name='count')
+    return order_body_part_counts(counts, by)
@@ -0,0 +1,689 @@
+import numpy as np
+import pandas as pd
+import plotly.colors as pc
+import plotly.express as px
+import plotly.graph_objects as go
+
+from ctar.schema import ctar_label
+
+
+# Graphiques des pages, construits à partir des tables de ctar.analytics (sans Streamlit)
+
+# Axe et titre du graphique des saisons pour chaque export
+SEASON_TITLES = {
+    'ipm': ('Nombre de patients venus à IPM',
+            "Affluence des patients venus au CTAR IPM sur période saisonnière d'une année"),
+    'peripherique': ('Nombre de patients venus au CTAR',
+                     "Affluence des patients venus au CTAR périphérique sur période saisonnière d'une année"),
+    'national': ('Nombre de patients venus au CTAR',
+                 "Affluence des patients venus aux CTAR (IPM et périphériques) sur période saisonnière d'une année"),
+}
+
+# Saison -> (mois de début, mois de fin, couleur de fond, couleur du texte)
+SEASON_BACKGROUNDS = {
+    'Fahavratra (pluie)': (12, 3, 'rgba(186, 225, 255, 0.3)', 'rgb(186, 225, 255)'),
+    'Fararano (automne)': (3.5, 6, 'rgba(255, 186, 186, 0.3)', 'rgb(255, 186, 186)'),
+    'Ritinina (hiver)': (6.5, 9, 'rgba(186, 255, 201, 0.3)', 'rgb(186, 255, 201)'),
+    'Lohataona (été)': (9.5, 11.5, 'rgba(255, 223, 186, 0.3)', 'rgb(255, 223, 186)')
+}
+
+# Couleurs des parties du corps (graphique des lésions IPM)
+IPM_LESION_COLORS = [
+    ('Tête', 'blue'),
+    ('Bras et avant-bras', 'green'),
+    ('Main', 'red'),
+    ('Cuisse et Jambe', 'purple'),
+    ('Pied', 'orange'),
+    ('Abdomen', 'brown'),
+    ('Dos', 'pink'),
+    ('Parties génitales', 'cyan')
+]
+
+SAVON_COLORS = {
+    ('M', 'OUI'): 'rgba(50, 171, 96, 0.6)',
+    ('M', 'NON'): 'rgba(50, 171, 96, 0.9)',
+    ('F', 'OUI'): 'rgba(171, 50, 96, 0.6)',
+    ('F', 'NON'): 'rgba(171, 50, 96, 0.9)'
+}
+
+# Jours de la semaine (colonne 'Weekday', 0 = lundi)
+WEEKDAYS = ['Lundi', 'Mardi', 'Mercredi', 'Jeudi', 'Vendredi', 'Samedi', 'Dimanche']
+
+MT_LABELS = {
+    'MT Count': 'Nombre de MT',
+    'Age Group': "Groupe d'âge",
+    'Body Part': 'Partie du corps',
+    'Gender': 'Sexe'
+}
+
+
+def age_column(counts):
+    # Âge en années, ou tranche d'âge ('Age Group') des graphiques allégés
+    return 'Age Group' if 'Age Group' in counts.columns else 'age'
+
+
+def age_sex_figure(age_sex_counts, not_null_pairs):
+    age = age_column(age_sex_counts)
+    # Sort by age (ensured to be numeric)
+    age_sex_counts = age_sex_counts.sort_values(by=age)
+
+    fig = go.Figure()
+
+    # Itérer sur chaque sexe et âge et créer un barplot
+    for sex in age_sex_counts['sexe'].unique():
+        data = age_sex_counts[age_sex_counts['sexe'] == sex]
+        # Utiliser le rouge pour Féminin ('F'), et la couleur par défaut pour Masculin ('M')
+        color = 'red' if sex == 'F' else None
+        fig.add_trace(go.Bar(
+            x=data[age],
+            y=data['count'],
+            name=f'{sex}',
+            marker_color=color
+        ))
+
+    # Légende et esthétique de la visualisation
+    fig.update_layout(
+        barmode='group',
+        title_text=f'Distribution des patients par Âge et Genre (sur {not_null_pairs} patient(s))',
+        xaxis_title='Âge',
+        yaxis_title='Nombre de patients',
+        legend_title='Genre',
+        width=1500,
+        height=600,
+        legend=dict(
+            orientation='h',
+            x=0, y=1.1,
+        )
+    )
+    if age == 'age':
+        fig.update_layout(xaxis=dict(
+            type='linear',
+            tickmode='linear',
+            tick0=age_sex_counts['age'].min(),
+            dtick=1,
+        ))
+    else:
+        fig.update_layout(width=1000, xaxis=dict(type='category', title="Groupe d'âge"))
+    return fig
+
+
+def season_figure(monthly_sex_counts, source, width=7400):
+    yaxis_title, title = SEASON_TITLES[source]
+
+    months = list(range(1, 13))
+    month_names = [
+        'Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug',
+        'Sep', 'Oct', 'Nov', 'Dec'
+    ]
+
+    # Ajuster le zoom du la visualisation
+    min_count = monthly_sex_counts['count'].min()
+    max_count = monthly_sex_counts['count'].max()
+    range_margin = (max_count - min_count) * 0.2
+
+    fig = go.Figure()
+
+    male_colors = pc.sequential.Blues[::-1]
+    female_colors = pc.sequential.Reds[::-1]
+
+    years_sorted = sorted(monthly_sex_counts['Annee'].unique(), reverse=True)
+
+    sexes = ['M', 'F']
+    for i, year in enumerate(years_sorted):
+        for j, sex in enumerate(sexes):
+            df_year_sex = monthly_sex_counts[(monthly_sex_counts['Annee'] == year) & (monthly_sex_counts['sexe'] == sex)]
+            df_year_sex = df_year_sex.set_index('mois').reindex(months).reset_index()
+            df_year_sex['count'] = df_year_sex['count'].fillna(0)
+
+            # Determine color based on gender
+            if sex == 'M':
+                color = male_colors[i % len(male_colors)]
+            else:
+                color = female_colors[i % len(female_colors)]
+
+            fig.add_trace(go.Scatter(
+                x=df_year_sex['mois'],
+                y=df_year_sex['count'],
+                mode='lines+markers',
+                name=f"{int(year)} - {'Homme' if sex == 'M' else 'Femme'}",
+                marker=dict(size=8, color=color),
+                line=dict(width=2),
+                visible="legendonly" if year < 2021 else True
+            ))
+
+    shapes = []
+    annotations = []
+
+    for season, (start_month, end_month, color, text_color) in SEASON_BACKGROUNDS.items():
+        if end_month < start_month:
+            shapes.append(dict(
+                type='rect',
+                x0=start_month - 1,
+                x1=11,
+                y0=min_count - range_margin,
+                y1=max_count + range_margin,
+                fillcolor=color,
+                line=dict(width=0),
+                layer='below'
+            ))
+            shapes.append(dict(
+                type='rect',
+                x0=1 - 1,
+                x1=end_month - 0.5,
+                y0=min_count - range_margin,
+                y1=max_count + range_margin,
+                fillcolor=color,
+                line=dict(width=0),
+                layer='below'
+            ))
+        else:
+            shapes.append(dict(
+                type='rect',
+                x0=start_month - 1,
+                x1=end_month - 0.5,
+                y0=min_count - range_margin,
+                y1=max_count + range_margin,
+                fillcolor=color,
+                line=dict(width=0),
+                layer='below'
+            ))
+
+        annotations.append(dict(
+            x=(start_month) / 10 if end_month < start_month else (start_month + end_month - 1) / 2,
+            y=min_count - range_margin,
+            text=season,
+            showarrow=False,
+            font=dict(size=15, color=text_color),
+            xanchor="center",
+            yanchor="bottom"
+        ))
+
+    fig.update_layout(
+        shapes=shapes,
+        annotations=annotations,
+        xaxis=dict(
+            tickvals=months,
+            ticktext=month_names,
+            title='Mois',
+            type='category',
+            range=[-0.5, 12]
+        ),
+        yaxis=dict(
+            title=yaxis_title,
+            range=[min_count - range_margin, max_count + range_margin]
+        ),
+        title={
+            'text': title,
+            'x': 0.5,
+            'xanchor': 'center'
+        },
+        height=700,
+        width=width,
+        legend_title='Légende'
+    )
+
+    fig.for_each_trace(lambda trace: trace.update(showlegend=False) if trace.name in SEASON_BACKGROUNDS else None)
+    return fig
+
+
+def hourly_sex_figure(hourly_sex_counts, n_patients):
+    fig = go.Figure()
+
+    male_color = 'blue'
+    female_color = 'pink'
+
+    # Add traces for each gender
+    for sex, color in [('M', male_color), ('F', female_color)]:
+        df_sex = hourly_sex_counts[hourly_sex_counts['sexe'] == sex]
+
+        fig.add_trace(go.Scatter(
+            x=df_sex['Hour'],
+            y=df_sex['count'],
+            mode='lines+markers',
+            name='Homme' if sex == 'M' else 'Femme',
+            marker=dict(size=8, color=color),
+            line=dict(width=2)
+        ))
+
+    fig.update_layout(
+        title=f'Heure de morsure par sexe pour {n_patients} patient(s) des CTARs périphériques.',
+        xaxis=dict(
+            title='Heures',
+            tickvals=hourly_sex_counts['Hour'].unique(),
+            tickangle=0
+        ),
+        yaxis=dict(title='Nombre de patients'),
+        legend_title='Sexe'
+    )
+    return fig
+
+
+def hourly_species_figure(hourly_species_counts, n_patients):
+    fig = go.Figure()
+
+    colors = {
+        'Chien': 'brown',
+        'Chat': 'orange',
+        'Autre': 'green'
+    }
+
+    for species, color in colors.items():
+        df_species = hourly_species_counts[hourly_species_counts['espece'] == species]
+
+        fig.add_trace(go.Scatter(
+            x=df_species['Hour'],
+            y=df_species['count'],
+            mode='lines+markers',
+            name=species,
+            marker=dict(size=8, color=color),
+            line=dict(width=2)
+        ))
+
+    fig.update_layout(
+        title=f'Heure de morsure par espèce pour {n_patients} patient(s) des CTARs périphériques.',
+        xaxis=dict(
+            title='Heures',
+            tickvals=sorted(hourly_species_counts['Hour'].unique()),
+            tickangle=0
+        ),
+        yaxis=dict(title="Nombre d'animaux"),
+        legend_title='Espèce'
+    )
+    return fig
+
+
+def hour_weekday_figure(counts, n_patients):
+    # Carte de chaleur jour de la semaine x heure ; le menu affiche l'ensemble des CTARs sélectionnés
+    # ou un seul d'entre eux, sans nouvel échange avec le serveur
+    ctars = sorted(counts['id_ctar'].unique())
+    grid = np.zeros((len(ctars) + 1, len(WEEKDAYS), 24), dtype=np.int64)
+    positions = pd.Index(ctars).get_indexer(counts['id_ctar'])
+    grid[positions + 1, counts['Weekday'].to_numpy(dtype=int), counts['Hour'].to_numpy(dtype=int)] = counts['count'].to_numpy()
+    grid[0] = grid[1:].sum(axis=0)
+
+    fig = go.Figure(go.Heatmap(
+        z=grid[0],
+        x=list(range(24)),
+        y=WEEKDAYS,
+        colorscale='YlOrRd',
+        colorbar=dict(title='Patients'),
+        hovertemplate='%{y}, %{x}h : %{z} patient(s)<extra></extra>'
+    ))
+
+    labels = ['Tous les CTARs sélectionnés'] + [f'CTAR {ctar_label(ctar)}' for ctar in ctars]
+    buttons = [dict(label=label, method='restyle', args=[{'z': [grid[i].tolist()]}]) for i, label in enumerate(labels)]
+    fig.update_layout(
+        title=f'Heure de morsure et jour de consultation pour {n_patients} patient(s) des CTARs périphériques.',
+        xaxis=dict(title='Heures', tickmode='linear', dtick=1),
+        yaxis=dict(title='Jour de consultation', autorange='reversed'),
+        updatemenus=[dict(buttons=buttons, direction='down', x=0, xanchor='left', y=1.15, yanchor='top')] if len(ctars) > 1 else [],
+        height=500,
+        margin=dict(t=120)
+    )
+    return fig
+
+
+def lesion_figure(value_counts, n_patients, mean_lesions, median_lesions, variance_lesions):
+    # None s'il n'y a pas assez de valeurs distinctes pour tracer la distribution
+    if len(value_counts) - 1 <= 0:
+        return None
+
+    # Convert the index to a list of strings for x-axis labeling, converting -1 back to 'NaN'
+    x_labels = [int(x) if x != -1 else 'NaN' for x in value_counts.index]
+
+    # Gradient de couleur (orange) basé sur le nombre de lésions
+    dark_oranges = px.colors.sequential.Oranges[::-1]
+    color_scale = [dark_oranges[int((i) * (len(dark_oranges) - 1) / (len(value_counts) - 1))] for i in range(len(value_counts))]
+
+    fig = go.Figure()
+
+    fig.add_trace(go.Bar(
+            x=(x_labels),
+            y=value_counts.values,
+            marker_color=color_scale,
+            name='Nombre de patients'
+        ))
+
+    fig.add_trace(go.Scatter(
+            x=(x_labels),
+            y=[mean_lesions] * len(x_labels),
+            mode='lines',
+            line=dict(color='red', dash='dash'),
+            name=f'Moyenne: {mean_lesions:.2f}'
+        ))
+
+    fig.add_trace(go.Scatter(
+            x=(x_labels),
+            y=[median_lesions] * len(x_labels),
+            mode='lines',
+            line=dict(color='green', dash='solid'),
+            name=f'Médiane: {median_lesions:.2f}'
+        ))
+
+    fig.update_layout(
+            title=f'Distribution du nombre de lésions sur {n_patients} patients des CTAR périphériques.',
+            xaxis_title='Nombre de lésions',
+            yaxis_title='Nombre de patients',
+            xaxis=dict(tickmode='array', tickvals=x_labels, ticktext=x_labels),
+            template='plotly_white'
+        )
+
+    fig.add_annotation(
+            x=len(x_labels) - 1,
+            y=max(value_counts.values),
+            text=f'Variance: {variance_lesions:.2f}',
+            showarrow=False,
+            yshift=10,
+            xshift=-10,
+            font=dict(color='black', size=12)
+        )
+    return fig
+
+
+def ipm_lesion_figure(grouped, n_patients):
+    # Séries des statistiques présentes dans grouped (voir ipm_lesion_stats) ; avec les moyennes,
+    # variance et médiane sont masquées par défaut (affichables depuis la légende)
+    fig = go.Figure()
+
+    with_means = f'{IPM_LESION_COLORS[0][0]}_mean' in grouped.columns
+    secondary = 'legendonly' if with_means else True
+    if with_means:
+        sizeref = 70 * max(grouped[f'{part}_mean'].max() for part, _ in IPM_LESION_COLORS) / (100. ** 2)
+
+    for part, color in IPM_LESION_COLORS:
+        if with_means:
+            fig.add_trace(go.Scatter(
+                    x=grouped['Age Group'], y=grouped[f'{part}_mean'], mode='markers', name=f'{part} Moyenne',
+                    marker=dict(size=grouped[f'{part}_mean'] * 4, sizemode='area', sizeref=sizeref, sizemin=1, color=color),
+                    showlegend=True
+                ))
+
+        if f'{part}_var' in grouped.columns:
+            variance_val = grouped[f'{part}_var']
+            fig.add_trace(go.Scatter(
+                    x=grouped['Age Group'], y=variance_val, mode='lines',
+                    line=dict(color=color, width=2, dash='dot'), name=f'{part} Variance', showlegend=True, visible=secondary
+                ))
+
+        if f'{part}_median' in grouped.columns:
+            median_val = grouped[f'{part}_median']
+            fig.add_trace(go.Scatter(
+                    x=grouped['Age Group'], y=median_val, mode='lines',
+                    line=dict(color=color, width=2, dash='dash'), name=f'{part} Médiane', showlegend=True, visible=secondary
+                ))
+
+    fig.update_layout(
+            title=f" Distribution du nombre de lésions sur {n_patients} patients de CTAR IPM.",
+            xaxis=dict(title="Groupe d'âge", tickangle=-45),
+            yaxis=dict(title='Nombre de lésions '),
+            legend=dict(title="Légende", orientation="v", yanchor="top", y=0.95, xanchor="right", x=1.35,
+                        traceorder="normal", tracegroupgap=20),
+            height=850,
+            width=1000,
+            margin=dict(b=250)
+        )
+    return fig
+
+
+def lps_figure(lps_counts):
+    return px.bar(
+            lps_counts,
+            x='Age Group',
+            y='LPS Count',
+            color='Body Part',
+            barmode='group',
+            title=f"Proportion de patients qui ont l'exposition de catégorie 1 (LPS) par âge et partie du corps.",
+            labels={'LPS Count': 'Nombre de LPS', 'Age Group': 'Groupe d\'âge', 'Body Part': 'Partie du corps'}
+        )
+
+
+def mt_figure(mt_counts, height):
+    fig = px.bar(
+            mt_counts,
+            x='Age Group',
+            y='MT Count',
+            color='Body Part',
+            barmode='group',
+            facet_col='Gender',
+            facet_col_wrap=2,
+            title="Nombre de lésions 'MT' par groupe d'âge, partie du corps et sexe",
+            labels=MT_LABELS,
+            category_orders={'Gender': ['M', 'F']}
+        )
+
+    fig.update_layout(
+            title="Facteurs de risque des morsures transdermiques (âge, partie du corps et genre)",
+            xaxis=dict(title="Groupe d'âge"),
+            yaxis=dict(title="Nombre de Morsure Transdermique"),
+            legend=dict(title="Partie du corps", orientation="h", yanchor="bottom", y=-0.3, xanchor="center", x=0.6),
+            height=height,
+            width=1000,
+            margin=dict(b=100)
+        )
+    return fig
+
+
+def mt_animal_figure(mt_counts, gender_icons, animal_types):
+    # Une ligne de graphiques par type d'animal (dans l'ordre de animal_types), une colonne par sexe
+    mt_counts = mt_counts.assign(Gender=mt_counts['Gender'].map(gender_icons))
+
+    fig = px.bar(
+            mt_counts,
+            x='Age Group',
+            y='MT Count',
+            color='Body Part',
+            barmode='group',
+            facet_col='Gender',
+            facet_col_wrap=2,
+            facet_row='Animal Type',
+            title="Nombre de lésions 'MT' par groupe d'âge, partie du corps, sexe et type d'animal",
+            labels={**MT_LABELS, 'Animal Type': ''},
+            category_orders={
+                'Gender': list(gender_icons.values()),
+                'Animal Type': animal_types
+            }
+        )
+
+    fig.update_layout(
+            title="Facteurs de risque des morsures transdermiques (MT) : âge, partie du corps, sexe et type d'animal",
+            xaxis=dict(title="Groupe d'âge", tickfont=dict(size=10)),
+            yaxis=dict(title="Nombre de MT", tickfont=dict(size=10)),
+            legend=dict(title="Partie du corps :", orientation="h", yanchor="bottom", y=1.01, xanchor="auto", x=0.5),
+            height=1900,
+            width=1000,
+            margin=dict(b=400, t=250)
+        )
+
+    fig.update_yaxes(matches=None)
+    fig.for_each_annotation(lambda a: a.update(text=a.text.split('=')[-1]))
+    fig.update_xaxes(tickfont=dict(size=10))
+    fig.update_yaxes(tickfont=dict(size=10))
+    fig.update_yaxes(automargin=True)
+    return fig
+
+
+def ipm_savon_figure(age_sex_savon_counts, not_null_pairs):
+    age = age_column(age_sex_savon_counts)
+    fig = go.Figure()
+
+    for sex in age_sex_savon_counts['sexe'].unique():
+        data_oui = age_sex_savon_counts[(age_sex_savon_counts['sexe'] == sex) & (age_sex_savon_counts['savon'] == 'OUI')]
+        data_non = age_sex_savon_counts[(age_sex_savon_counts['sexe'] == sex) & (age_sex_savon_counts['savon'] == 'NON')]
+
+        data_oui = data_oui.sort_values(by=age)
+        data_non = data_non.sort_values(by=age)
+
+        if not data_oui.empty:
+            fig.add_trace(go.Bar(
+                x=data_oui[age],
+                y=data_oui['count'],
+                name=f'{sex} - Savon: OUI',
+                marker_color=SAVON_COLORS[(sex, 'OUI')],
+                base=0,
+                offsetgroup=sex,
+            ))
+
+        if not data_non.empty:
+            fig.add_trace(go.Bar(
+                x=data_non[age],
+                y=data_non['count'],
+                name=f'{sex} - Savon: NON',
+                marker_color=SAVON_COLORS[(sex, 'NON')],
+                base=0,
+                offsetgroup=sex,
+            ))
+
+    fig.update_layout(
+        barmode='stack',
+        title_text=f'Distribution des patients par Âge, Genre et Lavage au savon (sur {not_null_pairs} patients IPM)',
+        xaxis_title='Âge',
+        yaxis_title='Nombre de patients',
+        legend_title='Genre et Savon',
+        width=1000,
+        height=600,
+        xaxis={'type': 'category'},
+        legend=dict(
+            orientation='h',
+            x=0, y=1.1,
+        )
+    )
+    return fig
+
+
+def savon_figure(age_sex_savon_counts, num_patients):
+    age = age_column(age_sex_savon_counts)
+    age_sex_savon_counts = age_sex_savon_counts.sort_values(by=age)
+
+    fig = go.Figure()
+
+    for sex in age_sex_savon_counts['sexe'].unique():
+        for savon in age_sex_savon_counts['lavage_savon'].unique():
+            data = age_sex_savon_counts[(age_sex_savon_counts['sexe'] == sex) & (age_sex_savon_counts['lavage_savon'] == savon)]
+
+            if not data.empty:
+                fig.add_trace(go.Bar(
+                    x=data[age],
+                    y=data['count'],
+                    name=f'{sex} - Savon: {savon}',
+                    marker_color=SAVON_COLORS[(sex, savon)],
+                    base=0,
+                    offsetgroup=sex,
+                ))
+
+    fig.update_layout(
+        barmode='stack',
+        title_text=f'Distribution des patients par Âge, Genre et Lavage au savon (sur {num_patients} patient(s))',
+        xaxis_title='Âge',
+        yaxis_title='Nombre de patients',
+        legend_title='Genre et Savon',
+        width=1000,
+        height=600,
+        xaxis={'type': 'category'},
+        legend=dict(
+            orientation='h',
+            x=0, y=1.1,
+        )
+    )
+    return fig
+
+
+def donut_chart(counts, label_col, count_col, title, is_peripherique=False):
+    fig = go.Figure(go.Pie(
+        labels=counts[label_col],
+        values=counts[count_col],
+        hole=0.6,
+        textinfo='label+percent',
+        marker=dict(colors=['#ff9999', '#66b3ff', '#99ff99', '#ffcc99', '#c2c2f0'][:len(counts)]),
+        direction='clockwise'
+    ))
+
+    # Esthétique de la visualisation
+    top_margin = 70 if is_peripherique else 100
+    fig.update_layout(
+        title_text=title,
+        margin=dict(t=top_margin, l=70, r=70, b=40),
+        height=800,
+        width=1000,
+        showlegend=True,
+    )
+    return fig
+
+
+def pie_chart(counts, label_col, count_col, title, is_peripherique=False):
+    fig = go.Figure(go.Pie(
+        labels=counts[label_col],
+        values=counts[count_col],
+        textinfo='label+percent',
+        marker=dict(colors=['#8c564b', '#e377c2', '#7f7f7f', '#bcbd22', '#17becf'][:len(counts)]),
+    ))
+
+    # Esthétique de la visualisation
+    top_margin = 70 if is_peripherique else 100
+    fig.update_layout(
+        title_text=title,
+        margin=dict(t=top_margin, l=40, r=40, b=70),
+        height=580,
+        width=600,
+        showlegend=True,
+    )
+    return fig
+
+
+def orders_figure(monthly, ctar_name):
+    # Doses de vaccin commandées (barres) et patients reçus (courbe, second axe) chaque mois
+    doses_per_patient = (monthly['Doses commandées'] / monthly['Patients reçus'].where(monthly['Patients reçus'] > 0)).round(2)
+
+    fig = go.Figure()
+    fig.add_trace(go.Bar(
+        x=monthly['Mois'],
+        y=monthly['Doses commandées'],
+        name='Doses commandées',
+        marker_color='#4c8dc1',
+        customdata=doses_per_patient,
+        hovertemplate='%{x|%m/%Y} : %{y} doses (%{customdata} par patient)<extra></extra>',
+    ))
+    fig.add_trace(go.Scatter(
+        x=monthly['Mois'],
+        y=monthly['Patients reçus'],
+        name='Patients reçus',
+        mode='lines+markers',
+        marker=dict(size=5, color='#d62728'),
+        line=dict(width=2),
+        yaxis='y2',
+        hovertemplate='%{x|%m/%Y} : %{y} patients<extra></extra>',
+    ))
+    fig.update_layout(
+        title_text=f'Doses de vaccin commandées et patients reçus par mois ({ctar_name})',
+        xaxis=dict(title='Mois', rangeslider=dict(visible=True)),
+        yaxis=dict(title='Doses commandées', rangemode='tozero'),
+        yaxis2=dict(title='Patients reçus', overlaying='y', side='right', rangemode='tozero', showgrid=False),
+        legend=dict(orientation='h', y=1.1),
+        height=600,
+    )
+    return fig
+
+
+def figure_size(fig):
+    # Taille (en octets) du graphique sérialisé, tel qu'envoyé au navigateur
+    return len(fig.to_json().encode())
+
+
+def webgl(fig):
+    # Nuages de points et courbes tracés en WebGL (les barres et camemberts n'ont pas d'équivalent)
+    traces = []
+    for trace in fig.data:
+        if trace.type == 'scatter':
+            properties = trace.to_plotly_json()
+            properties.pop('type')
+            trace = go.Scattergl(properties)
+        traces.append(trace)
+    fig.data = []
+    fig.add_traces(traces)
+    return fig
+
+
+def compact_hover(fig):
+    # Infobulles courtes : plotly express répète tous les libellés dans le modèle de chaque série
+    fig.update_traces(hovertemplate='%{x} : %{y}<extra>%{fullData.name}</extra>',
+                      selector=lambda trace: trace.type in ('bar', 'scatter', 'scattergl'))
+    return fig
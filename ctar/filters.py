@@ -0,0 +1,196 @@
+import copy
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+from ctar.cube import get_count_cube
+from ctar.ingestion import Dataset
+from ctar.preparation import valid_rows
+from ctar.profiling import stage
+from ctar.sql_engine import SqlView, duckdb_available, get_sql_engine
+
+# Nombre de sélections (CTARs, années) gardées en mémoire par jeu de données
+MEMO_SIZE = 16
+
+# Moteurs des agrégations : cube précalculé (ctar.cube), lignes pandas, SQL embarqué (ctar.sql_engine)
+ENGINES = ['cube', 'pandas', 'duckdb']
+
+# Moteur utilisé par défaut par les pages (modifiable dans la barre latérale)
+DEFAULT_ENGINE = os.environ.get("CTAR_ENGINE", "cube")
+
+
+class FilterIndex:
+    # Positions des lignes de chaque CTAR et de chaque année, construites une fois par jeu de données
+
+    def __init__(self, frame):
+        self.frame = frame
+
+        # Ne pas comptabiliser les lignes sans 'id_ctar' (CTAR périphériques inconnues) ni date de consultation
+        positions = valid_rows(frame)
+        years = frame['Annee'].to_numpy(dtype='float64', na_value=np.nan)
+
+        self.ctar_rows = self._group_positions(frame['id_ctar'].iloc[positions], positions)
+        self.year_rows = self._group_positions(years[positions].astype(int), positions)
+        self.all_rows = positions
+
+        self.ctars = list(self.ctar_rows.keys())
+        self.years = sorted(self.year_rows.keys())
+
+        self._memo = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _group_positions(values, positions):
+        # {valeur: positions triées}, dans l'ordre de première apparition
+        codes, uniques = pd.factorize(values)
+        order = np.argsort(codes, kind='stable')
+        bounds = np.cumsum(np.bincount(codes, minlength=len(uniques)))[:-1]
+        groups = np.split(positions[order], bounds)
+        return dict(zip(pd.Index(uniques).tolist(), groups))
+
+    def extended(self, frame, added):
+        # Index de frame dont les added dernières lignes viennent d'être ajoutées : seules celles-ci sont lues
+        start = len(frame) - added
+        rows = frame.iloc[start:]
+        relative = valid_rows(rows)
+        positions = relative + start
+        years = rows['Annee'].to_numpy(dtype='float64', na_value=np.nan)[relative]
+
+        index = copy.copy(self)
+        index.frame = frame
+        index.ctar_rows = self._merge_groups(self.ctar_rows, self._group_positions(rows['id_ctar'].iloc[relative], positions))
+        index.year_rows = self._merge_groups(self.year_rows, self._group_positions(years.astype(int), positions))
+        index.all_rows = np.concatenate([self.all_rows, positions])
+
+        index.ctars = list(index.ctar_rows.keys())
+        index.years = sorted(index.year_rows.keys())
+
+        index._memo = OrderedDict()
+        index._lock = threading.Lock()
+        return index
+
+    @staticmethod
+    def _merge_groups(groups, added):
+        # Les positions ajoutées suivent toutes les anciennes : les groupes restent triés
+        merged = dict(groups)
+        for key, positions in added.items():
+            merged[key] = np.concatenate([merged[key], positions]) if key in merged else positions
+        return merged
+
+    def _union(self, rows, keys):
+        if keys is None:
+            return self.all_rows
+        parts = [rows[key] for key in keys if key in rows]
+        if not parts:
+            return np.empty(0, dtype=np.int64)
+        return np.sort(np.concatenate(parts))
+
+    def positions(self, ctars=None, years=None):
+        ctar_positions = self._union(self.ctar_rows, ctars)
+        if years is None:
+            return ctar_positions
+        return np.intersect1d(ctar_positions, self._union(self.year_rows, years), assume_unique=True)
+
+    def select(self, ctars=None, years=None):
+        # Vue filtrée mémorisée par sélection : revenir sur une page avec la même sélection est immédiat
+        key = (
+            None if ctars is None else tuple(sorted(ctars)),
+            None if years is None else tuple(sorted(years)),
+        )
+        with self._lock:
+            view = self._memo.get(key)
+            if view is not None:
+                self._memo.move_to_end(key)
+                return view
+
+        view = self.frame.take(self.positions(key[0], key[1]))
+
+        with self._lock:
+            self._memo[key] = view
+            while len(self._memo) > MEMO_SIZE:
+                self._memo.popitem(last=False)
+        return view
+
+
+class SqlSelector:
+    # Sélection exprimée en requête SQL et non en positions de lignes
+
+    def __init__(self, engine):
+        self.engine = engine
+
+    def select(self, ctars=None, years=None):
+        return SqlView(self.engine, ctars, years, valid_only=True)
+
+
+def get_filter_index(dataset):
+    return dataset.derived('filter_index', lambda d: FilterIndex(d.frame))
+
+
+def selected_engine():
+    # Choix du moteur des agrégations, pour comparer les résultats et les temps sur les mêmes données
+    engines = [engine for engine in ENGINES if engine != 'duckdb' or duckdb_available()]
+    default = DEFAULT_ENGINE if DEFAULT_ENGINE in engines else engines[0]
+    return st.sidebar.radio("Moteur de calcul", engines, index=engines.index(default))
+
+
+def ctar_year_filter(dataset, with_years=True, aggregated=False):
+    # Sélection des CTARs périphériques (et des années) ; renvoie None tant que la sélection est incomplète.
+    # Un jeu lu en mode flux (ctar.streaming) se filtre lui-même et renvoie une vue sur ses agrégats.
+    # Une page qui sait tracer à partir de comptages (aggregated=True) reçoit une vue du moteur choisi
+    # (ctar.views.AggregateView) au lieu des lignes filtrées.
+    if isinstance(dataset, Dataset):
+        index = selector = get_filter_index(dataset)
+        engine = selected_engine() if aggregated else 'pandas'
+        if engine == 'cube':
+            selector = get_count_cube(dataset)
+        elif engine == 'duckdb':
+            selector = SqlSelector(get_sql_engine(dataset))
+    else:
+        index = selector = dataset
+        engine = 'flux'
+    # Moteur de la sélection, repris par selection_key : chaque moteur a ses propres graphiques gardés
+    st.session_state['selection_engine'] = engine
+
+    # Analyse de l'ensemble des CTAR périphériques
+    all_ctars_selected = st.checkbox("Sélectionnez tous les CTARs", key='all_ctars')
+
+    selected_year = None
+    if with_years:
+        selected_year = st.multiselect(
+                "Sélectionnez une ou plusieurs année(s)",
+                options=index.years, key='years')
+
+    if not all_ctars_selected:
+        selected_ctars = st.multiselect(
+            "Sélectionnez un ou plusieurs CTARs",
+            options=index.ctars, key='ctars')
+        if not selected_ctars or (with_years and not selected_year):
+            if with_years:
+                st.warning("Veuillez sélectionner au moins un CTAR et une année pour afficher l'analyse.")
+            else:
+                st.warning("Veuillez sélectionner au moins un CTAR pour afficher l'analyse.")
+            return None
+        with stage('sélection'):
+            return selector.select(selected_ctars, selected_year)
+
+    if with_years and not selected_year:
+        st.warning("Veuillez sélectionner au moins une année pour afficher l'analyse.")
+        return None
+    with stage('sélection'):
+        return selector.select(None, selected_year)
+
+
+def selection_key(dataset, with_years=True):
+    # Jeu de données, sélection courante de ctar_year_filter (CTARs, années) et moteur de calcul, pour les résultats
+    # gardés d'une exécution à l'autre ; triée comme dans FilterIndex.select, pour que deux sessions qui choisissent
+    # les mêmes CTARs partagent leurs résultats
+    if st.session_state.get('all_ctars'):
+        ctars = None
+    else:
+        ctars = tuple(sorted(st.session_state.get('ctars') or ()))
+    years = tuple(sorted(st.session_state.get('years') or ())) if with_years else None
+    return dataset.fingerprint, ctars, years, st.session_state.get('selection_engine')
@@ -0,0 +1,162 @@
+import unicodedata
+
+import numpy as np
+import pandas as pd
+
+from ctar.cube import count_table
+from ctar.ingestion import Dataset
+from ctar.preparation import valid_rows
+from ctar.schema import PERIPHERIQUE_CONTACTS, is_checked
+
+
+# Position (latitude, longitude) de la ville de chaque CTAR, d'après le nom de la colonne 'ctar' des exports
+CTAR_LOCATIONS = {
+    'Antananarivo': (-18.8792, 47.5079),
+    'Antsohihy': (-14.8796, 47.9875),
+    'Morondava': (-20.2847, 44.2794),
+    'Vangaindrano': (-23.3500, 47.6000),
+    'Fianarantsoa': (-21.4536, 47.0858),
+    'Toamasina': (-18.1492, 49.4023),
+    'Mahajanga': (-15.7167, 46.3167),
+    'Toliara': (-23.3500, 43.6667),
+    'Antsiranana': (-12.2787, 49.2917),
+    'Tolagnaro': (-25.0316, 46.9856),
+    'Ambatondrazaka': (-17.8333, 48.4167),
+    'Manakara': (-22.1500, 48.0000),
+    'Maroantsetra': (-15.4333, 49.7333),
+    'Sambava': (-14.2667, 50.1667),
+    'Ambanja': (-13.6833, 48.4500),
+    'Nosy Be': (-13.4000, 48.2667),
+    'Antsirabe': (-19.8659, 47.0333),
+    'Ambositra': (-20.5333, 47.2500),
+    'Ihosy': (-22.4000, 46.1167),
+    'Farafangana': (-22.8167, 47.8333),
+    'Moramanga': (-18.9333, 48.2000),
+    'Fenoarivo Atsinanana': (-17.3833, 49.4167),
+    'Mananjary': (-21.2167, 48.3333),
+    'Miandrivazo': (-19.5167, 45.4667),
+    'Maintirano': (-18.0667, 44.0167),
+    'Tsiroanomandidy': (-18.7667, 46.0500),
+    'Ambovombe': (-25.1667, 46.0833),
+    'Mandritsara': (-15.8333, 48.8167),
+    'Antalaha': (-14.9003, 50.2788),
+    'Maevatanana': (-16.9500, 46.8333),
+    'Vohemar': (-13.3667, 50.0000),
+    'Betroka': (-23.2667, 46.1000),
+    'Ambalavao': (-21.8333, 46.9333),
+    'Morombe': (-21.7500, 43.3667),
+    'Sainte-Marie': (-17.0833, 49.8167),
+    'Marovoay': (-16.1000, 46.6333),
+    'Port-Bergé': (-15.5667, 47.6667),
+}
+
+# Autres écritures d'une même ville (noms normalisés)
+LOCATION_ALIASES = {
+    'ipm': 'Antananarivo',
+    'tana': 'Antananarivo',
+    'fort dauphin': 'Tolagnaro',
+    'tamatave': 'Toamasina',
+    'majunga': 'Mahajanga',
+    'tulear': 'Toliara',
+    'diego suarez': 'Antsiranana',
+    'hell ville': 'Nosy Be',
+    'fenerive est': 'Fenoarivo Atsinanana',
+    'iharana': 'Vohemar',
+    'ambodifotatra': 'Sainte-Marie',
+    'nosy boraha': 'Sainte-Marie',
+    'boriziny': 'Port-Bergé',
+}
+
+
+def normalized(name):
+    # 'CTAR Fort-Dauphin ' -> 'fort dauphin' (sans accents, casse, tirets ni préfixe 'CTAR')
+    text = unicodedata.normalize('NFKD', str(name)).encode('ascii', 'ignore').decode().lower()
+    text = ' '.join(text.replace('-', ' ').replace('_', ' ').split())
+    return text[5:] if text.startswith('ctar ') else text
+
+
+_LOCATIONS = {normalized(name): location for name, location in CTAR_LOCATIONS.items()}
+_LOCATIONS.update({alias: CTAR_LOCATIONS[name] for alias, name in LOCATION_ALIASES.items()})
+
+
+def locate(name):
+    # (latitude, longitude) du CTAR, ou None si la ville n'est pas connue
+    return _LOCATIONS.get(normalized(name))
+
+
+def ctar_names(dataset):
+    # id_ctar -> nom le plus fréquent de la colonne 'ctar' (CTARs sans nom absents : l'appelant garde son libellé)
+    frame = dataset.frame.take(valid_rows(dataset.frame))
+    if 'ctar' not in frame.columns:
+        return {}
+    names = frame.groupby('id_ctar', observed=True)['ctar'].agg(
+        lambda values: values.mode().iat[0] if values.notna().any() else None)
+    return {ctar: name for ctar, name in names.items() if isinstance(name, str)}
+
+
+# Agrégat de la carte : patients par (CTAR, année, nom du CTAR, espèce, morsure transdermique), calculé en une passe
+# sur les lignes (ou bloc par bloc en mode flux). Les indicateurs d'une sélection d'années n'en lisent que quelques
+# centaines de lignes.
+MAP_KEYS = ['id_ctar', 'Annee', 'ctar', 'espece', 'MT']
+
+# Nom ou espèce manquant, gardé dans l'agrégat pour que chaque patient soit compté
+UNKNOWN = 'Non renseigné'
+
+# Colonnes de ctar_volumes avant celles des espèces
+VOLUME_COLUMNS = ['id_ctar', 'CTAR', 'Latitude', 'Longitude', 'Patients', 'MT']
+
+
+def filled(series):
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        if UNKNOWN not in series.cat.categories:
+            series = series.cat.add_categories([UNKNOWN])
+        return series.fillna(UNKNOWN)
+    # astype(str) écrit 'nan' pour les valeurs manquantes avant pandas 3 : elles sont remplacées d'après series
+    return series.astype(str).where(series.notna(), UNKNOWN)
+
+
+def map_frame(frame):
+    # Colonnes de MAP_KEYS des lignes valides de frame (MT : case 'type_contact___5' cochée)
+    mt_column = PERIPHERIQUE_CONTACTS['MT']
+    return pd.DataFrame({
+        'id_ctar': frame['id_ctar'],
+        'Annee': frame['Annee'],
+        'ctar': filled(frame['ctar']) if 'ctar' in frame.columns else UNKNOWN,
+        'espece': filled(frame['espece']) if 'espece' in frame.columns else UNKNOWN,
+        'MT': is_checked(frame[mt_column]) if mt_column in frame.columns else False,
+    }, index=frame.index)
+
+
+def map_counts(dataset):
+    # Agrégat de la carte, gardé avec le jeu de données (agrégats du mode flux : table 'carte')
+    if isinstance(dataset, Dataset):
+        return dataset.derived('map_counts', lambda d: count_table(map_frame(d.frame.take(valid_rows(d.frame))), MAP_KEYS))
+    counts = dataset.tables['carte'].dropna(subset=MAP_KEYS)
+    return counts.groupby(MAP_KEYS, observed=True)['count'].sum().reset_index()
+
+
+def ctar_volumes(counts, years=None):
+    # Une ligne par CTAR pour les années choisies (toutes si years est None) : nom, position, patients,
+    # part des morsures transdermiques et nombre de patients par espèce (une colonne par espèce)
+    if years is not None:
+        counts = counts[counts['Annee'].isin(years).to_numpy()]
+    counts = counts.assign(ctar=counts['ctar'].astype(object), espece=counts['espece'].astype(object))
+
+    # Nom le plus fréquent de chaque CTAR (un nom manquant seulement à défaut d'un autre)
+    named = counts.assign(known=counts['ctar'] != UNKNOWN).groupby(['id_ctar', 'known', 'ctar'])['count'].sum()
+    names = named.reset_index().sort_values(['id_ctar', 'known', 'count'], ascending=[True, False, False], kind='stable')
+    names = names.drop_duplicates('id_ctar').set_index('id_ctar')['ctar']
+
+    volumes = counts.groupby('id_ctar')['count'].sum().rename('Patients').to_frame()
+    mt = counts[counts['MT'].to_numpy(dtype=bool)].groupby('id_ctar')['count'].sum()
+    volumes['MT'] = mt.reindex(volumes.index, fill_value=0) / volumes['Patients']
+    volumes['CTAR'] = names.reindex(volumes.index)
+
+    positions = [locate(name) for name in volumes['CTAR']]
+    volumes['Latitude'] = [position[0] if position else np.nan for position in positions]
+    volumes['Longitude'] = [position[1] if position else np.nan for position in positions]
+
+    species = counts.pivot_table(index='id_ctar', columns='espece', values='count', aggfunc='sum', fill_value=0)
+    species = species[species.sum().sort_values(ascending=False).index]
+    volumes = volumes.reset_index()[VOLUME_COLUMNS].join(species, on='id_ctar')
+    return volumes.sort_values('Patients', ascending=False, ignore_index=True)
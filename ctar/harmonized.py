@@ -0,0 +1,147 @@
+import hashlib
+
+import numpy as np
+import pandas as pd
+
+from ctar.analytics import unique_patients
+from ctar.append import concat_rows
+from ctar.ingestion import Dataset, cached_dataset, keep_dataset
+from ctar.profiling import stage
+from ctar.schema import (IPM_BODY_PARTS, IPM_CTAR_ID, IPM_CTAR_NAME, IPM_LESION_COLUMNS, PERIPHERIQUE_BODY_PART_COLUMNS,
+                         PERIPHERIQUE_BODY_PARTS, PERIPHERIQUE_CONTACT_COLUMNS, PERIPHERIQUE_CONTACTS)
+
+
+# Schéma harmonisé : les patients de la BDD IPM (MS Access) et des CTAR périphériques (RedCap) dans une seule
+# table, avec les noms et le codage de l'export RedCap et une colonne 'source'. Les pages, le cube et le moteur
+# SQL l'analysent comme un export périphérique : chaque indicateur national est une seule agrégation.
+
+# Nom du jeu de données national dans la liste des fichiers des pages
+NATIONAL_FILE = "Données nationales (IPM + CTAR périphériques)"
+
+SOURCE_DTYPE = pd.CategoricalDtype(['ipm', 'peripherique'])
+
+HARMONIZED_COLUMNS = [
+    'source', 'record_id', 'id_ctar', 'ctar', 'date_de_consultation', 'Annee', 'mois', 'season', 'Weekday', 'Hour',
+    'age', 'Age Group', 'sexe', 'espece', 'dev_carac', 'lavage_savon', 'nb_lesion',
+    *PERIPHERIQUE_BODY_PART_COLUMNS, *PERIPHERIQUE_CONTACT_COLUMNS,
+]
+
+# Colonne de l'export IPM -> colonne harmonisée (les colonnes de même nom sont reprises telles quelles)
+IPM_COLUMNS = {
+    'ref_mordu': 'record_id',
+    'dat_consu': 'date_de_consultation',
+    'animal': 'espece',
+    'typanim': 'dev_carac',
+    'savon': 'lavage_savon',
+}
+
+# Les cases à cocher RedCap ne relient pas un type de contact à une partie du corps : un patient IPM harmonisé
+# compte pour chaque partie touchée avec chacun de ses types de contact (ex. MT à la main et LPS au pied ->
+# MT et LPS à la main et au pied). Avertissement des graphiques par partie du corps et type de contact.
+IPM_CONTACTS_CAVEAT = (
+    "Données nationales : pour les patients de l'IPM, chaque partie du corps touchée est comptée avec chacun des "
+    "types de contact du patient (cases à cocher RedCap), alors que la BDD IPM donne le contact de chaque partie. "
+    "Les expositions de l'IPM sont donc surestimées ici ; sélectionnez la BDD IPM pour ses comptes exacts."
+)
+
+# typanim (BDD IPM) -> mode de vie 'statut-état' de dev_carac
+IPM_DEV_CARAC = {
+    'A': 'Sauvage',
+    'B': 'Errant-Disparu',
+    'C': 'Errant-Vivant',
+    'D': 'Domestique-Vivant',
+    'E': 'Domestique-Disparu',
+    'F': 'Domestique-Abattu',
+    'G': 'Domestique-Mort',
+}
+
+
+def checkbox_values(mask, like):
+    # Case à cocher codée comme la colonne périphérique like (0/1 ou 'OUI'/'NON')
+    if like is not None and not pd.api.types.is_numeric_dtype(like.dtype):
+        return np.where(mask, 'OUI', 'NON')
+    return mask.astype('int8')
+
+
+def harmonize_ipm(frame, like):
+    # Patients IPM (1 ref_mordu = 1 patient) dans le schéma harmonisé ; like : table périphérique harmonisée
+    patients = unique_patients(frame) if 'ref_mordu' in frame.columns else frame
+    table = pd.DataFrame(index=pd.RangeIndex(len(patients)))
+    table['source'] = pd.Categorical(['ipm'] * len(patients), dtype=SOURCE_DTYPE)
+    table['id_ctar'] = IPM_CTAR_ID
+    table['ctar'] = IPM_CTAR_NAME
+
+    for column in patients.columns:
+        target = IPM_COLUMNS.get(column, column)
+        if target in HARMONIZED_COLUMNS and target not in table.columns:
+            table[target] = patients[column].array
+    if 'dev_carac' in table.columns:
+        table['dev_carac'] = table['dev_carac'].astype(object).map(IPM_DEV_CARAC).astype('category')
+
+    # Nombre total de lésions : somme des parties du corps renseignées
+    lesion_columns = [column for column in IPM_LESION_COLUMNS if column in patients.columns]
+    if lesion_columns:
+        table['nb_lesion'] = patients[lesion_columns].astype('float64').sum(axis=1, min_count=1).round().astype('Int16').array
+
+    # Type de contact par partie du corps -> cases à cocher RedCap (partie touchée, types de contact du patient,
+    # voir IPM_CONTACTS_CAVEAT) ; les parties et types sans équivalent (GS, 'Autres'...) restent décochés
+    contact_values = {part: patients[column].astype(object).to_numpy()
+                      for part, column in IPM_BODY_PARTS.items() if column in patients.columns}
+    checked = {}
+    for part, column in PERIPHERIQUE_BODY_PARTS.items():
+        if part in contact_values:
+            checked[column] = pd.notna(contact_values[part])
+    for contact, column in PERIPHERIQUE_CONTACTS.items():
+        if contact != column and contact_values:
+            checked[column] = np.logical_or.reduce([values == contact for values in contact_values.values()])
+    for column in PERIPHERIQUE_BODY_PART_COLUMNS + PERIPHERIQUE_CONTACT_COLUMNS:
+        table[column] = checkbox_values(checked.get(column, np.zeros(len(table), dtype=bool)), like.get(column))
+
+    # Colonnes absentes de l'export IPM : valeurs manquantes du type de la colonne périphérique
+    for column in HARMONIZED_COLUMNS:
+        if column not in table.columns:
+            table[column] = pd.Series(index=table.index, dtype=like[column].dtype if column in like.columns else 'float64')
+    return table[HARMONIZED_COLUMNS]
+
+
+def includes_ipm(dataset, ctars):
+    # Sélection (ctars : ctar.filters.selection_key, None pour tous les CTARs) avec des patients IPM harmonisés
+    return dataset.source == 'national' and (ctars is None or IPM_CTAR_ID in ctars)
+
+
+def harmonize_peripherique(frame):
+    table = frame.reset_index(drop=True).reindex(columns=HARMONIZED_COLUMNS)
+    table['source'] = pd.Categorical(['peripherique'] * len(table), dtype=SOURCE_DTYPE)
+    return table
+
+
+def harmonized_frame(ipm, peripherique):
+    # Patients des deux exports, périphériques puis IPM, étiquetés 0..n-1
+    peripherique = harmonize_peripherique(peripherique)
+    ipm = harmonize_ipm(ipm, peripherique)
+    ipm = ipm.set_axis(pd.RangeIndex(len(peripherique), len(peripherique) + len(ipm)))
+    return concat_rows(peripherique, ipm)
+
+
+def national_dataset(ipm, peripherique):
+    # Jeu de données national, préparé une fois pour chaque paire d'exports et partagé comme les autres
+    fingerprint = hashlib.sha256(f'national:{ipm.fingerprint}:{peripherique.fingerprint}'.encode()).hexdigest()
+
+    dataset = cached_dataset(fingerprint)
+    if dataset is not None:
+        return dataset
+
+    with stage('harmonisation', len(ipm.frame) + len(peripherique.frame)):
+        frame = harmonized_frame(ipm.frame, peripherique.frame)
+    dataset = Dataset(
+        name=NATIONAL_FILE,
+        fingerprint=fingerprint,
+        source='national',
+        frame=frame,
+        nbytes=int(frame.memory_usage(deep=True).sum()),
+        # Le typage et les corrections sont ceux des deux exports (rapportés pour chacun d'eux)
+        schema_report=peripherique.schema_report.iloc[:0],
+        corrections=peripherique.corrections.iloc[:0],
+        built_from=(ipm.fingerprint, peripherique.fingerprint),
+    )
+    return keep_dataset(dataset)
@@ -0,0 +1,224 @@
+import hashlib
+import io
+import os
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+
+import pandas as pd
+
+from ctar.corrections import apply_corrections, corrections_for, with_unparsed_dates
+from ctar.preparation import DATE_COLUMNS, prepare
+from ctar.profiling import stage
+from ctar.schema import apply_schema, schema_for
+from ctar.store import STORED_DERIVED, get_dataset_store
+
+
+# Taille maximale (en Mo) des jeux de données gardés en mémoire par le serveur
+CACHE_MAX_MB = int(os.environ.get("CTAR_CACHE_MAX_MB", "1024"))
+
+# Préfixes des exports reconnus par l'application
+SOURCES = {
+    "CTAR_ipmdata": "ipm",
+    "CTAR_peripheriquedata": "peripherique",
+    "CTAR_commandes": "commandes",
+}
+
+
+@dataclass(frozen=True)
+class Dataset:
+    # Jeu de données chargé une seule fois et partagé entre les pages et les sessions.
+    # Le DataFrame 'frame' ne doit jamais être modifié en place.
+    name: str
+    fingerprint: str
+    source: str
+    frame: pd.DataFrame
+    nbytes: int
+    # Mémoire gagnée par colonne grâce au schéma (voir ctar.schema)
+    schema_report: pd.DataFrame
+    # Valeurs modifiées par les règles de correction à la lecture (voir ctar.corrections)
+    corrections: pd.DataFrame
+    # Empreintes des jeux dont celui-ci est construit (ajout d'enregistrements, données nationales) ; vide pour
+    # un export lu tel quel. Un jeu construit est refait par la page d'accueil à partir de ces jeux.
+    built_from: tuple = ()
+    # Structures calculées à la demande (index, agrégats...) et partagées avec le jeu de données
+    _derived: dict = field(default_factory=dict, init=False, repr=False, compare=False)
+    _lock: threading.Lock = field(default_factory=threading.Lock, init=False, repr=False, compare=False)
+
+    def derived(self, key, build):
+        # build(dataset) n'est appelé qu'une fois par clé, même avec plusieurs sessions simultanées
+        with self._lock:
+            if key not in self._derived:
+                self._derived[key] = self._load_or_build(key, build)
+            return self._derived[key]
+
+    def _load_or_build(self, key, build):
+        # Les agrégats coûteux sont aussi gardés sur disque avec le jeu de données (ctar.store)
+        store = get_dataset_store() if key in STORED_DERIVED else None
+        value = store.load_derived(self.fingerprint, key) if store is not None else None
+        if value is None:
+            with stage(key, len(self.frame)):
+                value = build(self)
+            if store is not None:
+                store.save_derived(self.fingerprint, key, value)
+        return value
+
+    def built(self, key):
+        # Structure dérivée déjà calculée (None si aucune page ne l'a encore demandée)
+        with self._lock:
+            return self._derived.get(key)
+
+
+def detect_source(file_name):
+    # 'ipm', 'peripherique' ou None selon le préfixe du nom de fichier
+    for prefix, source in SOURCES.items():
+        if file_name.startswith(prefix):
+            return source
+    return None
+
+
+def fingerprint_bytes(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def optimized_fingerprint(fingerprint):
+    # Empreinte de la version aux types optimisés d'un jeu de données (ctar.memory)
+    return hashlib.sha256(f'optimise:{fingerprint}'.encode()).hexdigest()
+
+
+class DatasetCache:
+    # Cache LRU borné par la mémoire totale occupée par les DataFrames
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __contains__(self, fingerprint):
+        with self._lock:
+            return fingerprint in self._entries
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    def get(self, fingerprint):
+        with self._lock:
+            dataset = self._entries.get(fingerprint)
+            if dataset is not None:
+                self._entries.move_to_end(fingerprint)
+            return dataset
+
+    def put(self, dataset):
+        with self._lock:
+            # Un autre utilisateur a pu charger le même fichier entre-temps
+            existing = self._entries.get(dataset.fingerprint)
+            if existing is not None:
+                self._entries.move_to_end(dataset.fingerprint)
+                return existing
+
+            self._entries[dataset.fingerprint] = dataset
+            self.total_bytes += dataset.nbytes
+
+            # Libérer les jeux les moins récemment utilisés (on garde toujours le dernier)
+            while self.total_bytes > self.max_bytes and len(self._entries) > 1:
+                _, evicted = self._entries.popitem(last=False)
+                self.total_bytes -= evicted.nbytes
+            return dataset
+
+    def discard(self, fingerprint):
+        # Jeu remplacé (version optimisée...) : libéré dès que plus aucune session ne le référence
+        with self._lock:
+            dataset = self._entries.pop(fingerprint, None)
+            if dataset is not None:
+                self.total_bytes -= dataset.nbytes
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.total_bytes = 0
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_dataset_cache():
+    # Cache unique pour tout le processus : toutes les sessions le partagent
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = DatasetCache(CACHE_MAX_MB * 1024 ** 2)
+        return _cache
+
+
+def cached_dataset(fingerprint):
+    # Jeu déjà préparé : gardé en mémoire, sinon enregistré sur disque par une session précédente
+    cache = get_dataset_cache()
+    dataset = cache.get(fingerprint)
+    if dataset is None:
+        store = get_dataset_store()
+        if store is not None:
+            dataset = store.load(fingerprint, Dataset)
+            if dataset is not None:
+                dataset = cache.put(dataset)
+    return dataset
+
+
+def keep_dataset(dataset):
+    # Jeu nouvellement préparé : partagé en mémoire et enregistré sur disque
+    store = get_dataset_store()
+    if store is not None:
+        store.save(dataset)
+    return get_dataset_cache().put(dataset)
+
+
+def parse_csv(data):
+    with stage('lecture du CSV') as step:
+        frame = pd.read_csv(io.BytesIO(data), encoding='ISO-8859-1', sep=',')
+        step.add_rows(len(frame))
+    return frame
+
+
+def read_export(data, source):
+    # (lignes lues, corrigées, typées et préparées ; audit des corrections et des dates illisibles ; rapport du schéma)
+    frame = parse_csv(data)
+    with stage('corrections', len(frame)):
+        frame, corrections = apply_corrections(frame, corrections_for(source))
+    with stage('schéma', len(frame)):
+        frame, schema_report = apply_schema(frame, schema_for(source))
+    date_column = DATE_COLUMNS[source][0] if source in DATE_COLUMNS else None
+    raw_dates = frame[date_column] if date_column in frame.columns else None
+    with stage('préparation', len(frame)):
+        frame = prepare(frame, source)
+    if raw_dates is not None:
+        corrections = with_unparsed_dates(corrections, raw_dates, frame[date_column])
+    return frame, corrections, schema_report
+
+
+def load_bytes(name, data):
+    fingerprint = fingerprint_bytes(data)
+
+    # Un fichier dont les types ont été optimisés est rouvert dans sa version optimisée
+    dataset = cached_dataset(optimized_fingerprint(fingerprint)) or cached_dataset(fingerprint)
+    if dataset is not None:
+        return dataset
+
+    source = detect_source(name)
+    frame, corrections, schema_report = read_export(data, source)
+    dataset = Dataset(
+        name=name,
+        fingerprint=fingerprint,
+        source=source,
+        frame=frame,
+        nbytes=int(frame.memory_usage(deep=True).sum()),
+        schema_report=schema_report,
+        corrections=corrections,
+    )
+    return keep_dataset(dataset)
+
+
+def load_uploaded_file(uploaded_file):
+    # Le contenu est haché : un fichier déjà lu (même renommé) n'est jamais relu
+    return load_bytes(uploaded_file.name, uploaded_file.getvalue())
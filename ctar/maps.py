@@ -0,0 +1,58 @@
+import html
+
+import branca.colormap
+import folium
+import numpy as np
+
+from ctar.geography import VOLUME_COLUMNS
+
+# Centre et zoom de la carte de Madagascar
+MAP_CENTER = (-18.9, 46.9)
+MAP_ZOOM = 5
+
+# Rayon (en pixels) des cercles : surface proportionnelle au nombre de patients
+MIN_RADIUS = 4
+MAX_RADIUS = 28
+
+# Espèces détaillées dans la fenêtre de chaque CTAR
+POPUP_SPECIES = 5
+
+MT_COLORS = ['#fee8c8', '#fdbb84', '#e34a33', '#7f0000']
+
+
+def popup_html(row, species):
+    # Fenêtre d'un CTAR : patients, part des morsures transdermiques et répartition par espèce
+    lines = [f"<b>{html.escape(str(row['CTAR']))}</b>",
+             f"{int(row['Patients'])} patients",
+             f"Morsures transdermiques : {row['MT']:.0%}"]
+    shares = sorted(((row[name] / row['Patients'], name) for name in species if row[name] > 0), reverse=True)
+    lines += [f"{html.escape(str(name))} : {share:.0%}" for share, name in shares[:POPUP_SPECIES]]
+    return '<br>'.join(lines)
+
+
+def volume_map(volumes):
+    # Carte des CTAR placés (ctar.geography.ctar_volumes) : taille selon le nombre de patients,
+    # couleur selon la part des morsures transdermiques. Renvoie la page HTML complète de la carte.
+    species = [column for column in volumes.columns if column not in VOLUME_COLUMNS]
+    placed = volumes.dropna(subset=['Latitude', 'Longitude'])
+
+    m = folium.Map(location=MAP_CENTER, zoom_start=MAP_ZOOM, tiles='OpenStreetMap')
+    colormap = branca.colormap.LinearColormap(MT_COLORS, vmin=0, vmax=max(float(placed['MT'].max()), 0.01))
+    colormap.caption = 'Part des morsures transdermiques (MT)'
+    colormap.add_to(m)
+
+    largest = max(int(placed['Patients'].max()), 1)
+    for _, row in placed.iterrows():
+        radius = MIN_RADIUS + (MAX_RADIUS - MIN_RADIUS) * np.sqrt(row['Patients'] / largest)
+        folium.CircleMarker(
+            location=(row['Latitude'], row['Longitude']),
+            radius=float(radius),
+            color='#444444',
+            weight=1,
+            fill=True,
+            fill_color=colormap(row['MT']),
+            fill_opacity=0.8,
+            tooltip=html.escape(f"{row['CTAR']} : {int(row['Patients'])} patients"),
+            popup=folium.Popup(popup_html(row, species), max_width=260),
+        ).add_to(m)
+    return m.get_root().render()
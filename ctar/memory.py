@@ -0,0 +1,153 @@
+import dataclasses
+
+import numpy as np
+import pandas as pd
+
+from ctar.ingestion import get_dataset_cache, keep_dataset, optimized_fingerprint
+from ctar.preparation import derived_columns
+from ctar.schema import MAX_CATEGORY_RATIO
+from ctar.store import get_dataset_store
+
+# Texte en Arrow optionnel : sans pyarrow, seules les catégories et les entiers réduits sont proposés
+try:
+    import pyarrow
+except ImportError:
+    pyarrow = None
+
+
+# Mémoire occupée par chaque colonne d'un jeu de données, et conversions de type sans perte qui la réduiraient :
+# catégorie (peu de valeurs distinctes), entier plus petit, texte stocké en Arrow. Le gain de chaque conversion
+# est mesuré en l'appliquant à la colonne.
+
+MEMORY_COLUMNS = ['Colonne', 'Type', 'Octets', 'Colonne dérivée', 'Conversion', 'Type proposé', 'Octets après', 'Octets gagnés']
+
+CATEGORY = 'catégorie'
+INTEGER = 'entier réduit'
+ARROW_STRING = 'texte Arrow'
+
+INTEGER_TYPES = ['int8', 'int16', 'int32', 'int64']
+
+
+def arrow_string_dtype():
+    # Texte Arrow aux valeurs manquantes NaN, comme les colonnes texte de l'export (None si indisponible)
+    if pyarrow is None:
+        return None
+    try:
+        return pd.StringDtype('pyarrow', na_value=np.nan)
+    except TypeError:
+        # pandas < 2.3 : le même type s'appelle 'pyarrow_numpy' (absent avant pandas 2.1)
+        try:
+            return pd.StringDtype('pyarrow_numpy')
+        except ValueError:
+            return None
+
+
+ARROW_STRING_DTYPE = arrow_string_dtype()
+
+
+def column_bytes(series):
+    return int(series.memory_usage(deep=True, index=False))
+
+
+def smallest_integer(values, nullable):
+    # Plus petit type entier contenant toutes les valeurs (None si elles ne sont pas entières)
+    values = values.dropna()
+    if len(values) and not (values % 1 == 0).all():
+        return None
+    low, high = (values.min(), values.max()) if len(values) else (0, 0)
+    for dtype in INTEGER_TYPES:
+        info = np.iinfo(dtype)
+        if info.min <= low and high <= info.max:
+            return dtype.capitalize() if nullable else dtype
+    return None
+
+
+def conversions(series):
+    # (nom de la conversion, colonne convertie) possibles pour series, sans perte de valeur
+    dtype = series.dtype
+    if isinstance(dtype, pd.CategoricalDtype) or pd.api.types.is_bool_dtype(dtype) or pd.api.types.is_datetime64_any_dtype(dtype):
+        return []
+
+    if pd.api.types.is_numeric_dtype(dtype):
+        values = pd.Series(series.to_numpy(dtype='float64', na_value=np.nan))
+        target = smallest_integer(values, nullable=bool(values.isna().any()))
+        if target is None or target == str(dtype).lower():
+            return []
+        return [(INTEGER, series.astype(target))]
+
+    if not (pd.api.types.is_string_dtype(dtype) and pd.api.types.infer_dtype(series, skipna=True) in ('string', 'empty')):
+        return []
+    found = []
+    if series.nunique(dropna=True) <= MAX_CATEGORY_RATIO * max(len(series), 1):
+        found.append((CATEGORY, series.astype('category')))
+    if ARROW_STRING_DTYPE is not None and dtype != ARROW_STRING_DTYPE:
+        found.append((ARROW_STRING, series.astype(ARROW_STRING_DTYPE)))
+    return found
+
+
+def best_conversion(series):
+    # (nom, colonne convertie) de la conversion qui gagne le plus de mémoire, ou None si aucune n'en gagne
+    current = column_bytes(series)
+    best = None
+    for name, candidate in conversions(series):
+        saved = current - column_bytes(candidate)
+        if saved > 0 and (best is None or saved > best[0]):
+            best = (saved, name, candidate)
+    return None if best is None else best[1:]
+
+
+def memory_report(dataset):
+    # Une ligne par colonne : mémoire occupée, colonne ajoutée par ctar.preparation ou non, meilleure conversion
+    def build(d):
+        derived = set(derived_columns(d.frame, d.source))
+        rows = []
+        for column in d.frame.columns:
+            series = d.frame[column]
+            before = column_bytes(series)
+            conversion = best_conversion(series)
+            after = column_bytes(conversion[1]) if conversion else before
+            rows.append((column, str(series.dtype), before, column in derived,
+                         conversion[0] if conversion else None, str(conversion[1].dtype) if conversion else None,
+                         after, before - after))
+        return pd.DataFrame(rows, columns=MEMORY_COLUMNS)
+    return dataset.derived('memory_report', build)
+
+
+def memory_summary(report):
+    # (octets des colonnes, dont colonnes dérivées, octets gagnés par les conversions proposées)
+    return (int(report['Octets'].sum()),
+            int(report.loc[report['Colonne dérivée'], 'Octets'].sum()),
+            int(report['Octets gagnés'].sum()))
+
+
+def converted(series, conversion, dtype):
+    # Conversion choisie par memory_report (nom, type proposé) appliquée à series
+    if conversion == ARROW_STRING:
+        return series.astype(ARROW_STRING_DTYPE)
+    return series.astype(dtype)
+
+
+def optimized_dataset(dataset):
+    # Nouveau jeu de données aux colonnes converties (dataset, partagé avec d'autres sessions, n'est pas modifié).
+    # Il remplace l'original dans le cache des jeux et sur disque : le même fichier est ensuite rouvert optimisé.
+    # Un jeu construit à partir d'autres (dataset.built_from) serait refait par la page d'accueil sans ses
+    # nouveaux types : ce sont les fichiers d'origine qu'il faut optimiser.
+    if dataset.built_from:
+        raise ValueError(f"{dataset.name} est construit à partir d'autres fichiers : optimisez les fichiers d'origine")
+    frame = dataset.frame.copy(deep=False)
+    report = memory_report(dataset)
+    for column, conversion, dtype in report.loc[report['Conversion'].notna(), ['Colonne', 'Conversion', 'Type proposé']].itertuples(index=False):
+        frame[column] = converted(frame[column], conversion, dtype)
+
+    optimized = dataclasses.replace(
+        dataset,
+        fingerprint=optimized_fingerprint(dataset.fingerprint),
+        frame=frame,
+        nbytes=int(frame.memory_usage(deep=True).sum()),
+    )
+    optimized = keep_dataset(optimized)
+    get_dataset_cache().discard(dataset.fingerprint)
+    store = get_dataset_store()
+    if store is not None:
+        store.discard(dataset.fingerprint)
+    return optimized
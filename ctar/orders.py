@@ -0,0 +1,65 @@
+import numpy as np
+import pandas as pd
+
+from ctar.cube import get_count_cube
+from ctar.ingestion import Dataset
+from ctar.preparation import valid_rows
+
+
+# Commandes de vaccin des CTAR périphériques (export CTAR_commandes* : id_ctar, date_commande, nb_doses)
+# rapprochées des patients reçus. Les deux côtés sont agrégés par (CTAR, année, mois) une fois par jeu de données,
+# indexés sur ces clés, puis joints sur l'index : aucune fusion ligne à ligne.
+
+MONTH_KEYS = ['id_ctar', 'Annee', 'mois']
+
+DOSES = 'Doses commandées'
+PATIENTS = 'Patients reçus'
+
+
+def month_index(table):
+    # Clés comparables d'un export à l'autre : id_ctar en flottant (1 et 1.0 désignent le même CTAR), année et mois entiers
+    return pd.MultiIndex.from_arrays([
+        table['id_ctar'].to_numpy(dtype='float64', na_value=np.nan),
+        table['Annee'].to_numpy(dtype='int64'),
+        table['mois'].to_numpy(dtype='int64'),
+    ], names=MONTH_KEYS)
+
+
+def monthly_orders(dataset):
+    # Doses commandées par (CTAR, année, mois), indexées et triées
+    def build(d):
+        orders = d.frame.take(valid_rows(d.frame)).dropna(subset=['mois'])
+        doses = pd.to_numeric(orders['nb_doses'], errors='coerce').fillna(0).to_numpy(dtype='int64')
+        return pd.Series(doses, index=month_index(orders), name=DOSES).groupby(level=MONTH_KEYS).sum()
+    return dataset.derived('monthly_orders', build)
+
+
+def monthly_patients(dataset):
+    # Patients reçus par (CTAR, année, mois) : lus dans le cube des pages, ou dans les agrégats du mode flux
+    if isinstance(dataset, Dataset):
+        counts = get_count_cube(dataset).select(None, None).counts(MONTH_KEYS)
+    else:
+        counts = dataset.tables['mois'].dropna(subset=MONTH_KEYS).groupby(MONTH_KEYS)['count'].sum().reset_index()
+    counts = counts.dropna(subset=MONTH_KEYS)
+    patients = pd.Series(counts['count'].to_numpy(dtype='int64'), index=month_index(counts), name=PATIENTS)
+    return patients.groupby(level=MONTH_KEYS).sum()
+
+
+def orders_patients(orders, patients):
+    # Doses commandées et patients reçus par (CTAR, année, mois), gardé avec les commandes pour chaque fichier de patients
+    # (agrégat des commandes obtenu avant : build est appelé sous le verrou du jeu des commandes)
+    doses = monthly_orders(orders)
+
+    def build(d):
+        table = pd.concat([doses, monthly_patients(patients)], axis=1).fillna(0).astype('int64')
+        return table.sort_index()
+    return orders.derived(f'orders_patients:{patients.fingerprint}', build)
+
+
+def ctar_months(table, ctar=None):
+    # Série mensuelle d'un CTAR (tous les CTARs si ctar est None), avec la date du premier jour du mois
+    if ctar is not None:
+        table = table.xs(ctar, level='id_ctar')
+    monthly = table.groupby(level=['Annee', 'mois']).sum().reset_index()
+    monthly['Mois'] = pd.to_datetime(pd.DataFrame({'year': monthly['Annee'], 'month': monthly['mois'], 'day': 1}))
+    return monthly
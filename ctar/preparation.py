@@ -0,0 +1,118 @@
+import numpy as np
+import pandas as pd
+
+from ctar.profiling import stage
+from ctar.seasons import MADAGASCAR_SEASONS, season_of
+
+
+# Colonne date de consultation (date de la commande pour les commandes de vaccin) et son format explicite pour chaque export
+DATE_COLUMNS = {
+    'ipm': ('dat_consu', '%d/%m/%Y'),
+    'peripherique': ('date_de_consultation', '%Y-%m-%d'),
+    'commandes': ('date_commande', '%Y-%m-%d'),
+}
+
+# Colonnes ajoutées par prepare aux lignes de l'export (la BDD IPM fournit déjà 'Annee' et 'mois')
+DERIVED_COLUMNS = ['Annee', 'mois', 'season', 'Weekday', 'Age Group', 'Hour']
+EXPORT_COLUMNS = {
+    'ipm': ['Annee', 'mois'],
+}
+
+# Les exports contiennent des dates de saisie erronées au-delà de cette année
+MAX_YEAR = 2024
+
+# Tranches d'âge (de 5 en 5)
+AGE_BINS = list(range(0, 105, 5)) + [float('inf')]
+AGE_LABELS = [f'{i}-{i+4}' for i in AGE_BINS[:-2]] + ['100+']
+
+HOUR_PATTERN = r'^\s*(\d{1,2}):(\d{2})'
+
+# Heure ajoutée à la date par certains exports (tableur : '2021-10-11 00:00:00', ISO : '2021-10-11T08:30')
+TIME_SUFFIX = r'[ T]\d{1,2}:\d{2}(?::\d{2})?$'
+
+
+def parse_dates(series, date_format):
+    # Format explicite (pas d'inférence) sur toute la valeur ; les dates invalides deviennent NaT.
+    # Seules les valeurs refusées sont relues sans leur heure (TIME_SUFFIX)
+    if pd.api.types.is_datetime64_any_dtype(series):
+        return series
+    dates = pd.to_datetime(series, format=date_format, errors='coerce', exact=True)
+    retry = dates.isna() & series.notna()
+    if retry.any() and (pd.api.types.is_string_dtype(series) or series.dtype == object):
+        series = series.mask(retry, series[retry].str.replace(TIME_SUFFIX, '', regex=True))
+        dates = pd.to_datetime(series, format=date_format, errors='coerce', exact=True)
+    return dates
+
+
+def age_groups(age):
+    return pd.cut(age, bins=AGE_BINS, labels=AGE_LABELS, right=False)
+
+
+def parse_hours(series):
+    # 'HH:MM' ou 'H:MM' -> heure entière (Int8 : entiers int8 et masque des valeurs manquantes) ;
+    # '00:00' est la valeur par défaut de la saisie, donc traitée comme manquante.
+    # Lecture vectorisée des caractères ; l'expression régulière ne sert qu'aux autres écritures (espaces...)
+    text = np.asarray(series.to_numpy(dtype=object, na_value=''), dtype='U5')
+    digits = text.view(np.uint32).reshape(len(text), 5) - ord('0')
+    is_digit = digits < 10
+    colon = ord(':') - ord('0')
+
+    two_digits = (digits[:, 2] == colon) & is_digit[:, [0, 1, 3, 4]].all(axis=1)
+    one_digit = (digits[:, 1] == colon) & is_digit[:, [0, 2, 3]].all(axis=1)
+    hours = np.where(two_digits, digits[:, 0] * 10 + digits[:, 1], digits[:, 0]).astype(np.int64)
+    minutes = np.where(two_digits, digits[:, 3] * 10 + digits[:, 4], digits[:, 2] * 10 + digits[:, 3]).astype(np.int64)
+    missing = ~(two_digits | one_digit)
+
+    others = np.flatnonzero(missing & (text != ''))
+    if len(others):
+        parts = series.iloc[others].astype('string').str.extract(HOUR_PATTERN)
+        other_hours = pd.to_numeric(parts[0], errors='coerce').to_numpy(dtype='float64', na_value=np.nan)
+        other_minutes = pd.to_numeric(parts[1], errors='coerce').to_numpy(dtype='float64', na_value=np.nan)
+        parsed = ~np.isnan(other_hours) & ~np.isnan(other_minutes)
+        hours[others[parsed]] = other_hours[parsed]
+        minutes[others[parsed]] = other_minutes[parsed]
+        missing[others[parsed]] = False
+
+    missing |= ((hours == 0) & (minutes == 0)) | (hours > 23)
+    hours = np.where(missing, 0, hours).astype(np.int8)
+    return pd.Series(pd.arrays.IntegerArray(hours, missing), index=series.index, name=series.name)
+
+
+def derived_columns(frame, source):
+    return [column for column in DERIVED_COLUMNS
+            if column in frame.columns and column not in EXPORT_COLUMNS.get(source, [])]
+
+
+def valid_rows(frame):
+    # Positions des lignes analysées : CTAR connu ('id_ctar') et année de consultation plausible
+    years = frame['Annee'].to_numpy(dtype='float64', na_value=np.nan)
+    return np.flatnonzero(frame['id_ctar'].notna().to_numpy() & (years <= MAX_YEAR))
+
+
+def prepare(frame, source, seasons=MADAGASCAR_SEASONS):
+    # Colonnes dérivées calculées une seule fois par jeu de données (modifie frame en place)
+    if source not in DATE_COLUMNS:
+        return frame
+
+    date_col, date_format = DATE_COLUMNS[source]
+    if date_col in frame.columns:
+        with stage('dates', len(frame)):
+            dates = parse_dates(frame[date_col], date_format)
+        frame[date_col] = dates
+        # La BDD IPM fournit déjà 'Annee' et 'mois'
+        if 'Annee' not in frame.columns:
+            frame['Annee'] = dates.dt.year.astype('Int16')
+        if 'mois' not in frame.columns:
+            frame['mois'] = dates.dt.month.astype('Int8')
+        frame['season'] = season_of(dates, seasons)
+        # Jour de la semaine (0 = lundi) de la consultation : la date de la morsure n'est pas dans les exports
+        frame['Weekday'] = dates.dt.dayofweek.astype('Int8')
+
+    if 'age' in frame.columns:
+        frame['Age Group'] = age_groups(frame['age'])
+
+    if 'heure_du_contact_cleaned' in frame.columns:
+        with stage('heures', len(frame)):
+            frame['Hour'] = parse_hours(frame['heure_du_contact_cleaned'])
+
+    return frame
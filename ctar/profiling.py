@@ -0,0 +1,163 @@
+import json
+import os
+import sys
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+
+import pandas as pd
+
+# Pic de mémoire résidente du processus (absent sous Windows : pas de mesure de mémoire)
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+# Mesure des étapes des pages (lecture du CSV, dates, sélection, cube, graphiques, envoi au navigateur...),
+# activée par CTAR_PROFILE=1 ou par l'option de la barre latérale. Chaque exécution mesurée d'une page ajoute
+# une ligne par étape au journal CTAR_PROFILE_LOG (JSON Lines). Sans mesure en cours, stage() ne coûte rien.
+
+PROFILE = os.environ.get("CTAR_PROFILE", "0") == "1"
+
+# Journal des mesures (CTAR_PROFILE_LOG vide : pas de journal, détail affiché dans la page seulement)
+PROFILE_LOG = os.environ.get("CTAR_PROFILE_LOG", os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), ".ctar_profile.jsonl"))
+
+PROFILE_COLUMNS = ['Étape', 'Lignes', 'ms', 'Hausse du pic RSS (Mo)']
+
+_local = threading.local()
+_log_lock = threading.Lock()
+
+
+def peak_rss():
+    # Pic de mémoire résidente du processus en octets (None si indisponible). Lu sans rien modifier : la mesure
+    # ne ralentit ni ne perturbe les autres sessions, mais elle est commune au processus.
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+@dataclass(eq=False)
+class Stage:
+    # Étape mesurée ; une étape répétée sous la même étape englobante (bloc par bloc en mode flux...) est cumulée
+    name: str
+    depth: int = 0
+    calls: int = 0
+    rows: int = None
+    ms: float = 0.0
+    # Hausse du pic de mémoire résidente du processus pendant l'étape (0 si le pic précédent n'est pas dépassé)
+    rss_bytes: int = None
+    children: dict = field(default_factory=dict, repr=False)
+
+    def add_rows(self, rows):
+        self.rows = rows if self.rows is None else self.rows + rows
+
+
+@dataclass(eq=False)
+class PageProfile:
+    # Étapes d'une exécution de page, dans l'ordre où elles commencent (une étape englobe ses sous-étapes)
+    page: str
+    run: str = field(default_factory=lambda: uuid.uuid4().hex[:12])
+    started: float = field(default_factory=time.time)
+    stages: list = field(default_factory=list)
+    _top: dict = field(default_factory=dict, repr=False)
+    _open: list = field(default_factory=list, repr=False)
+
+    def total_ms(self):
+        return sum(stage.ms for stage in self._top.values())
+
+    def table(self):
+        return pd.DataFrame([(
+            '\u2003' * stage.depth + stage.name + (f' (x{stage.calls})' if stage.calls > 1 else ''),
+            stage.rows,
+            round(stage.ms, 1),
+            None if stage.rss_bytes is None else round(stage.rss_bytes / 1024 ** 2, 1),
+        ) for stage in self.stages], columns=PROFILE_COLUMNS).astype({'Lignes': 'Int64'})
+
+    def records(self):
+        return [{
+            'time': self.started,
+            'run': self.run,
+            'page': self.page,
+            'stage': stage.name,
+            'depth': stage.depth,
+            'calls': stage.calls,
+            'rows': stage.rows,
+            'ms': round(stage.ms, 3),
+            'rss_peak_mb': None if stage.rss_bytes is None else round(stage.rss_bytes / 1024 ** 2, 3),
+        } for stage in self.stages]
+
+
+def current_profile():
+    return getattr(_local, 'profile', None)
+
+
+def start_profile(page):
+    # Mesure de l'exécution de la page en cours (fil d'exécution de la session), jusqu'à finish_profile
+    profile = PageProfile(page)
+    _local.profile = profile
+    return profile
+
+
+def finish_profile(profile):
+    # Termine la mesure et l'ajoute au journal ; renvoie le détail des étapes
+    if getattr(_local, 'profile', None) is profile:
+        _local.profile = None
+        write_records(profile.records())
+    return profile.table()
+
+
+def write_records(records, path=None):
+    path = PROFILE_LOG if path is None else path
+    if not path or not records:
+        return
+    lines = ''.join(json.dumps(record, ensure_ascii=False) + '\n' for record in records)
+    with _log_lock:
+        with open(path, 'a', encoding='utf-8') as f:
+            f.write(lines)
+
+
+@contextmanager
+def stage(name, rows=None):
+    # Étape mesurée de la page en cours : durée, nombre de lignes traitées (step.add_rows dans le bloc quand il
+    # n'est connu qu'après, ex. à la lecture du CSV) et hausse du pic de mémoire résidente du processus
+    profile = current_profile()
+    if profile is None:
+        yield Stage(name)
+        return
+
+    parent = profile._open[-1] if profile._open else None
+    siblings = parent.children if parent is not None else profile._top
+    record = siblings.get(name)
+    if record is None:
+        record = siblings[name] = Stage(name, depth=len(profile._open))
+        profile.stages.append(record)
+    record.calls += 1
+    if rows is not None:
+        record.add_rows(rows)
+
+    start_rss = peak_rss()
+    profile._open.append(record)
+    start = time.perf_counter()
+    try:
+        yield record
+    finally:
+        record.ms += (time.perf_counter() - start) * 1000
+        profile._open.pop()
+        if start_rss is not None:
+            record.rss_bytes = (record.rss_bytes or 0) + peak_rss() - start_rss
+
+
+def read_log(path=None):
+    # Journal des mesures en DataFrame (une ligne par étape mesurée)
+    path = PROFILE_LOG if path is None else path
+    return pd.read_json(path, lines=True)
+
+
+def slowest_stages(log):
+    # Étapes les plus coûteuses du journal : durée médiane et maximale par page et étape
+    summary = log.groupby(['page', 'stage'])['ms'].agg(['count', 'median', 'max'])
+    return summary.sort_values('median', ascending=False).reset_index()
@@ -0,0 +1,186 @@
+import logging
+import os
+import threading
+from collections import OrderedDict
+
+import streamlit as st
+
+from ctar.figures import compact_hover, figure_size, webgl
+from ctar.profiling import PROFILE, PROFILE_LOG, finish_profile, stage, start_profile
+
+
+# Budget (en ko) d'un graphique envoyé au navigateur : au-delà, le graphique est remplacé par sa version allégée
+FIGURE_BUDGET_KB = int(os.environ.get("CTAR_FIGURE_BUDGET_KB", "40"))
+
+# Mode connexion lente activé d'emblée pour tous les graphiques (serveurs consultés depuis les CTAR des régions) ;
+# sinon, seuls ceux qui dépassent le budget sont allégés
+LIGHT_MODE = os.environ.get("CTAR_LIGHT_MODE", "0") == "1"
+
+# Années des graphiques de saison en mode connexion lente
+LIGHT_YEARS = 3
+
+# Taille maximale (en Mo, graphiques sérialisés) des graphiques gardés en mémoire par le serveur
+FIGURE_CACHE_MAX_MB = int(os.environ.get("CTAR_FIGURE_CACHE_MB", "128"))
+
+logger = logging.getLogger(__name__)
+
+
+class FigureCache:
+    # Cache LRU des graphiques déjà construits, partagé par toutes les sessions et borné par leur taille
+    # sérialisée. Les graphiques gardés ne doivent jamais être modifiés.
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def put(self, key, fig, size):
+        with self._lock:
+            # Une autre session a pu construire le même graphique entre-temps
+            existing = self._entries.get(key)
+            if existing is not None:
+                self._entries.move_to_end(key)
+                return existing[0]
+
+            self._entries[key] = (fig, size)
+            self.total_bytes += size
+
+            # Libérer les graphiques les moins récemment affichés (on garde toujours le dernier)
+            while self.total_bytes > self.max_bytes and len(self._entries) > 1:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self.total_bytes -= evicted
+            return fig
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.total_bytes = 0
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_figure_cache():
+    # Cache unique pour tout le processus : toutes les sessions le partagent
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = FigureCache(FIGURE_CACHE_MAX_MB * 1024 ** 2)
+        return _cache
+
+
+def light_mode():
+    # Graphiques allégés : tranches d'âge plus larges, dernières années seulement, tracés WebGL
+    return st.sidebar.toggle("Mode connexion lente (graphiques allégés)", value=LIGHT_MODE)
+
+
+def page_profile(page):
+    # Mesure des étapes de la page (ctar.profiling) si l'option est cochée : à appeler en haut de la page,
+    # puis profile_panel(profile) à la fin
+    if st.sidebar.toggle("Mesurer les temps de la page", value=PROFILE):
+        return start_profile(page)
+    return None
+
+
+def profile_panel(profile):
+    # Détail des étapes de l'exécution mesurée, dans la barre latérale (et ajouté au journal)
+    if profile is None:
+        return
+    table = finish_profile(profile)
+    with st.sidebar.expander("Temps de la page", expanded=True):
+        st.markdown(f"**{profile.total_ms():.0f} ms** mesurées")
+        st.dataframe(table, hide_index=True)
+        if PROFILE_LOG:
+            st.caption(f"Journal : {PROFILE_LOG}")
+
+
+def prepared_figure(fig, name, light=False):
+    # (graphique prêt à envoyer, taille sérialisée) ; en mode allégé, les courbes passent en WebGL
+    # et les infobulles sont abrégées si le graphique dépasse encore le budget
+    budget = FIGURE_BUDGET_KB * 1024
+    if light:
+        fig = webgl(fig)
+    size = figure_size(fig)
+    if light and size > budget:
+        fig = compact_hover(fig)
+        size = figure_size(fig)
+
+    if size > budget:
+        logger.warning("Graphique %s : %.1f ko (budget %d ko)", name, size / 1024, FIGURE_BUDGET_KB)
+    else:
+        logger.info("Graphique %s : %.1f ko", name, size / 1024)
+    return fig, size
+
+
+def cached_figure(name, key, build, light=False, **kwargs):
+    # Affiche le graphique 'name' pour key (ctar.filters.selection_key, suivie des autres choix de la page
+    # dont dépend le graphique) ; build(light) n'est appelé que si aucune session ne l'a déjà construit.
+    # Un graphique complet qui dépasse le budget est remplacé par sa version allégée, build(True).
+    # Renvoie None, sans rien afficher ni garder, si build() renvoie None.
+    cache = get_figure_cache()
+    fig = cache.get((name, light, key))
+    if fig is None:
+        with stage(f'graphique {name}'):
+            fig = build(light)
+        if fig is None:
+            return None
+        with stage(f'sérialisation {name}'):
+            fig, size = prepared_figure(fig, name, light)
+        if not light and size > FIGURE_BUDGET_KB * 1024:
+            fig = cache.get((name, True, key))
+            if fig is None:
+                with stage(f'graphique allégé {name}'):
+                    fig, size = prepared_figure(build(True), name, True)
+                fig = cache.put((name, True, key), fig, size)
+            logger.info("Graphique %s : version allégée envoyée", name)
+        fig = cache.put((name, light, key), fig, size)
+    with stage(f'envoi {name}'):
+        st.plotly_chart(fig, **kwargs)
+    return fig
+
+
+def cached_html(name, key, build, height):
+    # Comme cached_figure pour une page HTML déjà rendue (carte Folium...) : build() renvoie le texte HTML
+    cache = get_figure_cache()
+    key = (name, False, key)
+    page = cache.get(key)
+    if page is None:
+        with stage(f'graphique {name}'):
+            page = build()
+        if page is None:
+            return None
+        logger.info("Page %s : %.1f ko", name, len(page) / 1024)
+        page = cache.put(key, page, len(page))
+    with stage(f'envoi {name}'):
+        st.iframe(page, height=height)
+    return page
+
+
+def deferred(label, key):
+    # Section repliée dont le contenu n'est calculé (et envoyé) que lorsqu'elle est ouverte : None si elle est fermée
+    section = st.expander(label, key=key, on_change='rerun')
+    return section if section.open else None
+
+
+def deferred_figure(label, name, key, build, light=False, **kwargs):
+    # Graphique secondaire coûteux dans une section repliée : build() n'est appelé qu'à l'ouverture
+    # (puis le graphique est gardé comme ceux de cached_figure)
+    section = deferred(label, name)
+    if section is None:
+        return
+    with section:
+        cached_figure(name, key, build, light, **kwargs)
@@ -0,0 +1,284 @@
+import argparse
+import html
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+import plotly.offline
+
+from ctar import analytics, figures
+from ctar.cube import get_count_cube
+from ctar.geography import ctar_names
+from ctar.ingestion import load_bytes
+from ctar.preparation import MAX_YEAR, valid_rows
+from ctar.schema import ctar_label
+
+
+# Rapport annuel des indicateurs CTAR sans passer par l'application :
+#   python -m ctar.report CTAR_ipmdata....csv CTAR_peripheriquedata....csv --annee 2023 --sortie rapport/
+# Les sections (total national, CTAR IPM, chaque CTAR périphérique) sont réparties entre des processus
+# de calcul ; le dossier produit (une page HTML par section et plotly.min.js) s'ouvre sans connexion.
+
+PLOTLY_JS = 'plotly.min.js'
+
+# Exports acceptés par le rapport
+REPORT_SOURCES = ('ipm', 'peripherique')
+
+# Jeux de données chargés par chaque processus (le principal, puis chaque processus de calcul à son démarrage)
+_datasets = {}
+
+PAGE_TEMPLATE = '''<!DOCTYPE html>
+<html lang="fr">
+<head>
+<meta charset="utf-8">
+<title>{title}</title>
+<script src="{plotly_js}"></script>
+<style>
+body {{ font-family: sans-serif; margin: 2em; }}
+table {{ border-collapse: collapse; margin: 1em 0; }}
+td, th {{ border: 1px solid #ccc; padding: 0.3em 0.8em; text-align: right; }}
+.figure {{ overflow-x: auto; }}
+</style>
+</head>
+<body>
+<p><a href="index.html">Rapport national</a></p>
+<h1>{title}</h1>
+{body}
+</body>
+</html>
+'''
+
+
+def figure_html(fig):
+    if fig is None:
+        return '<p>Données indisponibles.</p>'
+    return '<div class="figure">' + fig.to_html(full_html=False, include_plotlyjs=False) + '</div>'
+
+
+def table_html(table):
+    return table.to_html(index=False, border=0, na_rep='')
+
+
+def block(title, *parts):
+    return f'<h3>{html.escape(title)}</h3>\n' + '\n'.join(parts)
+
+
+def format_value(value):
+    # Effectifs entiers, statistiques à deux décimales
+    if value is None or pd.isna(value):
+        return ''
+    if not isinstance(value, float):
+        return f'{int(value)}'
+    return f'{value:.2f}'
+
+
+def summary_table(patients, by_sex, lesions=None):
+    # Effectifs (et statistiques du nombre de lésions) d'une section
+    rows = [('Patients', patients)]
+    rows += [(f'Patients ({sex})', count) for sex, count in by_sex.items()]
+    if lesions is not None:
+        _, n_lesions, mean, median, variance = lesions
+        rows += [
+            ('Patients dont le nombre de lésions est connu', n_lesions),
+            ('Nombre de lésions : moyenne', mean),
+            ('Nombre de lésions : médiane', median),
+            ('Nombre de lésions : variance', variance),
+        ]
+    return pd.DataFrame([(label, format_value(value)) for label, value in rows], columns=['Indicateur', 'Valeur'])
+
+
+def animal_blocks(patients, column, lifestyle_counts, is_peripherique):
+    # Répartition des espèces, puis mode de vie des quatre espèces les plus fréquentes (comme la page)
+    species = analytics.species_options(patients, column)[:4]
+    if not species:
+        return [block("Espèce responsable et mode de vie", figure_html(None))]
+
+    counts, n_animals = analytics.species_counts(patients, column, species)
+    parts = [figure_html(figures.pie_chart(
+        counts, column, 'count', f"Répartition des espèces responsables (tout type de contact) ({n_animals} animaux)",
+        is_peripherique=is_peripherique))]
+    for animal in species:
+        counts, n_animals = lifestyle_counts(patients, animal)
+        label_col = 'dev_carac' if is_peripherique else 'typanim'
+        parts.append(figure_html(figures.donut_chart(
+            counts, label_col, 'count', f"Répartition du mode de vie de l'animal pour : {n_animals} {animal}(s)",
+            is_peripherique=is_peripherique)))
+    return [block("Espèce responsable et mode de vie", *parts)]
+
+
+def peripheral_blocks(dataset, ctars, year):
+    # Indicateurs des CTAR périphériques (ctars=None : tous) pour une année
+    cube = get_count_cube(dataset)
+    view = cube.select(ctars, [year])
+    patients = view.size()
+    if patients == 0:
+        return [f'<p>Aucun patient enregistré en {year}.</p>']
+
+    by_sex = view.counts(['sexe']).set_index('sexe')['count']
+    lesions = analytics.lesion_stats(view)
+    blocks = [block("Résumé", table_html(summary_table(patients, by_sex, lesions)))]
+
+    blocks.append(block("Âge et sexe", figure_html(figures.age_sex_figure(*analytics.age_sex_counts(view)))))
+    # La page des saisons compare toutes les années
+    blocks.append(block("Saison de morsure", figure_html(figures.season_figure(
+        analytics.monthly_sex_counts(cube.select(ctars, None)), 'peripherique'))))
+
+    parts = []
+    for column, build in [('sexe', figures.hourly_sex_figure), ('espece', figures.hourly_species_figure)]:
+        counts, n_patients = analytics.hourly_counts(view, column)
+        parts.append(figure_html(build(counts, n_patients) if n_patients else None))
+    blocks.append(block("Heure de morsure", *parts))
+
+    blocks.append(block("Lésions", figure_html(figures.lesion_figure(*lesions))))
+    blocks.append(block("Exposition catégorie 1 (LPS)", figure_html(figures.lps_figure(analytics.lps_counts(view, dataset)))))
+
+    counts = analytics.mt_counts(view, dataset)
+    animal_counts = analytics.mt_animal_counts(view, dataset)
+    animal_types = sorted(animal_counts['Animal Type'].dropna().unique())
+    blocks.append(block("Morsures transdermiques (MT)",
+                        figure_html(figures.mt_figure(counts, height=900)),
+                        figure_html(figures.mt_animal_figure(animal_counts, {'M': 'M', 'F': 'F'}, animal_types))))
+
+    counts, num_patients = analytics.savon_counts(view)
+    blocks.append(block("Lavage au savon", figure_html(figures.savon_figure(counts, num_patients) if num_patients > 1 else None)))
+
+    # Seule page calculée sur les lignes des patients
+    frame = dataset.frame.take(valid_rows(dataset.frame))
+    mask = frame['Annee'] == year
+    if ctars is not None:
+        mask &= frame['id_ctar'].isin(ctars)
+    rows = frame[mask.fillna(False).to_numpy(dtype=bool)].dropna(subset=['espece'])
+    blocks += animal_blocks(analytics.known_lifestyles(rows, 'dev_carac'), 'espece', analytics.lifestyle_counts, True)
+    return blocks
+
+
+def ipm_blocks(dataset, year):
+    # Indicateurs du CTAR IPM pour une année (1 patient = 1 ref_mordu)
+    frame = dataset.frame
+    ipm = frame[(frame['Annee'] == year).fillna(False).to_numpy(dtype=bool)]
+    patients = analytics.unique_patients(ipm)
+    if len(patients) == 0:
+        return [f'<p>Aucun patient enregistré en {year}.</p>']
+
+    by_sex = patients['sexe'].value_counts()
+    blocks = [block("Résumé", table_html(summary_table(len(patients), by_sex)))]
+
+    blocks.append(block("Âge et sexe", figure_html(figures.age_sex_figure(*analytics.age_sex_counts(patients)))))
+    blocks.append(block("Saison de morsure", figure_html(figures.season_figure(
+        analytics.monthly_sex_counts(analytics.unique_patients(frame)), 'ipm'))))
+    blocks.append(block("Lésions", figure_html(figures.ipm_lesion_figure(*analytics.ipm_lesion_stats(ipm)))))
+
+    counts = analytics.ipm_mt_counts(ipm, dataset)
+    animal_counts = analytics.ipm_mt_animal_counts(ipm, dataset)
+    blocks.append(block("Morsures transdermiques (MT)",
+                        figure_html(figures.mt_figure(counts, height=700)),
+                        figure_html(figures.mt_animal_figure(animal_counts, {'M': '♂', 'F': '♀'},
+                                                             sorted(analytics.IPM_ANIMAL_TYPES.values())))))
+    blocks.append(block("Lavage au savon", figure_html(figures.ipm_savon_figure(*analytics.ipm_savon_counts(ipm)))))
+    blocks += animal_blocks(patients, 'animal', analytics.ipm_lifestyle_counts, False)
+    return blocks
+
+
+def render_section(section, year):
+    # (nom du fichier, titre, corps HTML) d'une section ; exécuté dans un processus de calcul
+    kind, ctar, name = section
+    ipm = next((d for d in _datasets.values() if d.source == 'ipm'), None)
+    peripherique = next((d for d in _datasets.values() if d.source == 'peripherique'), None)
+
+    if kind == 'national':
+        title = f"Rapport national {year}"
+        blocks = []
+        if ipm is not None:
+            blocks.append('<h2>CTAR IPM</h2>')
+            blocks += ipm_blocks(ipm, year)
+        if peripherique is not None:
+            blocks.append('<h2>Ensemble des CTAR périphériques</h2>')
+            blocks += peripheral_blocks(peripherique, None, year)
+        return 'index.html', title, blocks
+
+    title = f"CTAR {name} ({ctar_label(ctar)}) : {year}"
+    return f'ctar-{ctar_label(ctar)}.html', title, peripheral_blocks(peripherique, [ctar], year)
+
+
+def write_page(output, file_name, title, blocks, links=()):
+    body = '\n'.join(blocks)
+    if links:
+        items = '\n'.join(f'<li><a href="{href}">{html.escape(label)}</a></li>' for href, label in links)
+        body = f'<h2>CTAR périphériques</h2>\n<ul>\n{items}\n</ul>\n' + body
+    with open(os.path.join(output, file_name), 'w', encoding='utf-8') as f:
+        f.write(PAGE_TEMPLATE.format(title=html.escape(title), plotly_js=PLOTLY_JS, body=body))
+
+
+def load_exports(paths):
+    datasets = {}
+    for path in paths:
+        with open(path, 'rb') as f:
+            dataset = load_bytes(os.path.basename(path), f.read())
+        if dataset.source not in REPORT_SOURCES:
+            raise SystemExit(f"Fichier non pris en charge par le rapport (exports CTAR_ipmdata* ou "
+                             f"CTAR_peripheriquedata* seulement) : {path}")
+        datasets[dataset.name] = dataset
+    return datasets
+
+
+def _init_worker(paths):
+    # Chaque processus de calcul ('spawn') relit les exports : depuis le stockage des jeux de données
+    # (ctar.store) s'il est activé, puisque le processus principal vient de les y écrire
+    global _datasets
+    _datasets = load_exports(paths)
+
+
+def build_report(paths, output, year=None, ctars=None, workers=None):
+    global _datasets
+    start = time.perf_counter()
+    _datasets = load_exports(paths)
+    peripherique = next((d for d in _datasets.values() if d.source == 'peripherique'), None)
+
+    sections = [('national', None, None)]
+    names = {}
+    if peripherique is not None:
+        names = ctar_names(peripherique)
+        selected = [ctar for ctar in get_count_cube(peripherique).ctars if ctars is None or ctar_label(ctar) in ctars]
+        sections += [('ctar', ctar, names.get(ctar, ctar_label(ctar))) for ctar in selected]
+
+    if year is None:
+        years = [int(year) for d in _datasets.values() for year in d.frame['Annee'].dropna().unique()]
+        year = max(year for year in years if year <= MAX_YEAR)
+
+    os.makedirs(output, exist_ok=True)
+    with open(os.path.join(output, PLOTLY_JS), 'w', encoding='utf-8') as f:
+        f.write(plotly.offline.get_plotlyjs())
+
+    # 'spawn' sur tous les systèmes : un 'fork' copierait les verrous et les fils d'exécution du processus
+    # principal (DuckDB, caches partagés) dans un état quelconque
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context,
+                             initializer=_init_worker, initargs=(paths,)) as pool:
+        futures = [pool.submit(render_section, section, year) for section in sections]
+        pages = [future.result() for future in futures]
+
+    links = [(file_name, title) for file_name, title, _ in pages[1:]]
+    for i, (file_name, title, blocks) in enumerate(pages):
+        write_page(output, file_name, title, blocks, links if i == 0 else ())
+
+    return len(pages), time.perf_counter() - start
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Génère le rapport annuel des indicateurs CTAR (HTML).")
+    parser.add_argument('exports', nargs='+', help="fichiers CTAR_ipmdata*.csv et/ou CTAR_peripheriquedata*.csv")
+    parser.add_argument('--annee', type=int, default=None, help="année du rapport (par défaut : la plus récente)")
+    parser.add_argument('--sortie', default='rapport', help="dossier du rapport")
+    parser.add_argument('--ctars', nargs='+', default=None, help="identifiants des CTAR périphériques (par défaut : tous)")
+    parser.add_argument('--processus', type=int, default=None, help="nombre de processus de calcul")
+    args = parser.parse_args(argv)
+
+    ctars = set(args.ctars) if args.ctars else None
+    n_pages, elapsed = build_report(args.exports, args.sortie, args.annee, ctars, args.processus)
+    print(f"{n_pages} page(s) écrite(s) dans {args.sortie} en {elapsed:.1f} s")
+
+
+if __name__ == '__main__':
+    main()
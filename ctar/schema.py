@@ -0,0 +1,179 @@
+import numpy as np
+import pandas as pd
+
+
+# Type 'case à cocher' RedCap : colonnes 0/1
+CHECKBOX = 'checkbox'
+
+IPM_LESION_COLUMNS = ['nbtet', 'nb_sup', 'nb_extr_s', 'nb_inf', 'nb_extr_i', 'nb_abdo', 'nb_dos', 'nb_genit']
+IPM_CONTACT_COLUMNS = ['tet_cont', 'm_sup_cont', 'ext_s_cont', 'm_inf_cont', 'ext_i_cont', 'abdo_cont', 'dos_cont', 'geni_cont']
+PERIPHERIQUE_BODY_PART_COLUMNS = [f'singes_des_legions___{i}' for i in range(1, 10)]
+PERIPHERIQUE_CONTACT_COLUMNS = [f'type_contact___{i}' for i in range(1, 6)]
+
+# Vocabulaire commun des parties du corps, dans l'ordre de la légende des graphiques
+BODY_PARTS = [
+    'Tête et Cou',
+    'Bras et Avant-bras',
+    'Main',
+    'Cuisse et Jambe',
+    'Pied',
+    'Abdomen',
+    'Autres',
+    'Dos et Torse',
+    'Parties génitales',
+]
+
+# Partie du corps -> colonne du type de contact (valeurs 'LPS', 'MT', 'GS'...) dans la BDD IPM
+IPM_BODY_PARTS = dict(zip(
+    ['Tête et Cou', 'Bras et Avant-bras', 'Main', 'Cuisse et Jambe', 'Pied', 'Abdomen', 'Dos et Torse', 'Parties génitales'],
+    IPM_CONTACT_COLUMNS))
+
+# Partie du corps -> case à cocher RedCap de la BDD périphérique
+PERIPHERIQUE_BODY_PARTS = {
+    'Tête et Cou': 'singes_des_legions___1',
+    'Bras et Avant-bras': 'singes_des_legions___2',
+    'Main': 'singes_des_legions___3',
+    'Cuisse et Jambe': 'singes_des_legions___4',
+    'Pied': 'singes_des_legions___5',
+    'Autres': 'singes_des_legions___9',
+    'Dos et Torse': 'singes_des_legions___6',
+    'Parties génitales': 'singes_des_legions___7',
+}
+
+# Type de contact -> case à cocher RedCap de la BDD périphérique (libellés IPM quand ils existent)
+PERIPHERIQUE_CONTACTS = {
+    'LPS': 'type_contact___1',
+    'type_contact___2': 'type_contact___2',
+    'type_contact___3': 'type_contact___3',
+    'type_contact___4': 'type_contact___4',
+    'MT': 'type_contact___5',
+}
+
+# Identifiant et nom du CTAR de l'IPM dans le schéma harmonisé (ctar.harmonized) : l'export IPM n'a pas d'id_ctar
+IPM_CTAR_ID = 0.0
+IPM_CTAR_NAME = 'IPM'
+
+# Schéma des exports CTAR_ipmdata* (MS Access)
+IPM_SCHEMA = {
+    'sexe': 'category',
+    'animal': 'category',
+    'typanim': 'category',
+    'savon': 'category',
+    'age': 'Int16',
+    'mois': 'Int8',
+    'Annee': 'Int16',
+    **{col: 'category' for col in IPM_CONTACT_COLUMNS},
+    **{col: 'Int16' for col in IPM_LESION_COLUMNS},
+}
+
+# Schéma des exports CTAR_peripheriquedata* (RedCap)
+PERIPHERIQUE_SCHEMA = {
+    'sexe': 'category',
+    'espece': 'category',
+    'dev_carac': 'category',
+    'id_ctar': 'category',
+    'age': 'Int16',
+    'nb_lesion': 'Int16',
+    **{col: CHECKBOX for col in PERIPHERIQUE_BODY_PART_COLUMNS},
+    **{col: CHECKBOX for col in PERIPHERIQUE_CONTACT_COLUMNS},
+}
+
+# Schéma des exports CTAR_commandes* : commandes de vaccin des CTAR périphériques auprès du CTAR de l'IPM
+COMMANDES_SCHEMA = {
+    'id_ctar': 'category',
+    'nb_doses': 'Int32',
+}
+
+SCHEMAS = {
+    'ipm': IPM_SCHEMA,
+    'peripherique': PERIPHERIQUE_SCHEMA,
+    'commandes': COMMANDES_SCHEMA,
+}
+
+# Au-delà de cette proportion de valeurs distinctes, une catégorie ne fait pas gagner de mémoire
+MAX_CATEGORY_RATIO = 0.5
+
+
+def ctar_label(ctar):
+    # Identifiant lisible d'un CTAR, pour les libellés et les noms de fichier : 3.0 -> '3', CTAR de l'IPM -> 'IPM'
+    if ctar == IPM_CTAR_ID:
+        return IPM_CTAR_NAME
+    if isinstance(ctar, float) and ctar.is_integer():
+        return str(int(ctar))
+    return str(ctar)
+
+
+def schema_for(source):
+    return SCHEMAS.get(source, {})
+
+
+def to_category(series):
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        return series
+    if series.nunique(dropna=True) > MAX_CATEGORY_RATIO * max(len(series), 1):
+        return series
+    return series.astype('category')
+
+
+def to_integer(series, dtype):
+    # Conversion sans perte : on garde la colonne telle quelle si les valeurs ne sont pas entières
+    numeric = pd.to_numeric(series, errors='coerce')
+    values = numeric.dropna()
+    if len(values) and not (values % 1 == 0).all():
+        return numeric
+
+    info = np.iinfo(pd.api.types.pandas_dtype(dtype).numpy_dtype)
+    if len(values) and (values.min() < info.min or values.max() > info.max):
+        return numeric
+
+    if numeric.isna().any():
+        return numeric.astype(dtype)
+    return numeric.astype(dtype.lower())
+
+
+def to_checkbox(series):
+    # Cases à cocher numériques 0/1 -> int8, les réponses textuelles (OUI/NON...) -> catégorie
+    if not pd.api.types.is_numeric_dtype(series):
+        return to_category(series)
+    if not series.dropna().isin([0, 1]).all():
+        return series
+    if series.isna().any():
+        return series.astype('Int8')
+    return series.astype('int8')
+
+
+def is_checked(series):
+    # Case cochée : 1 (export brut) ou 'OUI' (export avec libellés)
+    return series.isin([1, 'OUI']).to_numpy()
+
+
+def convert_column(series, dtype):
+    if dtype == 'category':
+        return to_category(series)
+    if dtype == CHECKBOX:
+        return to_checkbox(series)
+    return to_integer(series, dtype)
+
+
+def apply_schema(df, schema):
+    # Applique le schéma (en place, sur un DataFrame fraîchement lu) et rapporte la mémoire gagnée par colonne
+    rows = []
+    for col, dtype in schema.items():
+        if col not in df.columns:
+            continue
+        before = df[col]
+        after = convert_column(before, dtype)
+        df[col] = after
+        bytes_before = int(before.memory_usage(deep=True, index=False))
+        bytes_after = int(after.memory_usage(deep=True, index=False))
+        rows.append({
+            'Colonne': col,
+            'Type avant': str(before.dtype),
+            'Type après': str(after.dtype),
+            'Octets avant': bytes_before,
+            'Octets après': bytes_after,
+            'Octets gagnés': bytes_before - bytes_after,
+        })
+
+    report = pd.DataFrame(rows, columns=['Colonne', 'Type avant', 'Type après', 'Octets avant', 'Octets après', 'Octets gagnés'])
+    return df, report
@@ -0,0 +1,38 @@
+import numpy as np
+import pandas as pd
+
+
+# Saisons malgaches : (nom, (mois, jour) de début). Chaque saison dure jusqu'au début
+# de la suivante ; la dernière de l'année continue jusqu'à la première (décembre -> mars).
+MADAGASCAR_SEASONS = [
+    ('Lohataona (été)', (9, 15)),
+    ('Fahavratra (pluie)', (12, 15)),
+    ('Fararano (automne)', (3, 15)),
+    ('Ritinina (hiver)', (6, 15)),
+]
+
+
+def classify_seasons(months, days, seasons=MADAGASCAR_SEASONS):
+    # Classement vectorisé à partir de tableaux d'entiers mois/jour (0 = valeur manquante)
+    labels = [name for name, _ in seasons]
+    starts = np.array([month * 100 + day for _, (month, day) in seasons])
+    order = np.argsort(starts)
+
+    months = np.asarray(months, dtype=np.int64)
+    days = np.asarray(days, dtype=np.int64)
+    keys = months * 100 + days
+
+    # Position de la dernière saison commencée ; avant le premier début de l'année -> dernière saison
+    position = np.searchsorted(starts[order], keys, side='right') - 1
+    codes = order[position % len(order)]
+    codes = np.where(months > 0, codes, -1)
+
+    return pd.Categorical.from_codes(codes, categories=labels)
+
+
+def season_of(dates, seasons=MADAGASCAR_SEASONS):
+    missing = dates.isna().to_numpy()
+    months = dates.dt.month.fillna(0).to_numpy(dtype=np.int64)
+    days = dates.dt.day.fillna(0).to_numpy(dtype=np.int64)
+    months[missing] = 0
+    return pd.Series(classify_seasons(months, days, seasons), index=dates.index, name='season')
@@ -0,0 +1,144 @@
+import threading
+
+import numpy as np
+import pandas as pd
+
+from ctar.preparation import MAX_YEAR
+from ctar.schema import PERIPHERIQUE_BODY_PARTS, PERIPHERIQUE_CONTACTS
+from ctar.views import AggregateView, order_body_part_counts
+
+# Moteur SQL embarqué optionnel : sans DuckDB, les pages restent sur pandas
+try:
+    import duckdb
+except ImportError:
+    duckdb = None
+
+
+# Colonne ajoutée à la table enregistrée pour garder l'ordre des lignes du fichier
+ROW_COLUMN = '_row'
+
+
+def duckdb_available():
+    return duckdb is not None
+
+
+def quote(column):
+    return '"' + column.replace('"', '""') + '"'
+
+
+class SqlEngine:
+    # Connexion DuckDB en mémoire où le DataFrame du jeu de données est enregistré une seule fois
+    # (sans copie : DuckDB lit directement les colonnes pandas)
+
+    def __init__(self, dataset):
+        if duckdb is None:
+            raise ImportError("Le moteur SQL nécessite le paquet 'duckdb' (pip install duckdb).")
+        self.table = dataset.source or 'donnees'
+        self.dtypes = dataset.frame.dtypes
+        self._con = duckdb.connect(':memory:')
+        self._con.register(self.table, dataset.frame.assign(**{ROW_COLUMN: np.arange(len(dataset.frame))}))
+        # Une connexion DuckDB ne doit pas être utilisée par deux sessions en même temps
+        self._lock = threading.Lock()
+
+    def query(self, sql, params=None):
+        with self._lock:
+            return self._con.execute(sql, params or []).df()
+
+    def query_row(self, sql, params=None):
+        with self._lock:
+            return self._con.execute(sql, params or []).fetchone()
+
+    def checked(self, column):
+        # Même règle que ctar.schema.is_checked : 1 pour les colonnes numériques, 'OUI' sinon
+        if pd.api.types.is_numeric_dtype(self.dtypes[column]):
+            return f'{quote(column)} = 1'
+        return f"CAST({quote(column)} AS VARCHAR) = 'OUI'"
+
+
+def get_sql_engine(dataset):
+    return dataset.derived('sql_engine', SqlEngine)
+
+
+class SqlView(AggregateView):
+    # Sélection de lignes exprimée en SQL ; les filtres CTAR/année sont poussés dans le scan de la table
+
+    def __init__(self, engine, ctars=None, years=None, valid_only=False, distinct=None):
+        self.engine = engine
+        self.ctars = ctars
+        self.years = years
+        # Mêmes lignes que ctar.filters.FilterIndex (CTAR connu, année de consultation plausible)
+        self.valid_only = valid_only
+        # Garder la première ligne de chaque valeur de la colonne (comme drop_duplicates)
+        self.distinct = distinct
+
+    def _selection(self):
+        # Sous-requête des lignes sélectionnées et paramètres associés
+        source = quote(self.engine.table)
+        if self.distinct is not None:
+            source = (f'(SELECT * FROM {source} QUALIFY row_number() OVER '
+                      f'(PARTITION BY {quote(self.distinct)} ORDER BY {ROW_COLUMN}) = 1)')
+
+        conditions, params = [], []
+        if self.valid_only:
+            conditions.append(f'id_ctar IS NOT NULL AND Annee <= {MAX_YEAR}')
+        if self.ctars is not None:
+            conditions.append('list_contains(?, id_ctar)')
+            params.append(list(self.ctars))
+        if self.years is not None:
+            conditions.append('list_contains(?, Annee)')
+            params.append([int(year) for year in self.years])
+
+        where = f" WHERE {' AND '.join(conditions)}" if conditions else ''
+        return f'(SELECT * FROM {source}{where})', params
+
+    def size(self, notna=()):
+        selection, params = self._selection()
+        where = ' AND '.join(f'{quote(column)} IS NOT NULL' for column in notna) or 'TRUE'
+        return self.engine.query_row(f'SELECT count(*) FROM {selection} WHERE {where}', params)[0]
+
+    def counts(self, by, dropna=True):
+        selection, params = self._selection()
+        columns = ', '.join(quote(column) for column in by)
+        where = ' AND '.join(f'{quote(column)} IS NOT NULL' for column in by) if dropna else 'TRUE'
+        return self.engine.query(
+            f'SELECT {columns}, count(*) AS count FROM {selection} WHERE {where} '
+            f'GROUP BY {columns} ORDER BY {columns} NULLS LAST', params)
+
+    def age_sex_counts(self):
+        return self.counts(['age', 'sexe'])
+
+    def monthly_sex_counts(self):
+        return self.counts(['mois', 'Annee', 'sexe'])
+
+    def body_part_counts(self, contact, by):
+        selection, params = self._selection()
+        dims = [column for column in by if column != 'Body Part']
+        columns = ''.join(f', {quote(column)}' for column in dims)
+        not_null = ''.join(f' AND {quote(column)} IS NOT NULL' for column in dims)
+        contact_checked = self.engine.checked(PERIPHERIQUE_CONTACTS[contact])
+
+        # Une requête par partie du corps, réunies en une seule passe
+        queries, query_params = [], []
+        for part, column in PERIPHERIQUE_BODY_PARTS.items():
+            queries.append(
+                f'SELECT ? AS "Body Part"{columns}, count(*) AS count FROM {selection} '
+                f'WHERE {self.engine.checked(column)} AND {contact_checked}{not_null} '
+                'GROUP BY ALL')
+            query_params += [part] + params
+
+        counts = self.engine.query(' UNION ALL '.join(queries), query_params)
+        return order_body_part_counts(counts[by + ['count']], by)
+
+    def lesion_stats(self):
+        histogram = self.counts(['nb_lesion']).set_index('nb_lesion')['count']
+        selection, params = self._selection()
+        n, mean, median, variance = self.engine.query_row(
+            'SELECT count(nb_lesion), avg(nb_lesion), quantile_cont(nb_lesion, 0.5), var_samp(nb_lesion) '
+            f'FROM {selection}', params)
+        if n == 0:
+            return histogram, 0, np.nan, np.nan, np.nan
+        return histogram, n, mean, median, np.nan if variance is None else variance
+
+
+def sql_view(dataset, ctars=None, years=None, valid_only=False, distinct=None):
+    return SqlView(get_sql_engine(dataset), ctars, years, valid_only, distinct)
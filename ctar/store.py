@@ -0,0 +1,218 @@
+import json
+import logging
+import os
+import pickle
+import shutil
+import threading
+import time
+
+import pandas as pd
+
+# Fichiers Arrow IPC (Feather) optionnels : sans pyarrow, les jeux ne sont gardés qu'en mémoire
+try:
+    import pyarrow
+except ImportError:
+    pyarrow = None
+
+
+# Dossier des jeux de données préparés, gardés entre les sessions et les redémarrages du serveur
+# (CTAR_STORE_DIR vide : pas de stockage sur disque)
+STORE_DIR = os.environ.get("CTAR_STORE_DIR", os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), ".ctar_store"))
+
+# Taille maximale du dossier (en Mo) et durée de conservation d'un jeu non utilisé (en jours)
+STORE_MAX_MB = int(os.environ.get("CTAR_STORE_MAX_MB", "2048"))
+STORE_MAX_DAYS = float(os.environ.get("CTAR_STORE_MAX_DAYS", "30"))
+
+# Liste des fichiers enregistrés proposée sur la page d'accueil. Désactivée par défaut : l'application n'a pas
+# d'authentification, la liste montrerait à chaque visiteur les exports de patients envoyés par les autres.
+# Sans elle, un fichier déjà préparé est retrouvé par son contenu quand il est de nouveau téléchargé.
+STORE_LISTING = os.environ.get("CTAR_STORE_LISTING", "0") == "1"
+
+# Version des jeux enregistrés, à augmenter quand la préparation des lignes (ctar.corrections, ctar.preparation)
+# ou les agrégats enregistrés et meta.json changent : les jeux d'une autre version sont supprimés et relus depuis le CSV
+STORE_VERSION = 6
+
+# Agrégats enregistrés avec le jeu de données (ni l'index des filtres, qui référence les lignes,
+# ni la connexion DuckDB ne peuvent l'être)
+STORED_DERIVED = ['count_cube', 'exposures', 'map_counts']
+
+META_FILE = 'meta.json'
+FRAME_FILE = 'frame.arrow'
+SCHEMA_REPORT_FILE = 'schema_report.arrow'
+CORRECTIONS_FILE = 'corrections.arrow'
+AGGREGATES_FILE = 'aggregates.pkl'
+
+logger = logging.getLogger(__name__)
+
+
+def store_available():
+    return pyarrow is not None and bool(STORE_DIR)
+
+
+def directory_size(path):
+    return sum(entry.stat().st_size for entry in os.scandir(path) if entry.is_file())
+
+
+class DatasetStore:
+    # Un dossier par empreinte du contenu : meta.json, lignes préparées (frame.arrow, avec le rapport du schéma
+    # et l'audit des corrections) ou agrégats du mode flux (aggregates.pkl), et un fichier .pkl par structure
+    # dérivée déjà calculée.
+    # La date de modification de meta.json est celle du dernier accès (éviction LRU).
+
+    def __init__(self, directory, max_bytes, max_age):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, fingerprint, *names):
+        return os.path.join(self.directory, fingerprint.replace(':', '-'), *names)
+
+    def entries(self):
+        # Métadonnées des jeux enregistrés, du plus récemment utilisé au plus ancien
+        entries = []
+        for entry in os.scandir(self.directory):
+            meta_path = os.path.join(entry.path, META_FILE)
+            try:
+                with open(meta_path) as f:
+                    meta = json.load(f)
+                meta['accessed'] = os.path.getmtime(meta_path)
+                meta['disk_bytes'] = directory_size(entry.path)
+            except (OSError, ValueError):
+                continue
+            if meta.get('version', 1) == STORE_VERSION:
+                entries.append(meta)
+        return sorted(entries, key=lambda meta: meta['accessed'], reverse=True)
+
+    def load(self, fingerprint, dataset_type):
+        # Jeu enregistré (instance de dataset_type), ou None
+        meta_path = self._path(fingerprint, META_FILE)
+        try:
+            with open(meta_path) as f:
+                meta = json.load(f)
+            if meta.get('version', 1) != STORE_VERSION:
+                shutil.rmtree(self._path(fingerprint), ignore_errors=True)
+                return None
+            if meta['kind'] == 'aggregates':
+                with open(self._path(fingerprint, AGGREGATES_FILE), 'rb') as f:
+                    dataset = pickle.load(f)
+            else:
+                frame = pd.read_feather(self._path(fingerprint, FRAME_FILE))
+                dataset = dataset_type(
+                    name=meta['name'],
+                    fingerprint=fingerprint,
+                    source=meta['source'],
+                    frame=frame,
+                    nbytes=meta['nbytes'],
+                    schema_report=pd.read_feather(self._path(fingerprint, SCHEMA_REPORT_FILE)),
+                    corrections=pd.read_feather(self._path(fingerprint, CORRECTIONS_FILE)),
+                    built_from=tuple(meta['built_from']),
+                )
+            os.utime(meta_path)
+        except (OSError, ValueError, KeyError, pickle.UnpicklingError):
+            return None
+        return dataset
+
+    def save(self, dataset):
+        # Écriture dans un dossier temporaire puis renommage : un jeu n'est jamais lu à moitié écrit
+        target = self._path(dataset.fingerprint)
+        if os.path.exists(target):
+            return
+        temporary = f'{target}.{os.getpid()}.{threading.get_ident()}.tmp'
+        meta = {
+            'fingerprint': dataset.fingerprint,
+            'name': dataset.name,
+            'source': dataset.source,
+            'nbytes': dataset.nbytes,
+            'created': time.time(),
+            'version': STORE_VERSION,
+        }
+        try:
+            os.makedirs(temporary)
+            if hasattr(dataset, 'frame'):
+                meta.update(kind='table', rows=len(dataset.frame), built_from=list(dataset.built_from))
+                dataset.frame.to_feather(os.path.join(temporary, FRAME_FILE))
+                dataset.schema_report.to_feather(os.path.join(temporary, SCHEMA_REPORT_FILE))
+                dataset.corrections.to_feather(os.path.join(temporary, CORRECTIONS_FILE))
+            else:
+                meta.update(kind='aggregates', rows=dataset.nrows)
+                with open(os.path.join(temporary, AGGREGATES_FILE), 'wb') as f:
+                    pickle.dump(dataset, f, protocol=pickle.HIGHEST_PROTOCOL)
+            with open(os.path.join(temporary, META_FILE), 'w') as f:
+                json.dump(meta, f)
+            os.rename(temporary, target)
+        except (OSError, ValueError, TypeError, pickle.PicklingError) as e:
+            logger.warning("Jeu de données %s non enregistré sur disque : %s", dataset.name, e)
+            shutil.rmtree(temporary, ignore_errors=True)
+            return
+        self.evict()
+
+    def load_derived(self, fingerprint, key):
+        try:
+            with open(self._path(fingerprint, f'{key}.pkl'), 'rb') as f:
+                return pickle.load(f)
+        except (OSError, ValueError, pickle.UnpicklingError):
+            return None
+
+    def save_derived(self, fingerprint, key, value):
+        directory = self._path(fingerprint)
+        if not os.path.isdir(directory):
+            return
+        temporary = os.path.join(directory, f'{key}.{os.getpid()}.{threading.get_ident()}.tmp')
+        try:
+            with open(temporary, 'wb') as f:
+                pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(temporary, os.path.join(directory, f'{key}.pkl'))
+        except (OSError, TypeError, pickle.PicklingError) as e:
+            logger.warning("Agrégat %s non enregistré sur disque : %s", key, e)
+            if os.path.exists(temporary):
+                os.remove(temporary)
+
+    def discard(self, fingerprint):
+        # Jeu remplacé par une autre version (ctar.memory) : supprimé du dossier
+        with self._lock:
+            shutil.rmtree(self._path(fingerprint), ignore_errors=True)
+
+    def evict(self):
+        # Suppression des jeux inutilisés depuis max_age secondes, puis des moins récemment utilisés
+        # tant que le dossier dépasse max_bytes (le plus récent est toujours gardé)
+        with self._lock:
+            now = time.time()
+            entries = []
+            for entry in os.scandir(self.directory):
+                meta_path = os.path.join(entry.path, META_FILE)
+                if os.path.exists(meta_path):
+                    entries.append((os.path.getmtime(meta_path), directory_size(entry.path), entry.path))
+                elif entry.name.endswith('.tmp') and now - entry.stat().st_mtime > 3600:
+                    # Écriture interrompue (arrêt du serveur)
+                    shutil.rmtree(entry.path, ignore_errors=True)
+            entries.sort()
+
+            total = sum(size for _, size, _ in entries)
+            for i, (accessed, size, path) in enumerate(entries):
+                if i == len(entries) - 1:
+                    break
+                if now - accessed > self.max_age or total > self.max_bytes:
+                    shutil.rmtree(path, ignore_errors=True)
+                    total -= size
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_dataset_store():
+    # Dossier unique pour tout le processus, ou None si le stockage sur disque est désactivé
+    global _store
+    if not store_available():
+        return None
+    with _store_lock:
+        if _store is None:
+            try:
+                _store = DatasetStore(STORE_DIR, STORE_MAX_MB * 1024 ** 2, STORE_MAX_DAYS * 24 * 3600)
+            except OSError as e:
+                logger.warning("Stockage sur disque indisponible (%s) : %s", STORE_DIR, e)
+                return None
+            _store.evict()
+        return _store
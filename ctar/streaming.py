@@ -0,0 +1,239 @@
+import hashlib
+import io
+import os
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+from ctar.corrections import apply_corrections, corrections_for
+from ctar.geography import MAP_KEYS, map_frame
+from ctar.ingestion import cached_dataset, detect_source, keep_dataset
+from ctar.preparation import prepare, valid_rows
+from ctar.profiling import stage
+from ctar.schema import PERIPHERIQUE_BODY_PARTS, PERIPHERIQUE_CONTACTS, apply_schema, is_checked, schema_for
+from ctar.views import AggregateView, lesion_stats, order_body_part_counts
+
+
+# Nombre de lignes lues à la fois dans le CSV
+CHUNK_ROWS = 50_000
+
+# Les agrégats partiels sont fusionnés dès qu'ils dépassent ce nombre
+COMPACT_EVERY = 8
+
+# Toutes les tables d'agrégats gardent le CTAR et l'année pour pouvoir être filtrées
+CTAR_KEYS = ['id_ctar', 'Annee']
+
+class CountAggregator:
+    # Nombre de lignes par combinaison de colonnes, mis à jour bloc par bloc
+
+    def __init__(self, keys):
+        self.keys = keys
+        self._parts = []
+
+    def count(self, chunk):
+        # Les valeurs manquantes sont gardées ici et écartées au moment de la requête
+        return chunk.groupby(self.keys, observed=True, dropna=False).size().reset_index(name='count')
+
+    def update(self, chunk):
+        part = self.count(chunk)
+        if len(part):
+            self._parts.append(part)
+        if len(self._parts) > COMPACT_EVERY:
+            self._compact()
+
+    def _compact(self):
+        if not self._parts:
+            self._parts = [pd.DataFrame(columns=self.keys + ['count'])]
+            return
+        merged = pd.concat(self._parts, ignore_index=True)
+        # Les catégories diffèrent d'un bloc à l'autre : on agrège sur les valeurs
+        merged[self.keys] = merged[self.keys].astype(object)
+        self._parts = [merged.groupby(self.keys, dropna=False).sum().reset_index()]
+
+    @property
+    def counts(self):
+        self._compact()
+        return self._parts[0]
+
+
+class BodyPartContactAggregator(CountAggregator):
+    # Nombre de patients par partie du corps et type de contact (cases à cocher RedCap)
+
+    def __init__(self, keys, body_parts, contacts):
+        super().__init__(keys + ['Body Part', 'Contact'])
+        self.dims = keys
+        self.body_parts = body_parts
+        self.contacts = contacts
+
+    def count(self, chunk):
+        parts = []
+        contact_masks = {label: is_checked(chunk[column]) for label, column in self.contacts.items() if column in chunk.columns}
+        for part, column in self.body_parts.items():
+            if column not in chunk.columns:
+                continue
+            part_mask = is_checked(chunk[column])
+            for contact, contact_mask in contact_masks.items():
+                counts = chunk[part_mask & contact_mask].groupby(self.dims, observed=True, dropna=False).size().reset_index(name='count')
+                counts['Body Part'] = part
+                counts['Contact'] = contact
+                parts.append(counts)
+        if not parts:
+            return pd.DataFrame(columns=self.keys + ['count'])
+        return pd.concat(parts, ignore_index=True)
+
+
+class MapAggregator(CountAggregator):
+    # Agrégat de la carte des CTAR (voir ctar.geography)
+
+    def __init__(self):
+        super().__init__(MAP_KEYS)
+
+    def count(self, chunk):
+        return super().count(map_frame(chunk))
+
+
+# Agrégats où chaque patient est compté une fois (parties_contacts : une fois par partie et contact cochés ;
+# carte : colonnes recodées), utilisés pour les comptages sur d'autres colonnes
+PATIENT_TABLES = ['age_sexe', 'mois', 'lesions']
+
+
+def new_aggregators():
+    return {
+        'age_sexe': CountAggregator(CTAR_KEYS + ['age', 'sexe']),
+        'mois': CountAggregator(CTAR_KEYS + ['mois', 'sexe']),
+        'parties_contacts': BodyPartContactAggregator(
+            CTAR_KEYS + ['Age Group', 'sexe', 'dev_carac'], PERIPHERIQUE_BODY_PARTS, PERIPHERIQUE_CONTACTS),
+        'lesions': CountAggregator(CTAR_KEYS + ['nb_lesion']),
+        'carte': MapAggregator(),
+    }
+
+
+class StreamedView(AggregateView):
+    # Agrégats restreints à une sélection de CTARs et d'années
+
+    def __init__(self, tables):
+        self.tables = tables
+
+    def _table(self, columns):
+        # Première table à une ligne par patient contenant toutes les colonnes demandées
+        for key in PATIENT_TABLES:
+            table = self.tables[key]
+            if set(columns) <= set(table.columns):
+                return table
+        raise KeyError(f"Aucun agrégat du mode flux ne contient les colonnes {columns}")
+
+    def counts(self, by, dropna=True):
+        table = self._table(by)
+        return table.groupby(by, dropna=dropna)['count'].sum().reset_index()
+
+    def size(self, notna=()):
+        table = self._table(notna)
+        return int(table.loc[table[list(notna)].notna().all(axis=1), 'count'].sum())
+
+    def age_sex_counts(self):
+        return self.tables['age_sexe'].groupby(['age', 'sexe'])['count'].sum().reset_index()
+
+    def monthly_sex_counts(self):
+        return self.tables['mois'].groupby(['mois', 'Annee', 'sexe'])['count'].sum().reset_index()
+
+    def body_part_counts(self, contact, by):
+        counts = self.tables['parties_contacts']
+        counts = counts[counts['Contact'] == contact].groupby(by)['count'].sum().reset_index()
+        return order_body_part_counts(counts, by)
+
+    def lesion_stats(self):
+        return lesion_stats(self.tables['lesions'])
+
+
+@dataclass(frozen=True)
+class StreamedDataset:
+    # Export lu par blocs : seuls les agrégats sont gardés en mémoire, pas les lignes
+    name: str
+    fingerprint: str
+    source: str
+    nrows: int
+    tables: dict
+    ctars: list
+    years: list
+    nbytes: int
+
+    def select(self, ctars=None, years=None):
+        tables = {}
+        for key, table in self.tables.items():
+            mask = np.ones(len(table), dtype=bool)
+            if ctars is not None:
+                mask &= table['id_ctar'].isin(ctars).to_numpy()
+            if years is not None:
+                mask &= table['Annee'].isin(years).to_numpy()
+            tables[key] = table[mask]
+        return StreamedView(tables)
+
+
+def iter_chunks(source_file, source, chunk_rows=CHUNK_ROWS):
+    schema = schema_for(source)
+    corrections = corrections_for(source)
+    for chunk in pd.read_csv(source_file, encoding='ISO-8859-1', sep=',', chunksize=chunk_rows):
+        with stage('corrections', len(chunk)):
+            chunk, _ = apply_corrections(chunk, corrections)
+        with stage('schéma', len(chunk)):
+            chunk, _ = apply_schema(chunk, schema)
+        with stage('préparation', len(chunk)):
+            chunk = prepare(chunk, source)
+        # Mêmes lignes que le filtre CTAR/année des pages
+        chunk = chunk.take(valid_rows(chunk))
+        yield chunk
+
+
+def stream_aggregates(source_file, source, chunk_rows=CHUNK_ROWS):
+    aggregators = new_aggregators()
+    nrows = 0
+    ctars = {}
+    with stage('lecture en flux') as step:
+        for chunk in iter_chunks(source_file, source, chunk_rows):
+            nrows += len(chunk)
+            step.add_rows(len(chunk))
+            for ctar in pd.unique(chunk['id_ctar'].astype(object)):
+                ctars.setdefault(ctar, None)
+            with stage('agrégats', len(chunk)):
+                for aggregator in aggregators.values():
+                    aggregator.update(chunk)
+        tables = {key: aggregator.counts for key, aggregator in aggregators.items()}
+    return nrows, list(ctars), tables
+
+
+def load_streamed(name, source_file, fingerprint, chunk_rows=CHUNK_ROWS):
+    fingerprint = 'flux:' + fingerprint
+
+    dataset = cached_dataset(fingerprint)
+    if dataset is not None:
+        return dataset
+
+    source = detect_source(name)
+    nrows, ctars, tables = stream_aggregates(source_file, source, chunk_rows)
+    years = sorted(int(year) for year in pd.unique(tables['mois']['Annee']))
+    dataset = StreamedDataset(
+        name=name,
+        fingerprint=fingerprint,
+        source=source,
+        nrows=nrows,
+        tables=tables,
+        ctars=ctars,
+        years=years,
+        nbytes=int(sum(table.memory_usage(deep=True).sum() for table in tables.values())),
+    )
+    return keep_dataset(dataset)
+
+
+def load_streamed_upload(uploaded_file, chunk_rows=CHUNK_ROWS):
+    data = uploaded_file.getvalue()
+    return load_streamed(uploaded_file.name, io.BytesIO(data), hashlib.sha256(data).hexdigest(), chunk_rows)
+
+
+def load_streamed_path(path, chunk_rows=CHUNK_ROWS):
+    # Fichier présent sur le serveur : ni le contenu ni les lignes ne sont chargés en entier
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 ** 2), b''):
+            digest.update(block)
+    return load_streamed(os.path.basename(path), path, digest.hexdigest(), chunk_rows)
@@ -0,0 +1,74 @@
+from abc import ABC, abstractmethod
+
+import numpy as np
+import pandas as pd
+
+from ctar.preparation import AGE_LABELS
+from ctar.schema import BODY_PARTS
+
+
+def order_body_part_counts(counts, by):
+    # Même ordre que les pages : parties du corps dans l'ordre de la légende, tranches d'âge croissantes
+    if 'Age Group' in by:
+        counts['Age Group'] = pd.Categorical(counts['Age Group'], categories=AGE_LABELS, ordered=True)
+    if 'Body Part' in by:
+        counts['Body Part'] = pd.Categorical(counts['Body Part'], categories=BODY_PARTS, ordered=True)
+    counts = counts.sort_values(by, kind='stable', ignore_index=True)
+    if 'Body Part' in by:
+        counts['Body Part'] = counts['Body Part'].astype(str)
+    return counts
+
+
+def lesion_stats(lesion_counts):
+    # Effectif, moyenne, médiane et variance (ddof=1) à partir de l'histogramme de 'nb_lesion'
+    histogram = lesion_counts.groupby('nb_lesion')['count'].sum().sort_index()
+    values = histogram.index.to_numpy(dtype='float64')
+    weights = histogram.to_numpy(dtype='float64')
+    n = weights.sum()
+    if n == 0:
+        return histogram, 0, np.nan, np.nan, np.nan
+
+    mean = (values * weights).sum() / n
+    variance = (weights * (values - mean) ** 2).sum() / (n - 1) if n > 1 else np.nan
+
+    # Médiane : valeur(s) du milieu de la distribution cumulée
+    cumulative = np.cumsum(weights)
+    lower = values[np.searchsorted(cumulative, (n - 1) // 2, side='right')]
+    upper = values[np.searchsorted(cumulative, n // 2, side='right')]
+    median = (lower + upper) / 2
+
+    return histogram, int(n), mean, median, variance
+
+
+class AggregateView(ABC):
+    # Sélection (CTARs, années) dont les comptages sont calculés hors de la page :
+    # cube précalculé (ctar.cube), agrégats lus en mode flux (ctar.streaming) ou requêtes SQL (ctar.sql_engine).
+    # Les tables renvoyées ont les mêmes colonnes que le groupby pandas des pages, plus 'count'.
+
+    @abstractmethod
+    def counts(self, by, dropna=True):
+        # Équivalent de df.groupby(by, observed=True, dropna=dropna).size().reset_index(name='count')
+        # (KeyError si la vue ne garde pas toutes les colonnes de by)
+        pass
+
+    @abstractmethod
+    def size(self, notna=()):
+        # Nombre de lignes sélectionnées ayant une valeur pour chaque colonne de notna
+        pass
+
+    @abstractmethod
+    def age_sex_counts(self):
+        pass
+
+    @abstractmethod
+    def monthly_sex_counts(self):
+        pass
+
+    @abstractmethod
+    def body_part_counts(self, contact, by):
+        pass
+
+    @abstractmethod
+    def lesion_stats(self):
+        # (histogramme de 'nb_lesion', effectif, moyenne, médiane, variance)
+        pass
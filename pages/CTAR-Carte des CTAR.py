@@ -0,0 +1,72 @@
+import streamlit as st
+
+from ctar.geography import ctar_volumes, map_counts
+from ctar.maps import volume_map
+from ctar.rendering import cached_html, page_profile, profile_panel
+from ctar.schema import ctar_label
+
+# Titre page
+st.set_page_config(page_title="Carte des CTAR", page_icon="🗺️")
+st.title("Patients reçus par les CTAR.")
+
+# Mesure des temps de la page (option de la barre latérale)
+profile = page_profile("Carte des CTAR")
+
+# Hauteur (en pixels) de la carte dans la page
+MAP_HEIGHT = 620
+
+
+def plot_map(counts, years, key):
+    # Carte gardée pour chaque jeu de données et sélection d'années (ctar.rendering.cached_html)
+    def page():
+        volumes = ctar_volumes(counts, years)
+        if volumes['Latitude'].notna().sum() == 0:
+            return None
+        return volume_map(volumes)
+
+    if cached_html('carte', key, page, height=MAP_HEIGHT) is None:
+        st.info("Aucun CTAR placé sur la carte pour cette sélection.")
+
+
+# Main
+if 'datasets' in st.session_state:
+    datasets = st.session_state['datasets']
+
+    # CTAR périphériques (ou données nationales, avec le CTAR de l'IPM)
+    files = [name for name, dataset in datasets.items() if dataset.source in ('peripherique', 'national')]
+
+    if not files:
+        st.warning("Veuillez télécharger l'export des CTAR périphériques sur la page d'accueil.")
+    else:
+        dataset = datasets[st.selectbox("Sélectionnez un fichier", options=files)]
+        counts = map_counts(dataset)
+
+        years = sorted(int(year) for year in counts['Annee'].unique())
+        selected_years = st.multiselect("Sélectionnez une ou plusieurs année(s)", options=years, key='map_years')
+        selected_years = tuple(sorted(selected_years)) or None
+
+        st.info("Taille des cercles : nombre de patients ; couleur : part des morsures transdermiques. "
+                "Cliquez sur un CTAR pour la répartition par espèce.")
+        plot_map(counts, selected_years, (dataset.fingerprint, selected_years))
+
+        volumes = ctar_volumes(counts, selected_years)
+        unplaced = volumes[volumes['Latitude'].isna()]
+        if len(unplaced):
+            st.warning("CTAR sans position connue (absents de la carte) : "
+                       + ', '.join(f"{name} ({ctar_label(ctar)})" for ctar, name in zip(unplaced['id_ctar'], unplaced['CTAR'])))
+
+        with st.expander("Patients par CTAR"):
+            st.dataframe(volumes.drop(columns=['Latitude', 'Longitude']), hide_index=True,
+                         column_config={'MT': st.column_config.NumberColumn('MT', format='percent')})
+
+
+else:
+    st.error("Aucun fichier n'a été téléchargé. Veuillez retourner à la page d'accueil pour télécharger un fichier.")
+
+
+# Sidebar de la page
+with st.sidebar.container():
+    st.image("Logo-CORAMAD.jpg", use_column_width=True, width=250, caption="FSPI Rage")
+
+# Temps des étapes de la page
+profile_panel(profile)
@@ -0,0 +1,64 @@
+import streamlit as st
+
+from ctar.figures import orders_figure
+from ctar.orders import ctar_months, orders_patients
+from ctar.rendering import cached_figure, page_profile, profile_panel
+from ctar.schema import ctar_label
+
+# Titre page
+st.set_page_config(page_title="Commandes de vaccin", page_icon="💉")
+st.title("Doses de vaccin commandées et patients reçus.")
+
+# Mesure des temps de la page (option de la barre latérale)
+profile = page_profile("Commandes de vaccin")
+
+
+def plot_orders(table, ctar, key):
+    # Table (CTAR, année, mois) déjà jointe et gardée avec les commandes (ctar.orders)
+    def figure(light):
+        monthly = ctar_months(table, ctar)
+        if monthly.empty:
+            return None
+        return orders_figure(monthly, 'tous les CTARs' if ctar is None else f'CTAR {ctar_label(ctar)}')
+
+    if cached_figure('commandes', key, figure, use_container_width=True) is None:
+        st.info('Aucune commande ni aucun patient pour ce CTAR.')
+
+
+# Main
+if 'datasets' in st.session_state:
+    datasets = st.session_state['datasets']
+
+    # Commandes (export CTAR_commandes*) et patients des CTAR périphériques (ou données nationales)
+    order_files = [name for name, dataset in datasets.items() if dataset.source == 'commandes']
+    patient_files = [name for name, dataset in datasets.items() if dataset.source in ('peripherique', 'national')]
+
+    if not order_files:
+        st.warning("Veuillez télécharger l'export des commandes de vaccin (fichier CTAR_commandes...) sur la page d'accueil.")
+    elif not patient_files:
+        st.warning("Veuillez télécharger l'export des CTAR périphériques sur la page d'accueil.")
+    else:
+        orders = datasets[st.selectbox("Sélectionnez le fichier des commandes", options=order_files)]
+        patients = datasets[st.selectbox("Sélectionnez le fichier des patients", options=patient_files)]
+
+        table = orders_patients(orders, patients)
+        ctars = sorted(table.index.unique(level='id_ctar'))
+        ctar = st.selectbox(
+            "Sélectionnez un CTAR",
+            options=[None] + ctars,
+            format_func=lambda ctar: 'Tous les CTARs' if ctar is None else f'CTAR {ctar_label(ctar)}')
+
+        st.info("Faites glisser la barre sous le graphique pour choisir la période.")
+        plot_orders(table, ctar, (orders.fingerprint, patients.fingerprint, ctar))
+
+
+else:
+    st.error("Aucun fichier n'a été téléchargé. Veuillez retourner à la page d'accueil pour télécharger un fichier.")
+
+
+# Sidebar de la page
+with st.sidebar.container():
+    st.image("Logo-CORAMAD.jpg", use_column_width=True, width=250, caption="FSPI Rage")
+
+# Temps des étapes de la page
+profile_panel(profile)
@@ -0,0 +1,64 @@
+import streamlit as st
+
+from ctar.ingestion import Dataset, get_dataset_cache
+from ctar.memory import memory_report, memory_summary, optimized_dataset
+from ctar.rendering import page_profile, profile_panel
+
+# Titre page
+st.set_page_config(page_title="Mémoire des fichiers", page_icon="🧮")
+st.title("Mémoire occupée par les fichiers chargés.")
+
+# Mesure des temps de la page (option de la barre latérale)
+profile = page_profile("Mémoire des fichiers")
+
+MB = 1024 ** 2
+
+
+# Main
+if 'datasets' in st.session_state:
+    datasets = st.session_state['datasets']
+
+    cache = get_dataset_cache()
+    st.info(f"Le serveur garde {cache.total_bytes / MB:.1f} Mo de données ({len(cache)} fichier(s), toutes sessions confondues).")
+
+    # Les fichiers lus en mode flux ne gardent que leurs agrégats
+    for name, dataset in datasets.items():
+        if not isinstance(dataset, Dataset):
+            st.markdown(f"**{name}** : mode flux, {dataset.nbytes / MB:.1f} Mo d'agrégats.")
+
+    files = [name for name, dataset in datasets.items() if isinstance(dataset, Dataset)]
+    if files:
+        selected_file = st.selectbox("Sélectionnez un fichier", options=files)
+        dataset = datasets[selected_file]
+        report = memory_report(dataset)
+        total, derived, saved = memory_summary(report)
+
+        # Fichier ajouté ou données nationales : refaits par la page d'accueil à partir des fichiers d'origine
+        if dataset.built_from:
+            st.info("Ce fichier est construit sur la page d'accueil à partir d'autres fichiers (ajout d'enregistrements, "
+                    "données nationales) : optimisez les fichiers d'origine, il sera reconstruit avec leurs types.")
+
+        # Conversion sans perte : le fichier est remplacé pour la session, et rouvert optimisé par les autres
+        if st.button("Optimiser les types de ce fichier", disabled=saved == 0 or bool(dataset.built_from)):
+            dataset = datasets[selected_file] = optimized_dataset(dataset)
+            st.success(f"{selected_file} : {total / MB:.1f} Mo -> {dataset.nbytes / MB:.1f} Mo.")
+            report = memory_report(dataset)
+            total, derived, saved = memory_summary(report)
+
+        columns = st.columns(3)
+        columns[0].metric("En mémoire", f"{total / MB:.1f} Mo")
+        columns[1].metric("Colonnes dérivées", f"{derived / MB:.1f} Mo")
+        columns[2].metric("Gain possible", f"{saved / MB:.1f} Mo")
+
+        st.dataframe(report, hide_index=True)
+
+else:
+    st.error("Aucun fichier n'a été téléchargé. Veuillez retourner à la page d'accueil pour télécharger un fichier.")
+
+
+# Sidebar de la page
+with st.sidebar.container():
+    st.image("Logo-CORAMAD.jpg", use_column_width=True, width=250, caption="FSPI Rage")
+
+# Temps des étapes de la page
+profile_panel(profile)
@@ -0,0 +1,20 @@
+import os
+import sys
+
+import pytest
+
+# Pas de dossier des fichiers préparés pendant les tests : chaque jeu est relu depuis le CSV
+os.environ['CTAR_STORE_DIR'] = ''
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench.synthetic import PERIPHERIQUE_FILE, peripherique_frame  # noqa: E402
+from ctar.ingestion import load_bytes  # noqa: E402
+
+# Patients de l'export périphérique synthétique des tests
+N_PATIENTS = 5000
+
+
+@pytest.fixture(scope='session')
+def peripherique():
+    data = peripherique_frame(N_PATIENTS).to_csv(index=False).encode('ISO-8859-1')
+    return load_bytes(PERIPHERIQUE_FILE, data)
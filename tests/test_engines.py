@@ -0,0 +1,93 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from ctar import analytics
+from ctar.cube import count_table, get_count_cube
+from ctar.filters import SqlSelector, get_filter_index
+from ctar.sql_engine import duckdb_available, get_sql_engine
+
+# Sélections qui ne commencent pas par les premiers CTARs ou les premières années du cube
+SELECTIONS = [
+    (None, [2024]),
+    ([23.0], None),
+    ([5.0, 23.0], [2017, 2024]),
+    ([31.0], [2016, 2019, 2023]),
+]
+
+
+def normalized(table):
+    # Table comparable d'un moteur à l'autre : clés numériques en flottants, autres en texte, lignes triées
+    # (le comptage est la dernière colonne : 'count', 'LPS Count'...)
+    table = table.copy()
+    keys, count = list(table.columns[:-1]), table.columns[-1]
+    for column in keys:
+        numeric = pd.to_numeric(table[column], errors='coerce')
+        if numeric.notna().sum() == table[column].notna().sum():
+            table[column] = numeric.astype('float64')
+        else:
+            table[column] = table[column].astype(object).where(table[column].notna()).astype(str)
+    table[count] = table[count].astype('int64')
+    return table.sort_values(keys, ignore_index=True)
+
+
+def engines(dataset):
+    selectors = {'pandas': get_filter_index(dataset), 'cube': get_count_cube(dataset)}
+    if duckdb_available():
+        selectors['duckdb'] = SqlSelector(get_sql_engine(dataset))
+    return selectors
+
+
+def results(view, dataset):
+    hourly, n_hourly = analytics.hourly_counts(view, 'sexe')
+    weekday, n_weekday = analytics.hour_weekday_counts(view)
+    savon, n_savon = analytics.savon_counts(view)
+    value_counts, n_lesions, mean, median, variance = analytics.lesion_stats(view)
+    return {
+        'age_sexe': analytics.age_sex_counts(view)[0],
+        'mois': analytics.monthly_sex_counts(view),
+        'heure': hourly,
+        'heure_jour': weekday,
+        'savon': savon,
+        'lps': analytics.lps_counts(view, dataset),
+        'mt': analytics.mt_counts(view, dataset),
+        'effectifs': (n_hourly, n_weekday, n_savon, n_lesions),
+        'lesions': (mean, median, variance),
+    }
+
+
+@pytest.mark.parametrize('ctars, years', SELECTIONS)
+def test_engines_agree(peripherique, ctars, years):
+    expected = None
+    for engine, selector in engines(peripherique).items():
+        found = results(selector.select(ctars, years), peripherique)
+        if expected is None:
+            expected = found
+            continue
+        for key, value in found.items():
+            if isinstance(value, pd.DataFrame):
+                pd.testing.assert_frame_equal(normalized(value), normalized(expected[key]), obj=f'{engine} {key}')
+            else:
+                np.testing.assert_allclose(np.asarray(value, dtype='float64'), np.asarray(expected[key], dtype='float64'),
+                                           err_msg=f'{engine} {key}')
+
+
+@pytest.mark.parametrize('ctars, years', SELECTIONS)
+def test_cube_keys_are_selected(peripherique, ctars, years):
+    view = get_count_cube(peripherique).select(ctars, years)
+    monthly = view.monthly_sex_counts()
+    weekday, _ = analytics.hour_weekday_counts(view)
+    if years is not None:
+        assert set(monthly['Annee'].astype(int)) == set(years)
+    if ctars is not None:
+        assert set(weekday['id_ctar']) == set(ctars)
+
+
+@pytest.mark.parametrize('ctars, years', SELECTIONS)
+def test_hour_weekday_counts(peripherique, ctars, years):
+    rows = get_filter_index(peripherique).select(ctars, years)
+    expected = count_table(rows, ['id_ctar', 'Weekday', 'Hour'])
+    for selector in engines(peripherique).values():
+        counts, n_patients = analytics.hour_weekday_counts(selector.select(ctars, years))
+        pd.testing.assert_frame_equal(normalized(counts), normalized(expected))
+        assert n_patients == rows['Hour'].notna().sum()
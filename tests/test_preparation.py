@@ -0,0 +1,62 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from ctar.preparation import parse_dates, parse_hours
+
+
+@pytest.mark.parametrize('value, date_format, date', [
+    ('2021-10-11', '%Y-%m-%d', '2021-10-11'),
+    ('2021-10-11 00:00:00', '%Y-%m-%d', '2021-10-11'),
+    ('2021-10-11T08:30', '%Y-%m-%d', '2021-10-11'),
+    ('11/10/2021', '%d/%m/%Y', '2021-10-11'),
+    ('11/10/2021 00:00', '%d/%m/%Y', '2021-10-11'),
+    ('11/10/2021', '%Y-%m-%d', None),
+    ('2021-10-11', '%d/%m/%Y', None),
+    ('2021-10-11xyz', '%Y-%m-%d', None),
+    ('2021-10-11 bis', '%Y-%m-%d', None),
+    ('2021-02-30', '%Y-%m-%d', None),
+    ('', '%Y-%m-%d', None),
+    (None, '%Y-%m-%d', None),
+])
+def test_parse_dates(value, date_format, date):
+    parsed = parse_dates(pd.Series([value], dtype=object), date_format)
+    if date is None:
+        assert parsed.isna().all()
+    else:
+        assert parsed.iloc[0] == pd.Timestamp(date)
+
+
+@pytest.mark.parametrize('value, hour', [
+    ('0:05', 0),
+    ('00:05', 0),
+    ('7:30', 7),
+    ('07:30', 7),
+    ('23:59', 23),
+    (' 8:15', 8),
+    ('09:45:00', 9),
+    ('00:00', None),
+    ('0:00', None),
+    ('24:00', None),
+    ('25:10', None),
+    (None, None),
+    (np.nan, None),
+    ('', None),
+    ('abc', None),
+    ('7h30', None),
+    ('12:5', None),
+])
+def test_parse_hours(value, hour):
+    parsed = parse_hours(pd.Series([value], dtype=object))
+    assert str(parsed.dtype) == 'Int8'
+    if hour is None:
+        assert parsed.isna().all()
+    else:
+        assert parsed.iloc[0] == hour
+
+
+def test_parse_hours_keeps_index():
+    series = pd.Series(['10:00', None, '3:20'], index=[5, 7, 9], name='heure_du_contact_cleaned')
+    parsed = parse_hours(series)
+    assert parsed.index.tolist() == [5, 7, 9]
+    assert parsed.tolist() == [10, pd.NA, 3]
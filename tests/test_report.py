@@ -0,0 +1,19 @@
+import pytest
+
+from bench.synthetic import COMMANDES_FILE, PERIPHERIQUE_FILE, commandes_frame, peripherique_frame, write_csv
+from ctar.report import load_exports
+
+
+def test_load_exports(tmp_path):
+    path = tmp_path / PERIPHERIQUE_FILE
+    write_csv(peripherique_frame(200), path)
+    datasets = load_exports([str(path)])
+    assert [dataset.source for dataset in datasets.values()] == ['peripherique']
+
+
+@pytest.mark.parametrize('file_name', [COMMANDES_FILE, 'export.csv'])
+def test_load_exports_rejects_other_files(tmp_path, file_name):
+    path = tmp_path / file_name
+    write_csv(commandes_frame(200), path)
+    with pytest.raises(SystemExit, match='Fichier non pris en charge'):
+        load_exports([str(path)])